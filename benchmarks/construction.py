@@ -0,0 +1,427 @@
+"""Offline construction benchmarks for the leviathan programs.
+
+Runs the root program with catalogs of 1, 10, 100 and 500 environments and the
+networking program against Pulumi mocks, so no AWS access is needed. Every case
+runs in its own interpreter and reports wall time, peak memory, the number of
+registered resources and the number of provider invokes, plus the size of the
+stack outputs and the time a consuming stack needs to decode them. The `ipam:N`
+case allocates address space for N environments without constructing anything,
+the `policy:N` case renders the policy documents of N environments.
+
+    python benchmarks/construction.py --output bench.json
+    python benchmarks/construction.py --compare before.json --output after.json
+
+`--repo` points the cases at another checkout, e.g. a `git worktree` of an older
+revision, to measure it with the current benchmark. `--graph-dir` also writes
+the registered resource graph of every case in the layout of `pulumi stack
+export`, for `python -m leviathan.critical_path` and `python -m leviathan.guard`.
+"""
+
+import argparse
+import collections
+import json
+import os
+import platform
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.environ.get(
+    "LEVIATHAN_REPO", os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+ENVIRONMENTS = os.path.join(REPO, "environments")
+METRICS = (
+    "wall_time_s",
+    "peak_rss_mb",
+    "resources",
+    "invokes",
+    "export_bytes",
+    "export_load_s",
+)
+CASES = [
+    "root:1",
+    "root:10",
+    "root:100",
+    "root:500",
+    "networking",
+    "ipam:5000",
+    "policy:5000",
+]
+
+AVAILABILITY_ZONES = ["eu-central-1a", "eu-central-1b", "eu-central-1c"]
+# Current and pre schema_version layouts side by side, so `--repo` also works
+# with older revisions
+ROOT_OUTPUTS = {
+    "organization": {
+        "id": "o-mock",
+        "arn": "arn:aws:organizations::000000000000:organization/o-mock",
+    },
+    "networking_account": {
+        "schema_version": 1,
+        "id": "111111111111",
+        "role_name": "OrganizationAccountAccessRole",
+        "account": {"id": "111111111111", "role_name": "OrganizationAccountAccessRole"},
+    },
+}
+NETWORKING_OUTPUTS = {
+    "routing": {
+        "schema_version": 1,
+        "transit_gateway_id": "tgw-mock",
+        "transit_gateway": {"id": "tgw-mock"},
+    },
+    "vpc_info": {"schema_version": 1, "cidr_block": "10.100.0.0/16"},
+}
+
+
+def result(case: str, wall_time: float, **metrics) -> dict:
+    return {
+        "case": case,
+        "wall_time_s": round(wall_time, 4),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "resources": metrics.get("resources", 0),
+        "invokes": metrics.get("invokes", 0),
+        "export_bytes": metrics.get("export_bytes", 0),
+        "export_load_s": metrics.get("export_load_s", 0.0),
+        "by_type": metrics.get("by_type", {}),
+    }
+
+
+def run_ipam_case(case: str) -> dict:
+    sys.path.insert(0, REPO)
+    from leviathan.ipam import Ipam
+
+    ipam = Ipam(
+        path=os.path.join(
+            tempfile.mkdtemp(prefix="leviathan-bench-"), "allocations.json"
+        )
+    )
+    started = time.perf_counter()
+    for i in range(int(case.partition(":")[2])):
+        ipam.subnet_cidrs(
+            ipam.vpc_cidr(f"env{i}", prefixlen=22), "private", AVAILABILITY_ZONES
+        )
+    return result(case, time.perf_counter() - started)
+
+
+def run_policy_case(case: str) -> dict:
+    sys.path.insert(0, REPO)
+    from leviathan import policy
+
+    started = time.perf_counter()
+    for i in range(int(case.partition(":")[2])):
+        # Shared by every environment, rendered once
+        policy.document(
+            policy.allow(
+                ["sts:AssumeRole"], principals=[policy.service("ec2.amazonaws.com")]
+            ),
+            kind="trust",
+        )
+        # Different for every environment
+        bucket = f"arn:aws:s3:::env{i}-data"
+        policy.document(
+            policy.allow(
+                ["s3:GetObject", "s3:PutObject", "s3:DeleteObject"],
+                resources=[f"{bucket}/*"],
+                sid="Objects",
+            ),
+            policy.allow(["s3:ListBucket"], resources=[bucket], sid="Bucket"),
+            policy.deny(
+                ["s3:*"],
+                resources=[bucket, f"{bucket}/*"],
+                conditions=[policy.condition("Bool", "aws:SecureTransport", "false")],
+                sid="TlsOnly",
+            ),
+            kind="bucket",
+        )
+    return result(
+        case,
+        time.perf_counter() - started,
+        by_type={f"policy:{k}": v for k, v in policy.default().stats().items()},
+    )
+
+
+def mock_runtime(counts: collections.Counter, registered: list):
+    """Pulumi mocks that count resources and invokes, and a monitor that records
+    every registration in `registered`."""
+    # Imported here so that the driver process does not need the Pulumi SDK
+    import pulumi
+    from google.protobuf import json_format
+    from pulumi.runtime.mocks import MockMonitor
+    from pulumi.runtime.proto import resource_pb2
+
+    class Mocks(pulumi.runtime.Mocks):
+        def new_resource(self, args: pulumi.runtime.MockResourceArgs):
+            counts["resources"] += 1
+            counts[f"resource:{args.typ}"] += 1
+            outputs = dict(args.inputs)
+            if args.typ == "pulumi:pulumi:StackReference":
+                outputs = {
+                    "outputs": (
+                        ROOT_OUTPUTS
+                        if args.name.endswith("/root")
+                        else NETWORKING_OUTPUTS
+                    )
+                }
+            return [f"{args.name}-id", outputs]
+
+        def call(self, args: pulumi.runtime.MockCallArgs):
+            counts["invokes"] += 1
+            counts[f"invoke:{args.token}"] += 1
+            if args.token == "aws:index/getAvailabilityZones:getAvailabilityZones":
+                return {"names": AVAILABILITY_ZONES}
+            if args.token == "aws:iam/getPolicyDocument:getPolicyDocument":
+                return {"json": "{}"}
+            if args.token == "aws:organizations/getOrganization:getOrganization":
+                return ROOT_OUTPUTS["organization"]
+            return {}
+
+    class Monitor(MockMonitor):
+        # Components pass resources as inputs; the mock monitor would rehydrate those
+        # references on its worker threads, so ask for plain ids instead
+        def GetDeploymentInfo(self, request):
+            info = super().GetDeploymentInfo(request)
+            return resource_pb2.DeploymentInfo(
+                supportedFeatures=[
+                    f
+                    for f in info.supportedFeatures
+                    if f != resource_pb2.RESOURCE_MONITOR_FEATURE_RESOURCE_REFERENCES
+                ]
+            )
+
+        def RegisterResource(self, request):
+            response = super().RegisterResource(request)
+            registered.append(
+                {
+                    "urn": response.urn,
+                    "type": request.type,
+                    "custom": request.custom,
+                    "inputs": json_format.MessageToDict(request.object),
+                    "parent": request.parent or None,
+                    "provider": request.provider or None,
+                    "dependencies": list(request.dependencies),
+                    "propertyDependencies": {
+                        k: list(v.urns) for k, v in request.propertyDependencies.items()
+                    },
+                }
+            )
+            return response
+
+    mocks = Mocks()
+    return mocks, Monitor(mocks)
+
+
+def program_config(workdir: str, size: str) -> dict:
+    allocations = os.path.join(workdir, "allocations.json")
+    shutil.copy(
+        os.path.join(REPO, "leviathan", "configuration", "allocations.json"),
+        allocations,
+    )
+
+    config = {
+        "leviathan:org": "bench",
+        "aws:region": "eu-central-1",
+        "leviathan:invoke_cache": "false",
+        "leviathan:ipam_allocations": allocations,
+    }
+    if size:
+        config["leviathan:environments"] = json.dumps(
+            [{"name": f"env{i}"} for i in range(int(size))]
+        )
+    return config
+
+
+def construct(program_dir: str) -> str:
+    """Runs the program and returns its stack outputs as JSON."""
+    import pulumi
+    from pulumi.runtime.stack import massage
+
+    stack_outputs = []
+
+    @pulumi.runtime.test
+    def run():
+        runpy.run_path(os.path.join(program_dir, "__main__.py"), run_name="__main__")
+        # Stack outputs as the engine would store them in the checkpoint, values the
+        # mocks leave unknown during preview count as null
+        outputs = massage(pulumi.runtime.get_root_resource().outputs, [])
+
+        async def collect():
+            value = await pulumi.Output.from_input(outputs).future(with_unknowns=True)
+            stack_outputs.append(json.dumps(value, default=lambda _: None))
+
+        return collect()
+
+    run()
+    return stack_outputs[0] if stack_outputs else "{}"
+
+
+def write_graph(graph_dir: str, case: str, registered: list) -> None:
+    os.makedirs(graph_dir, exist_ok=True)
+    with open(os.path.join(graph_dir, f"{case.replace(':', '-')}.json"), "w") as f:
+        json.dump({"deployment": {"resources": registered}}, f, indent=1)
+
+
+def run_program_case(case: str, graph_dir: str = None) -> dict:
+    import pulumi
+
+    counts = collections.Counter()
+    registered = []
+
+    program, _, size = case.partition(":")
+    workdir = tempfile.mkdtemp(prefix="leviathan-bench-")
+
+    mocks, monitor = mock_runtime(counts, registered)
+    pulumi.runtime.set_mocks(
+        mocks, monitor=monitor, project="leviathan", stack=program, preview=True
+    )
+    pulumi.runtime.set_all_config(program_config(workdir, size))
+
+    program_dir = os.path.join(ENVIRONMENTS, program)
+    sys.path[:0] = [REPO, program_dir]
+    os.chdir(workdir)
+
+    started = time.perf_counter()
+    export = construct(program_dir)
+    wall_time = time.perf_counter() - started
+
+    # What every StackReference to this stack has to transfer and decode
+    started = time.perf_counter()
+    for _ in range(10):
+        json.loads(export)
+    export_load = (time.perf_counter() - started) / 10
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    if graph_dir:
+        write_graph(graph_dir, case, registered)
+
+    return result(
+        case,
+        wall_time,
+        resources=counts["resources"],
+        invokes=counts["invokes"],
+        export_bytes=len(export.encode()),
+        export_load_s=round(export_load, 6),
+        by_type={k: v for k, v in sorted(counts.items()) if ":" in k},
+    )
+
+
+def run_case(case: str, graph_dir: str = None) -> dict:
+    if case.startswith("ipam:"):
+        return run_ipam_case(case)
+    if case.startswith("policy:"):
+        return run_policy_case(case)
+    return run_program_case(case, graph_dir)
+
+
+def run_isolated(case: str, graph_dir: str = None) -> dict:
+    # A fresh interpreter per case keeps the runtime state and peak RSS independent
+    command = [sys.executable, os.path.abspath(__file__), "--case", case]
+    if graph_dir:
+        command += ["--graph-dir", graph_dir]
+    result = subprocess.run(
+        command,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return {"case": case, "error": result.stderr.strip().splitlines()[-1:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.environ.get("LEVIATHAN_REPO", REPO),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(previous: dict, current: dict) -> None:
+    before = {r["case"]: r for r in previous["results"]}
+    print(
+        f"{'case':<12} {'metric':<12} {previous['revision']:>12} {current['revision']:>12} {'change':>8}"
+    )
+    for result in current["results"]:
+        old = before.get(result["case"])
+        if old is None or "error" in result or "error" in old:
+            continue
+        for metric in METRICS:
+            if metric not in old:
+                continue
+            change = (
+                (result[metric] - old[metric]) / old[metric] * 100
+                if old[metric]
+                else 0.0
+            )
+            print(
+                f"{result['case']:<12} {metric:<12} {old[metric]:>12} {result[metric]:>12} {change:>+7.1f}%"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--case", help="run a single case in this process and print its result"
+    )
+    parser.add_argument(
+        "--cases",
+        nargs="+",
+        default=CASES,
+        help="cases to run, e.g. root:10 networking",
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument("--repo", help="checkout to benchmark instead of this one")
+    parser.add_argument(
+        "--graph-dir", help="write the resource graph of every case to this directory"
+    )
+    args = parser.parse_args()
+
+    if args.repo:
+        os.environ["LEVIATHAN_REPO"] = os.path.abspath(args.repo)
+    if args.graph_dir:
+        # The cases change into a scratch directory
+        args.graph_dir = os.path.abspath(args.graph_dir)
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.graph_dir)))
+        return
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": [],
+    }
+    for case in args.cases:
+        result = run_isolated(case, args.graph_dir)
+        report["results"].append(result)
+        if "error" in result:
+            print(f"{case:<12} failed: {result['error']}", file=sys.stderr)
+        else:
+            print(
+                f"{case:<12} {result['wall_time_s']:>8.2f}s {result['peak_rss_mb']:>8.1f}MB "
+                f"{result['resources']:>6} resources {result['invokes']:>5} invokes "
+                f"{result['export_bytes']:>9} export bytes"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
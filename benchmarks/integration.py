@@ -0,0 +1,362 @@
+"""Deploy latency of the leviathan stacks against a local AWS emulator.
+
+Deploys the root and networking stacks, with a catalog of `--environments`
+environments, to a local AWS emulator (e.g. `moto_server -p 5000`) with a file
+state backend, through leviathan.orchestrator. Every cycle goes through three
+phases on a fresh state:
+
+    up       creates everything: root without environments (its bootstrap
+             pass, see leviathan.orchestrator), networking, then root
+    grow     adds an environment to root, networking runs first and picks
+             it up on its next update
+    destroy  deletes everything
+
+The time between the engine's pre and outputs events of every resource step is
+recorded, and the report lists the wall time of every stack, the totals per
+resource type and the slowest resources. With `--runs N` every figure is the
+median of N cycles. Emulators answer in milliseconds what AWS takes minutes to
+do, so the absolute figures are not those of production, but a program change
+that adds resources, waits or replacements shows up with `--compare`.
+
+    python benchmarks/integration.py --endpoint http://localhost:5000 --output deploy.json
+    python benchmarks/integration.py --compare deploy.json --runs 3
+
+Needs the `pulumi` CLI, the Automation API and an emulator that implements
+Organizations, EC2, Transit Gateway, RAM, Route 53, IAM and S3.
+"""
+
+import argparse
+import collections
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+import yaml
+
+REPO = os.environ.get(
+    "LEVIATHAN_REPO", os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+sys.path.insert(0, REPO)
+
+from construction import git_revision  # noqa: E402
+from leviathan import orchestrator, providers  # noqa: E402
+
+PHASES = ("up", "grow", "destroy")
+PHASE_OPERATIONS = {"up": "up", "grow": "up", "destroy": "destroy"}
+# Steps that change something, `same` and `read` steps are not recorded
+RECORDED_OPS = {
+    "create",
+    "update",
+    "delete",
+    "replace",
+    "create-replacement",
+    "delete-replaced",
+}
+# The file backend only knows this organization
+ORG = "organization"
+
+
+class StepRecorder:
+    """Duration of every resource step, from the engine events of the stacks."""
+
+    def __init__(self) -> None:
+        self.steps: List[Dict[str, Any]] = []
+        self._started: Dict[Tuple[str, str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stack: orchestrator.StackSpec, event: Any) -> None:
+        now = time.perf_counter()
+        pre = event.resource_pre_event
+        done = event.res_outputs_event or event.res_op_failed_event
+        step = (pre or done).metadata if (pre or done) else None
+        if step is None or step.op.value not in RECORDED_OPS or not step.provider:
+            return
+
+        key = (stack.name, step.urn, step.op.value)
+        with self._lock:
+            if pre is not None:
+                self._started[key] = now
+                return
+            started = self._started.pop(key, None)
+            if started is None:
+                return
+            self.steps.append(
+                {
+                    "stack": stack.name,
+                    "urn": step.urn,
+                    "type": step.type,
+                    "op": step.op.value,
+                    "seconds": now - started,
+                    "failed": event.res_op_failed_event is not None,
+                }
+            )
+
+
+def prepare(workdir: str, endpoint: str, environments: int) -> str:
+    """Copy of the programs whose stacks point at the emulator."""
+    environments_dir = os.path.join(workdir, "environments")
+    shutil.copytree(
+        os.path.join(REPO, "environments"),
+        environments_dir,
+        ignore=shutil.ignore_patterns("__pycache__", ".leviathan"),
+    )
+    allocations = os.path.join(workdir, "allocations.json")
+    shutil.copy(
+        os.path.join(REPO, "leviathan", "configuration", "allocations.json"),
+        allocations,
+    )
+
+    for program in os.listdir(environments_dir):
+        program_dir = os.path.join(environments_dir, program)
+        project_file = os.path.join(program_dir, "Pulumi.yaml")
+        if not os.path.exists(project_file):
+            continue
+        with open(project_file) as f:
+            project = yaml.safe_load(f)
+        # The programs run with the interpreter of the harness
+        runtime = project.get("runtime")
+        if isinstance(runtime, dict):
+            runtime.get("options", {}).pop("virtualenv", None)
+            if sys.prefix != sys.base_prefix:
+                runtime.setdefault("options", {})["virtualenv"] = sys.prefix
+        with open(project_file, "w") as f:
+            yaml.safe_dump(project, f)
+
+        for name in os.listdir(program_dir):
+            if name.startswith("Pulumi.") and name != "Pulumi.yaml":
+                _configure(
+                    os.path.join(program_dir, name),
+                    {
+                        "leviathan:org": ORG,
+                        "leviathan:aws_endpoint": endpoint,
+                        "leviathan:invoke_cache": False,
+                        "leviathan:ipam_allocations": allocations,
+                        **providers.emulator_config(endpoint),
+                    },
+                )
+
+    set_environments(environments_dir, environments)
+    return environments_dir
+
+
+def set_environments(environments_dir: str, count: int) -> None:
+    # Environments read the Transit Gateway of networking, which reads root:
+    # on the fresh state root goes up without them first
+    _configure(
+        os.path.join(environments_dir, "root", "Pulumi.root.yaml"),
+        {
+            "leviathan:environments": [{"name": f"env{i}"} for i in range(count)],
+            "leviathan:bootstrap": {"environments": []},
+        },
+    )
+
+
+def _configure(stack_file: str, values: Dict[str, Any]) -> None:
+    with open(stack_file) as f:
+        stack = yaml.safe_load(f) or {}
+    config = stack.setdefault("config", {})
+    for key in values:
+        # Keys of the project namespace may be written without it
+        config.pop(key.partition(":")[2], None)
+    config.update(values)
+    with open(stack_file, "w") as f:
+        yaml.safe_dump(stack, f)
+
+
+def run_cycle(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="leviathan-integration-")
+    state = os.path.join(workdir, "state")
+    os.makedirs(state)
+    environments_dir = prepare(workdir, args.endpoint, args.environments)
+
+    recorder = StepRecorder()
+    runner = orchestrator.AutomationRunner(
+        backend_url=f"file://{state}",
+        env={
+            "PULUMI_CONFIG_PASSPHRASE": "",
+            "PYTHONPATH": os.pathsep.join(
+                filter(None, [REPO, os.environ.get("PYTHONPATH")])
+            ),
+            "AWS_ACCESS_KEY_ID": "test",
+            "AWS_SECRET_ACCESS_KEY": "test",
+        },
+        on_event=recorder,
+    )
+
+    phases = {}
+    for phase in PHASES:
+        if phase == "grow":
+            set_environments(environments_dir, args.environments + 1)
+        stacks = orchestrator.discover(environments_dir)
+        recorded = len(recorder.steps)
+        results = orchestrator.Orchestrator(
+            stacks, runner=runner, workers=args.workers, output=sys.stderr
+        ).run(PHASE_OPERATIONS[phase])
+        phases[phase] = {
+            "stacks": {
+                r.stack: {"status": r.status, "seconds": round(r.duration, 3)}
+                for r in results.values()
+            },
+            "steps": recorder.steps[recorded:],
+        }
+
+    if args.keep:
+        print(f"state and programs kept in {workdir}", file=sys.stderr)
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return phases
+
+
+def summarize(cycles: List[Dict[str, Any]], slowest: int) -> Dict[str, Any]:
+    """Medians over the cycles, per stack, per resource type and per resource."""
+    summary = {}
+    for phase in PHASES:
+        stacks = collections.defaultdict(list)
+        status = {}
+        durations = collections.defaultdict(list)
+        failed = set()
+        for cycle in cycles:
+            for stack, result in cycle[phase]["stacks"].items():
+                stacks[stack].append(result["seconds"])
+                if result["status"] != "succeeded":
+                    status[stack] = result["status"]
+            for step in cycle[phase]["steps"]:
+                key = (step["stack"], step["urn"], step["type"], step["op"])
+                durations[key].append(step["seconds"])
+                if step["failed"]:
+                    failed.add(key)
+
+        resources = [
+            {
+                "stack": stack,
+                "urn": urn,
+                "type": typ,
+                "op": op,
+                "seconds": round(statistics.median(values), 3),
+                "failed": (stack, urn, typ, op) in failed,
+            }
+            for (stack, urn, typ, op), values in durations.items()
+        ]
+        by_type: Dict[str, Dict[str, float]] = {}
+        for r in resources:
+            totals = by_type.setdefault(
+                r["type"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            totals["count"] += 1
+            totals["seconds"] = round(totals["seconds"] + r["seconds"], 3)
+            totals["max_seconds"] = max(totals["max_seconds"], r["seconds"])
+
+        summary[phase] = {
+            "stacks": {
+                stack: {
+                    "status": status.get(stack, "succeeded"),
+                    "seconds": round(statistics.median(values), 3),
+                }
+                for stack, values in sorted(stacks.items())
+            },
+            "by_type": dict(
+                sorted(
+                    by_type.items(), key=lambda item: item[1]["seconds"], reverse=True
+                )
+            ),
+            "slowest": sorted(resources, key=lambda r: r["seconds"], reverse=True)[
+                :slowest
+            ],
+            "failed": [r for r in resources if r["failed"]],
+        }
+    return summary
+
+
+def print_summary(summary: Dict[str, Any], types: int) -> None:
+    for phase, result in summary.items():
+        total = sum(s["seconds"] for s in result["stacks"].values())
+        print(f"{phase}: {total:.1f}s")
+        for stack, s in result["stacks"].items():
+            print(f"  {stack:<16} {s['status']:<10} {s['seconds']:>8.1f}s")
+        for typ, totals in list(result["by_type"].items())[:types]:
+            print(
+                f"  {totals['seconds']:>8.2f}s {totals['count']:>5} x "
+                f"max {totals['max_seconds']:>6.2f}s  {typ}"
+            )
+        for r in result["slowest"]:
+            name = r["urn"].split("::")[-1]
+            print(f"  {r['seconds']:>8.2f}s  {r['op']:<8} {name} ({r['type']})")
+        for r in result["failed"]:
+            print(f"  failed  {r['op']:<8} {r['urn']}")
+
+
+def compare(previous: dict, current: dict) -> None:
+    print(
+        f"{'phase':<8} {'type':<56} {previous['revision']:>10} {current['revision']:>10} {'change':>8}"
+    )
+    for phase, result in current["phases"].items():
+        before = previous["phases"].get(phase, {}).get("by_type", {})
+        for typ, totals in result["by_type"].items():
+            if typ not in before:
+                print(
+                    f"{phase:<8} {typ:<56} {'-':>10} {totals['seconds']:>10} {'new':>8}"
+                )
+                continue
+            old = before[typ]["seconds"]
+            change = (totals["seconds"] - old) / old * 100 if old else 0.0
+            print(
+                f"{phase:<8} {typ:<56} {old:>10} {totals['seconds']:>10} {change:>+7.1f}%"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--endpoint", default="http://localhost:5000", help="AWS emulator URL"
+    )
+    parser.add_argument(
+        "--environments", type=int, default=1, help="environments in the catalog"
+    )
+    parser.add_argument(
+        "--runs", type=int, default=1, help="cycles to take the median of"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="stacks run at the same time"
+    )
+    parser.add_argument("--slowest", type=int, default=10, help="resources to list")
+    parser.add_argument("--types", type=int, default=10, help="resource types to list")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the state and programs of every cycle"
+    )
+    args = parser.parse_args()
+
+    cycles = [run_cycle(args) for _ in range(args.runs)]
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "endpoint": args.endpoint,
+        "environments": args.environments,
+        "runs": args.runs,
+        "phases": summarize(cycles, args.slowest),
+    }
+    print_summary(report["phases"], args.types)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+    if any(
+        s["status"] != "succeeded"
+        for phase in report["phases"].values()
+        for s in phase["stacks"].values()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,147 @@
 import pulumi
-from pulumi import ResourceOptions, Config
+from pulumi import ResourceOptions
 import pulumi_aws as aws
-from pulumi_aws import ProviderAssumeRoleArgs
 from leviathan.vpc import Vpc
-from leviathan.configuration import cidrs
+from leviathan.ecr_cache import EcrPullThroughCache
+from leviathan.endpoints import SharedEndpoints, is_shared
+from leviathan.flow_logs import FlowLogArchive
+from leviathan import (
+    consts,
+    invoke_cache,
+    ipam,
+    providers,
+    regions,
+    stack_refs,
+    tracing,
+)
+from peering import TransitGatewayPeering
 from routing import Routing
 
-config = pulumi.Config()
 stack = pulumi.get_stack()
-org = config.require("org")
 
-# TODO: implement json serializer for each CustomResourceComponent
-# in order to export crucial properties only and allow to
-# easily deserialize entire stack reference into object
-stack_root_ref = pulumi.StackReference(f"{org}/leviathan/root")
+root = stack_refs.root()
 
-config = Config("aws")
-region = config.require("region")
-role_to_assume = stack_root_ref.get_output("networking_account").apply(
-    lambda v: f"arn:aws:iam::{v['account']['id']}:role/{v['account']['role_name']}"
-)
+role_to_assume = root.networking_role_arn
+primary_region = regions.primary()
+
+
+def regional_provider(region: str) -> aws.Provider:
+    return providers.assume_role_provider(
+        f"networking_aws_provider{regions.suffix(region)}", role_to_assume, region
+    )
 
-provider = aws.Provider(
-    "networking_aws_provider",
-    assume_role=ProviderAssumeRoleArgs(
-        role_arn=role_to_assume, session_name="leviathan"
-    ),
-    region=region,
-)
 
 # All child resources will use the provider
-child_opts = ResourceOptions(providers={"aws": provider})
+child_opts = ResourceOptions(providers={"aws": regional_provider(primary_region)})
+
+# Central flow log archive for every VPC of the organization (`flow_logs: central`)
+flow_log_destination = None
+if pulumi.Config().get("flow_logs") == "central":
+    flow_log_archive = FlowLogArchive(
+        "networking",
+        organization_id=root.organization_id,
+        regions=regions.configured(),
+        opts=child_opts,
+    )
+    flow_log_destination = flow_log_archive.bucket.arn
+
+    pulumi.export("flow_logs", flow_log_archive.to_export())
+
+# An egress hub per region (`regions`), environments send their egress to the
+# hub in their own region. Hubs only depend on each other through the peering,
+# so the regions deploy side by side.
+hubs = {}
+hub_cidrs = {}
+regional_exports = {}
+for region in regions.configured():
+    suffix = regions.suffix(region)
+    region_opts = (
+        child_opts
+        if region == primary_region
+        else ResourceOptions(providers={"aws": regional_provider(region)})
+    )
+
+    vpc = Vpc(
+        f"main{suffix}",
+        ipam.default().vpc_cidr(f"networking{suffix}"),
+        region_opts,
+        is_public=True,
+        flow_log_destination=flow_log_destination,
+        # Needed by environments with the dual_stack feature for NAT64
+        dual_stack=pulumi.Config().get_bool("dual_stack") or False,
+        region=region,
+    )
+    routing = Routing(vpc=vpc, opts=region_opts, region=region)
+    hubs[region] = routing
+    hub_cidrs[region] = vpc.cidr_block
+
+    # Compact exports only, see leviathan.exports for the schema
+    hub_exports = {"vpc_info": vpc.to_export(), "routing": routing.to_export()}
+
+    # Interface endpoints shared by every environment (`endpoints_mode: central`)
+    if pulumi.Config().get("endpoints_mode") == "central":
+        shared_endpoints = SharedEndpoints(
+            f"networking{suffix}",
+            vpc=vpc,
+            services=[e for e in consts.DefaultEndpoints if is_shared(e)],
+            organization_arn=root.organization_arn,
+            region=region,
+            ipv6_prefix_list_id=(
+                routing.environment_ipv6_prefix_list.id if vpc.dual_stack else None
+            ),
+            opts=region_opts,
+        )
+        hub_exports["shared_endpoints"] = shared_endpoints.to_export()
+
+    # Cache of public container registries (`ecr_pull_through_cache`), the
+    # primary region replicates what it cached to the other ones
+    if pulumi.Config().get_bool("ecr_pull_through_cache"):
+        ecr_cache = EcrPullThroughCache(
+            f"networking{suffix}",
+            registry_id=root.networking_account_id,
+            organization_id=root.organization_id,
+            region=region,
+            upstreams=pulumi.Config().get_object("ecr_upstreams"),
+            repositories=pulumi.Config().get_object("ecr_cached_repositories") or [],
+            replica_regions=(regions.configured() if region == primary_region else []),
+            opts=region_opts,
+        )
+        hub_exports["ecr_cache"] = ecr_cache.to_export()
+
+    if region == primary_region:
+        for key, value in hub_exports.items():
+            pulumi.export(key, value)
+    else:
+        regional_exports[region] = hub_exports
+
+if regional_exports:
+    pulumi.export("regions", regional_exports)
+
+
+def region_cidrs(region: str) -> pulumi.Output:
+    # The hub VPC and every environment VPC of the region
+    return root.environments.apply(
+        lambda envs: [hub_cidrs[region]]
+        + [
+            vpc.cidr_block
+            for vpc in (env.vpc_in(region, primary_region) for env in envs.values())
+            if vpc is not None
+        ]
+    )
+
+
+# Full mesh of Transit Gateway peerings between the regional hubs
+hub_regions = list(hubs)
+for index, requester in enumerate(hub_regions):
+    for accepter in hub_regions[index + 1 :]:
+        TransitGatewayPeering(
+            hubs[requester],
+            hubs[accepter],
+            requester_cidrs=region_cidrs(requester),
+            accepter_cidrs=region_cidrs(accepter),
+            opts=ResourceOptions(),
+        )
 
-vpc = Vpc("main", cidrs.CIDR_PREFIX_NETWORKING, child_opts, is_public=True)
-routing = Routing(vpc=vpc, stack_root_ref=stack_root_ref, opts=child_opts)
+invoke_cache.default().report()
+stack_refs.default().report()
+tracing.default().report()
@@ -0,0 +1,84 @@
+from typing import List
+from pulumi import ComponentResource
+import pulumi_aws as aws
+import pulumi
+from leviathan import tracing
+from routing import Routing
+
+
+class TransitGatewayPeering(ComponentResource):
+    """Peers the Transit Gateways of two regional hubs.
+
+    Transit Gateway peering attachments do not propagate routes, so the CIDRs
+    of each side become static routes in the default route table of the other
+    side, through a prefix list reference. Egress never crosses the peering,
+    every region keeps sending internet bound traffic to its own NAT Gateways.
+    """
+
+    @tracing.traced
+    def __init__(
+        self,
+        requester: Routing,
+        accepter: Routing,
+        requester_cidrs: pulumi.Input[List[str]],
+        accepter_cidrs: pulumi.Input[List[str]],
+        opts,
+    ) -> None:
+        name = f"tgw-peering-{requester.region}-{accepter.region}"
+        # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
+        super().__init__(
+            "pkg:leviathan:environments:networking:peering", name, None, opts=opts
+        )
+        requester_opts = pulumi.ResourceOptions(
+            parent=self, provider=requester.provider
+        )
+        accepter_opts = pulumi.ResourceOptions(parent=self, provider=accepter.provider)
+
+        self.attachment = aws.ec2transitgateway.PeeringAttachment(
+            name,
+            transit_gateway_id=requester.transit_gateway.id,
+            peer_region=accepter.region,
+            peer_transit_gateway_id=accepter.transit_gateway.id,
+            tags={"Name": name},
+            opts=requester_opts,
+        )
+
+        accepted = aws.ec2transitgateway.PeeringAttachmentAccepter(
+            f"{name}-accepter",
+            transit_gateway_attachment_id=self.attachment.id,
+            tags={"Name": name},
+            opts=accepter_opts,
+        )
+
+        # Both sides route the CIDRs of the other side over the same attachment
+        # id, through a prefix list so that new environments only add entries
+        max_entries = pulumi.Config().get_int("peering_prefix_list_max_entries") or 64
+        for side, routing, cidrs, side_opts in (
+            ("requester", requester, accepter_cidrs, requester_opts),
+            ("accepter", accepter, requester_cidrs, accepter_opts),
+        ):
+            prefix_list = aws.ec2.ManagedPrefixList(
+                f"{name}-{side}-remote-cidrs",
+                address_family="IPv4",
+                max_entries=max_entries,
+                entries=pulumi.Output.from_input(cidrs).apply(
+                    lambda cidrs: [
+                        aws.ec2.ManagedPrefixListEntryArgs(cidr=cidr)
+                        for cidr in sorted(set(cidrs))
+                    ]
+                ),
+                tags={"Name": f"{name}-{side}-remote-cidrs"},
+                opts=side_opts,
+            )
+
+            aws.ec2transitgateway.PrefixListReference(
+                f"{name}-{side}-route",
+                prefix_list_id=prefix_list.id,
+                transit_gateway_attachment_id=self.attachment.id,
+                transit_gateway_route_table_id=routing.transit_gateway.association_default_route_table_id,
+                opts=pulumi.ResourceOptions.merge(
+                    side_opts, pulumi.ResourceOptions(depends_on=[accepted])
+                ),
+            )
+
+        self.register_outputs({})
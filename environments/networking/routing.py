@@ -1,54 +1,275 @@
+import ipaddress
+import math
+from typing import List, Optional, Tuple
 from pulumi import ComponentResource
 import pulumi_aws as aws
 import pulumi
+from leviathan import exports, regions, stack_refs, tracing, vpn
 from leviathan.configuration import cidrs
+from leviathan.aliases import moved_from
 from leviathan.vpc import Vpc
 
+# Concurrent connections one NAT Gateway address supports to a single destination
+NAT_CONNECTIONS_PER_ADDRESS = 55000
+# Dropped packets per NAT Gateway in 5 minutes before `nat_packets_drop_threshold`
+# alarms, a handful of drops during failovers or connection resets is normal
+NAT_PACKETS_DROP_THRESHOLD = 100
+
+# Former parents, resources nested under them only waited for their creation
+_INTERNET_GATEWAY = (
+    "aws:ec2/internetGateway:InternetGateway",
+    "networking-internet-gateway",
+)
+_PUBLIC_ROUTE_TABLE = ("aws:ec2/routeTable:RouteTable", "networking-public-rt")
+_TRANSIT_GATEWAY = (
+    "aws:ec2transitgateway/transitGateway:TransitGateway",
+    "central-egress-tgtw",
+)
+
+
+def nat_shards(count: int) -> List[str]:
+    # Smallest power of two number of equal prefixes covering 0.0.0.0/0 that
+    # gives each of `count` NAT Gateways at least one
+    if count <= 1:
+        return [cidrs.EVERYWHERE]
+    return [
+        str(n)
+        for n in ipaddress.ip_network(cidrs.EVERYWHERE).subnets(
+            prefixlen_diff=(count - 1).bit_length()
+        )
+    ]
+
 
 class Routing(ComponentResource):
-    def __init__(self, vpc: Vpc, stack_root_ref: pulumi.StackReference, opts) -> None:
+    @tracing.traced
+    def __init__(self, vpc: Vpc, opts, region: Optional[str] = None) -> None:
         # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
         super().__init__(
-            "pkg:leviathan:environments:networking:routing", "routing", None, opts=opts
+            "pkg:leviathan:environments:networking:routing",
+            f"routing{regions.suffix(region)}",
+            None,
+            opts=opts,
         )
         # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
         child_opts = pulumi.ResourceOptions(parent=self, providers=opts.providers)
+        # Every region has a hub of its own, see leviathan.regions for the names
+        self.region = region or regions.primary()
+        self.suffix = regions.suffix(region)
+        self.provider = opts.providers["aws"]
 
         self._internet_gateway(vpc, child_opts)
         self._nat_gateway(vpc, child_opts)
-        self._transit_gateway(vpc, stack_root_ref, child_opts)
-
-        routing_data = {
-            "vpc": vpc.id,
-            "internet_gateway": self.internet_gateway,
-            "nat_gateway": self.nat_gateway,
-            "transit_gateway": self.transit_gateway,
-        }
+        self._transit_gateway(vpc, child_opts)
+        self._vpn(child_opts)
+        if vpc.dual_stack:
+            self._ipv6(vpc, child_opts)
 
-        pulumi.export("routing", routing_data)
         self.register_outputs({})
 
+    def _ipv6(self, vpc: Vpc, child_opts: pulumi.ResourceOptions):
+        aws.ec2.Route(
+            f"networking-internet-ipv6-route{self.suffix}",
+            gateway_id=self.internet_gateway.id,
+            route_table_id=self.public_route_table.id,
+            destination_ipv6_cidr_block=cidrs.EVERYWHERE_IPV6,
+            opts=pulumi.ResourceOptions(
+                parent=self.public_route_table, providers=child_opts.providers
+            ),
+        )
+
+        # NAT64: environments send 64:ff9b::/96 over the Transit Gateway, where
+        # it is translated by the NAT Gateway in the AZ it arrives in
+        aws.ec2transitgateway.Route(
+            f"egress-tgw-nat64-route{self.suffix}",
+            destination_cidr_block=cidrs.NAT64_PREFIX,
+            transit_gateway_attachment_id=self.central_transit_attach.id,
+            transit_gateway_route_table_id=self.transit_gateway.association_default_route_table_id,
+            opts=pulumi.ResourceOptions(
+                parent=self.transit_gateway, providers=child_opts.providers
+            ),
+        )
+
+        for index, private_route_table in enumerate(self.private_route_tables):
+            az = vpc.availability_zones[index]
+            aws.ec2.Route(
+                f"networking-private-nat64-route-{az}",
+                nat_gateway_id=self.nat_gateways_by_az[
+                    index % len(self.nat_gateways_by_az)
+                ][0].id,
+                route_table_id=private_route_table.id,
+                destination_ipv6_cidr_block=cidrs.NAT64_PREFIX,
+                opts=pulumi.ResourceOptions(
+                    parent=private_route_table, providers=child_opts.providers
+                ),
+            )
+
+        # The translated replies leave the NAT Gateways towards the environment
+        # /56s, which are Amazon provided and only known from the root stack
+        environments = stack_refs.root().environments
+        primary = regions.primary()
+        self.environment_ipv6_prefix_list = aws.ec2.ManagedPrefixList(
+            f"networking-environments-ipv6{self.suffix}",
+            address_family="IPv6",
+            max_entries=pulumi.Config().get_int("ipv6_prefix_list_max_entries") or 32,
+            entries=environments.apply(
+                lambda envs: [
+                    aws.ec2.ManagedPrefixListEntryArgs(
+                        cidr=vpc.ipv6_cidr_block, description=name
+                    )
+                    for name, vpc in sorted(
+                        (name, env.vpc_in(self.region, primary))
+                        for name, env in envs.items()
+                    )
+                    if vpc is not None and vpc.ipv6_cidr_block
+                ]
+            ),
+            tags={"Name": f"networking-environments-ipv6{self.suffix}"},
+            opts=child_opts,
+        )
+
+        aws.ec2.Route(
+            f"networking-internet-ipv6-return-route{self.suffix}",
+            transit_gateway_id=self.transit_gateway.id,
+            route_table_id=self.public_route_table.id,
+            destination_prefix_list_id=self.environment_ipv6_prefix_list.id,
+            opts=pulumi.ResourceOptions(
+                depends_on=self.central_transit_attach,
+                parent=self.public_route_table,
+                providers=child_opts.providers,
+            ),
+        )
+
+    def to_export(self) -> dict:
+        return exports.versioned(
+            {
+                "transit_gateway_id": self.transit_gateway.id,
+                "transit_gateway_arn": self.transit_gateway.arn,
+                "transit_gateway_owner_id": self.transit_gateway.owner_id,
+                "transit_gateway_attachment_id": self.central_transit_attach.id,
+                "transit_gateway_route_table_id": self.transit_gateway.association_default_route_table_id,
+                "environments_prefix_list_id": self.environment_prefix_list.id,
+                "vpn_attachment_ids": [
+                    connection.transit_gateway_attachment_id
+                    for connection in self.vpn_connections
+                ],
+                "onprem_prefix_list_id": (
+                    self.onprem_prefix_list.id
+                    if self.onprem_prefix_list is not None
+                    else None
+                ),
+                "internet_gateway_id": self.internet_gateway.id,
+                "nat_gateway_ids": [
+                    nat_gateway.id for nat_gateway in self.nat_gateways
+                ],
+            }
+        )
+
+    def _vpn(self, child_opts: pulumi.ResourceOptions):
+        # Site-to-Site VPN of the primary hub (`vpn`, see leviathan.vpn.plan).
+        # The tunnels speak BGP, the Transit Gateway learns the on-premises
+        # routes from every one of them and balances flows over the tunnels
+        # with equal routes. The attachments are associated with and propagate
+        # into the default route table, environments with a route domain of
+        # their own propagate them into it too (see leviathan.routing).
+        self.vpn_connections = []
+        self.onprem_prefix_list = None
+        config = pulumi.Config().get_object("vpn")
+        if not config or self.suffix:
+            return
+
+        customer_gateways = {}
+        for customer_gateway in config["customer_gateways"]:
+            name = customer_gateway["name"]
+            customer_gateways[name] = aws.ec2.CustomerGateway(
+                f"networking-cgw-{name}",
+                bgp_asn=str(customer_gateway["bgp_asn"]),
+                ip_address=customer_gateway["ip_address"],
+                type="ipsec.1",
+                tags={"Name": f"networking-cgw-{name}"},
+                opts=child_opts,
+            )
+
+        for connection in vpn.plan(config):
+            self.vpn_connections.append(
+                aws.ec2.VpnConnection(
+                    f"networking-{connection.name}",
+                    customer_gateway_id=customer_gateways[
+                        connection.customer_gateway
+                    ].id,
+                    transit_gateway_id=self.transit_gateway.id,
+                    type="ipsec.1",
+                    static_routes_only=False,
+                    tags={"Name": f"networking-{connection.name}"},
+                    opts=pulumi.ResourceOptions(
+                        parent=self.transit_gateway, providers=child_opts.providers
+                    ),
+                )
+            )
+
+        # Environments reach every on-premises network with one route to this
+        # list, shared like the Transit Gateway
+        onprem_cidrs = config.get("cidrs") or []
+        if onprem_cidrs:
+            self.onprem_prefix_list = aws.ec2.ManagedPrefixList(
+                "networking-onprem",
+                address_family="IPv4",
+                max_entries=config.get("prefix_list_max_entries") or len(onprem_cidrs),
+                entries=[
+                    aws.ec2.ManagedPrefixListEntryArgs(cidr=cidr)
+                    for cidr in onprem_cidrs
+                ],
+                tags={"Name": "networking-onprem"},
+                opts=child_opts,
+            )
+
+            aws.ram.ResourceAssociation(
+                "networking-onprem-resource-assoc",
+                resource_arn=self.onprem_prefix_list.arn,
+                resource_share_arn=self.resource_share.arn,
+                opts=pulumi.ResourceOptions(
+                    parent=self.resource_share, providers=child_opts.providers
+                ),
+            )
+
+    def _moved_from(
+        self, *ancestors: Tuple[str, str], name: Optional[str] = None
+    ) -> List[pulumi.Alias]:
+        # Only the primary region has resources from before they were reparented
+        return [] if self.suffix else [moved_from(self, *ancestors, name=name)]
+
+    def _nat_aliases(self, first: bool, single_name: str) -> List[pulumi.Alias]:
+        # NAT Gateways and EIPs were nested under the public route table, the
+        # first one was also the single `single_name` before
+        aliases = self._moved_from(_INTERNET_GATEWAY, _PUBLIC_ROUTE_TABLE)
+        if first:
+            aliases += self._moved_from(
+                _INTERNET_GATEWAY, _PUBLIC_ROUTE_TABLE, name=single_name
+            )
+        return aliases
+
     def _internet_gateway(self, vpc: Vpc, child_opts: pulumi.ResourceOptions):
         # Internet gateway
         self.internet_gateway = aws.ec2.InternetGateway(
-            "networking-internet-gateway",
+            f"networking-internet-gateway{self.suffix}",
             vpc_id=vpc.id,
-            tags={"Name": "networking-internet-gateway"},
+            tags={"Name": f"networking-internet-gateway{self.suffix}"},
             opts=child_opts,
         )
 
         # Route tables
         self.public_route_table = aws.ec2.RouteTable(
-            "networking-public-rt",
+            f"networking-public-rt{self.suffix}",
             vpc_id=vpc.id,
-            tags={"Name": "networking-public-route-table"},
+            tags={"Name": f"networking-public-route-table{self.suffix}"},
             opts=pulumi.ResourceOptions(
-                parent=self.internet_gateway, providers=child_opts.providers
+                parent=self,
+                providers=child_opts.providers,
+                aliases=self._moved_from(_INTERNET_GATEWAY),
             ),
         )
 
         aws.ec2.Route(
-            "networking-internet-route",
+            f"networking-internet-route{self.suffix}",
             gateway_id=self.internet_gateway.id,
             route_table_id=self.public_route_table.id,
             destination_cidr_block=cidrs.EVERYWHERE,
@@ -58,7 +279,7 @@ class Routing(ComponentResource):
         )
 
         aws.ec2.MainRouteTableAssociation(
-            "networking-public-main-route-association",
+            f"networking-public-main-route-association{self.suffix}",
             route_table_id=self.public_route_table.id,
             vpc_id=vpc.id,
             opts=pulumi.ResourceOptions(
@@ -68,7 +289,7 @@ class Routing(ComponentResource):
 
         for index, subnet in enumerate(vpc.public_subnets):
             aws.ec2.RouteTableAssociation(
-                f"networking-public-route-association-{index}",
+                f"networking-public-route-association-{index}{self.suffix}",
                 route_table_id=self.public_route_table.id,
                 subnet_id=subnet,
                 opts=pulumi.ResourceOptions(
@@ -77,65 +298,220 @@ class Routing(ComponentResource):
             )
 
     def _nat_gateway(self, vpc: Vpc, child_opts: pulumi.ResourceOptions):
-        # NAT Gateway
-        # TODO: Create 2nd NAT Gateway in another AZ for HA
-        eip = aws.ec2.Eip(
-            "networking-nat-eip",
-            vpc=True,
-            opts=pulumi.ResourceOptions(
-                parent=self.public_route_table, providers=child_opts.providers
-            ),
-        )
+        # A single NAT Gateway by default, the one the hub always had. With
+        # `nat_gateway_count` up to one per AZ, egress traffic entering the egress
+        # VPC through the Transit Gateway ENI in a given AZ leaves through a NAT
+        # Gateway in the same AZ instead of crossing AZs.
+        config = pulumi.Config()
+        nat_gateway_count = config.get_int("nat_gateway_count")
+        connection_capacity = config.get_int("nat_connection_capacity")
+        if nat_gateway_count and connection_capacity:
+            raise ValueError(
+                "nat_gateway_count and nat_connection_capacity cannot be combined, "
+                "nat_connection_capacity puts NAT Gateways in every AZ"
+            )
+        nat_gateway_count = max(1, min(nat_gateway_count or 1, len(vpc.public_subnets)))
 
-        self.nat_gateway = aws.ec2.NatGateway(
-            "networking-nat-gw",
-            allocation_id=eip.id,
-            subnet_id=vpc.public_subnets[0],
-            tags={"Name": "networking-nat-gw"},
-            opts=pulumi.ResourceOptions(
-                parent=self.public_route_table, providers=child_opts.providers
-            ),
-        )
+        # A NAT Gateway address handles about 55k concurrent connections to a
+        # single destination. `nat_connection_capacity` is the number needed per
+        # AZ and scales out to several NAT Gateways in every AZ.
+        nat_gateways_per_az = 1
+        if connection_capacity:
+            nat_gateway_count = len(vpc.public_subnets)
+            nat_gateways_per_az = max(
+                1, math.ceil(connection_capacity / NAT_CONNECTIONS_PER_ADDRESS)
+            )
 
-        # Private route table
-        private_route_table = aws.ec2.RouteTable(
-            "networking-private-route-table",
-            vpc_id=vpc.id,
-            tags={"Name": "networking-private-route-table"},
-            opts=pulumi.ResourceOptions(parent=vpc, providers=child_opts.providers),
-        )
+        # nat_gateways[i] are the NAT Gateways of the i-th AZ, the first one keeps
+        # the name it had before NAT Gateways were scaled out. The one of the
+        # first AZ is the single NAT Gateway there was before one per AZ, it
+        # keeps that one and its EIP, i.e. the egress address, in place.
+        self.nat_gateways_by_az = []
+        for index, subnet in enumerate(vpc.public_subnets[:nat_gateway_count]):
+            az = vpc.availability_zones[index]
+            az_nat_gateways = []
+            for shard in range(nat_gateways_per_az):
+                suffix = az if shard == 0 else f"{az}-{shard}"
+                first = index == 0 and shard == 0
+                eip = aws.ec2.Eip(
+                    f"networking-nat-eip-{suffix}",
+                    vpc=True,
+                    opts=pulumi.ResourceOptions(
+                        parent=self,
+                        providers=child_opts.providers,
+                        aliases=self._nat_aliases(first, "networking-nat-eip"),
+                    ),
+                )
 
-        private_route = aws.ec2.Route(
-            "networking-private-route",
-            nat_gateway_id=self.nat_gateway.id,
-            route_table_id=private_route_table.id,
-            destination_cidr_block=cidrs.EVERYWHERE,
-            opts=pulumi.ResourceOptions(
-                parent=self.nat_gateway, providers=child_opts.providers
-            ),
-        )
+                az_nat_gateways.append(
+                    aws.ec2.NatGateway(
+                        f"networking-nat-gw-{suffix}",
+                        allocation_id=eip.id,
+                        subnet_id=subnet,
+                        tags={"Name": f"networking-nat-gw-{suffix}"},
+                        # A public NAT Gateway needs the internet gateway, not the
+                        # public route table
+                        opts=pulumi.ResourceOptions(
+                            depends_on=[self.internet_gateway],
+                            parent=self,
+                            providers=child_opts.providers,
+                            aliases=self._nat_aliases(first, "networking-nat-gw"),
+                        ),
+                    )
+                )
+                self._nat_gateway_alarms(suffix, az_nat_gateways[-1], child_opts)
+            self.nat_gateways_by_az.append(az_nat_gateways)
+
+        self.nat_gateways = [n for az in self.nat_gateways_by_az for n in az]
+        self.nat_gateway = self.nat_gateways[0]
 
+        # Private (Transit Gateway facing) route table per AZ. Each one sends
+        # internet bound traffic to the NAT Gateway in its own AZ, or wraps around
+        # when fewer NAT Gateways than AZs are configured.
+        self.private_route_tables = []
         for index, subnet in enumerate(vpc.private_subnets):
+            az = vpc.availability_zones[index]
+            az_nat_gateways = self.nat_gateways_by_az[
+                index % len(self.nat_gateways_by_az)
+            ]
+            nat_gateway = az_nat_gateways[0]
+
+            # The first AZ keeps the single private route table there was before
+            first = index == 0 and not self.suffix
+            private_route_table = aws.ec2.RouteTable(
+                f"networking-private-route-table-{az}",
+                vpc_id=vpc.id,
+                tags={"Name": f"networking-private-route-table-{az}"},
+                opts=pulumi.ResourceOptions(
+                    parent=vpc,
+                    providers=child_opts.providers,
+                    aliases=(
+                        [pulumi.Alias(name="networking-private-route-table")]
+                        if first
+                        else []
+                    ),
+                ),
+            )
+            self.private_route_tables.append(private_route_table)
+
+            private_route = aws.ec2.Route(
+                f"networking-private-route-{az}",
+                nat_gateway_id=nat_gateway.id,
+                route_table_id=private_route_table.id,
+                destination_cidr_block=cidrs.EVERYWHERE,
+                opts=pulumi.ResourceOptions(
+                    parent=nat_gateway,
+                    providers=child_opts.providers,
+                    # The single private route was nested under the NAT Gateway,
+                    # itself under the public route table
+                    aliases=(
+                        self._moved_from(
+                            _INTERNET_GATEWAY,
+                            _PUBLIC_ROUTE_TABLE,
+                            ("aws:ec2/natGateway:NatGateway", "networking-nat-gw"),
+                            name="networking-private-route",
+                        )
+                        if first
+                        else []
+                    ),
+                ),
+            )
+
+            # With several NAT Gateways in the AZ the internet is split into equal
+            # shards by destination, longest prefix match sends every shard to
+            # its own NAT Gateway and shards of the first one fall to 0.0.0.0/0
+            for shard, destination in enumerate(nat_shards(len(az_nat_gateways))):
+                shard_nat_gateway = az_nat_gateways[shard % len(az_nat_gateways)]
+                if shard_nat_gateway is nat_gateway:
+                    continue
+                aws.ec2.Route(
+                    f"networking-private-route-{az}-shard-{shard}",
+                    nat_gateway_id=shard_nat_gateway.id,
+                    route_table_id=private_route_table.id,
+                    destination_cidr_block=destination,
+                    opts=pulumi.ResourceOptions(
+                        parent=shard_nat_gateway, providers=child_opts.providers
+                    ),
+                )
+
             aws.ec2.RouteTableAssociation(
-                f"networking-private-route-table-association-{index}",
+                f"networking-private-route-table-association-{index}{self.suffix}",
                 route_table_id=private_route_table,
                 subnet_id=subnet,
                 opts=pulumi.ResourceOptions(
-                    parent=private_route, providers=child_opts.providers
+                    parent=private_route_table,
+                    providers=child_opts.providers,
+                    aliases=self._moved_from(
+                        _INTERNET_GATEWAY,
+                        _PUBLIC_ROUTE_TABLE,
+                        ("aws:ec2/natGateway:NatGateway", nat_gateway._name),
+                        ("aws:ec2/route:Route", private_route._name),
+                    )
+                    # Every subnet used to be associated with the single table
+                    + self._moved_from(
+                        _INTERNET_GATEWAY,
+                        _PUBLIC_ROUTE_TABLE,
+                        ("aws:ec2/natGateway:NatGateway", "networking-nat-gw"),
+                        ("aws:ec2/route:Route", "networking-private-route"),
+                    ),
+                ),
+            )
+
+    def _nat_gateway_alarms(
+        self,
+        name: str,
+        nat_gateway: aws.ec2.NatGateway,
+        child_opts: pulumi.ResourceOptions,
+    ):
+        # Port exhaustion shows up as ErrorPortAllocation long before users
+        # notice, `alarm_topic_arn` is notified when either alarm fires
+        config = pulumi.Config()
+        alarm_topic_arn = config.get("alarm_topic_arn")
+        packets_drop_threshold = config.get_int("nat_packets_drop_threshold")
+        thresholds = {
+            "ErrorPortAllocation": 0,
+            "PacketsDropCount": (
+                NAT_PACKETS_DROP_THRESHOLD
+                if packets_drop_threshold is None
+                else packets_drop_threshold
+            ),
+        }
+        for metric, threshold in thresholds.items():
+            aws.cloudwatch.MetricAlarm(
+                f"networking-nat-gw-{name}-{metric}",
+                alarm_description=f"{metric} on networking-nat-gw-{name}",
+                namespace="AWS/NATGateway",
+                metric_name=metric,
+                dimensions={"NatGatewayId": nat_gateway.id},
+                statistic="Sum",
+                period=300,
+                evaluation_periods=1,
+                threshold=threshold,
+                comparison_operator="GreaterThanThreshold",
+                treat_missing_data="notBreaching",
+                alarm_actions=[alarm_topic_arn] if alarm_topic_arn else None,
+                ok_actions=[alarm_topic_arn] if alarm_topic_arn else None,
+                opts=pulumi.ResourceOptions(
+                    parent=nat_gateway, providers=child_opts.providers
                 ),
             )
 
     def _transit_gateway(
         self,
         vpc: Vpc,
-        stack_root_ref: pulumi.StackReference,
         child_opts: pulumi.ResourceOptions,
     ):
+        # With `tgw_route_domains` every environment accepts its own attachment
+        # and associates it with a Transit Gateway route table of its own (see
+        # leviathan.routing.Routing), the default route table is left to the hub
+        route_domains = pulumi.Config().get_bool("tgw_route_domains") or False
         self.transit_gateway = aws.ec2transitgateway.TransitGateway(
-            "central-egress-tgtw",
-            description="central-egress-tgtw",
-            auto_accept_shared_attachments="enable",
-            tags={"Name": "central-egress-tgtw"},
+            f"central-egress-tgtw{self.suffix}",
+            description=f"central-egress-tgtw{self.suffix}",
+            auto_accept_shared_attachments="disable" if route_domains else "enable",
+            # Flows to on-premises spread over every VPN tunnel, see _vpn
+            vpn_ecmp_support="enable",
+            tags={"Name": f"central-egress-tgtw{self.suffix}"},
             opts=child_opts,
         )
 
@@ -145,6 +521,7 @@ class Routing(ComponentResource):
             transit_gateway_id=self.transit_gateway.id,
             vpc_id=vpc.id,
             subnet_ids=vpc.private_subnets,
+            ipv6_support="enable" if vpc.dual_stack else None,
             opts=child_opts,
             tags={"Name": vpc.name},
         )
@@ -154,7 +531,7 @@ class Routing(ComponentResource):
         # in the egress VPC. Once in the egress VPC, traﬃc follows the routes deﬁned in the subnet
         #  route table where these Transit Gateway ENIs are present.
         aws.ec2transitgateway.Route(
-            "egress-tgw-route",
+            f"egress-tgw-route{self.suffix}",
             destination_cidr_block="0.0.0.0/0",
             transit_gateway_attachment_id=self.central_transit_attach.id,
             transit_gateway_route_table_id=self.transit_gateway.association_default_route_table_id,
@@ -169,30 +546,48 @@ class Routing(ComponentResource):
         # you must add a static route table entry in the NAT gateway subnet route table pointing all spoke
         # VPC bound traffic to Transit Gateway as the next hop.
         aws.ec2.Route(
-            "networking-internet-return-route",
+            f"networking-internet-return-route{self.suffix}",
             transit_gateway_id=self.transit_gateway.id,
             route_table_id=self.public_route_table.id,
             destination_cidr_block=cidrs.DEFAULT_CIDR_BLOCK,
             opts=pulumi.ResourceOptions(
-                depends_on=self.transit_gateway,
+                depends_on=self.central_transit_attach,
                 parent=self.public_route_table,
                 providers=child_opts.providers,
             ),
         )
 
+        # Shared interface endpoints sit in the private subnets, their replies to
+        # the environments go back through the Transit Gateway
+        if pulumi.Config().get("endpoints_mode") == "central":
+            for index, private_route_table in enumerate(self.private_route_tables):
+                aws.ec2.Route(
+                    f"networking-private-return-route-{vpc.availability_zones[index]}",
+                    transit_gateway_id=self.transit_gateway.id,
+                    route_table_id=private_route_table.id,
+                    destination_cidr_block=cidrs.DEFAULT_CIDR_BLOCK,
+                    opts=pulumi.ResourceOptions(
+                        depends_on=self.central_transit_attach,
+                        parent=private_route_table,
+                        providers=child_opts.providers,
+                    ),
+                )
+
         # Share transit gateway with an entire organization
-        aws_org_arn = stack_root_ref.get_output("organization")["arn"]
+        aws_org_arn = stack_refs.root().organization_arn
 
-        ram_resource_share = aws.ram.ResourceShare(
-            "central-egress-tgtw-share",
+        self.resource_share = ram_resource_share = aws.ram.ResourceShare(
+            f"central-egress-tgtw-share{self.suffix}",
             allow_external_principals=False,
             opts=pulumi.ResourceOptions(
-                parent=self.transit_gateway, providers=child_opts.providers
+                parent=self,
+                providers=child_opts.providers,
+                aliases=self._moved_from(_TRANSIT_GATEWAY),
             ),
         )
 
         aws.ram.PrincipalAssociation(
-            "central-egress-tgtw-share-principal-assoc",
+            f"central-egress-tgtw-share-principal-assoc{self.suffix}",
             principal=aws_org_arn,
             resource_share_arn=ram_resource_share.arn,
             opts=pulumi.ResourceOptions(
@@ -201,10 +596,47 @@ class Routing(ComponentResource):
         )
 
         aws.ram.ResourceAssociation(
-            "central-egress-tgtw-resource-assoc",
+            f"central-egress-tgtw-resource-assoc{self.suffix}",
             resource_arn=self.transit_gateway.arn,
             resource_share_arn=ram_resource_share.arn,
             opts=pulumi.ResourceOptions(
                 parent=ram_resource_share, providers=child_opts.providers
             ),
         )
+
+        # Environment CIDRs of the region in one prefix list, shared with the
+        # organization, so that a route table reaches every environment with a
+        # single route and a new environment only adds an entry. A route to a
+        # prefix list weighs `max_entries` against the 50 routes of a VPC route
+        # table, hence the small default.
+        environments = stack_refs.root().environments
+        primary = regions.primary()
+        self.environment_prefix_list = aws.ec2.ManagedPrefixList(
+            f"networking-environments{self.suffix}",
+            address_family="IPv4",
+            max_entries=pulumi.Config().get_int("environments_prefix_list_max_entries")
+            or 20,
+            entries=environments.apply(
+                lambda envs: [
+                    aws.ec2.ManagedPrefixListEntryArgs(
+                        cidr=vpc.cidr_block, description=name
+                    )
+                    for name, vpc in sorted(
+                        (name, env.vpc_in(self.region, primary))
+                        for name, env in envs.items()
+                    )
+                    if vpc is not None and vpc.cidr_block
+                ]
+            ),
+            tags={"Name": f"networking-environments{self.suffix}"},
+            opts=child_opts,
+        )
+
+        aws.ram.ResourceAssociation(
+            f"networking-environments-resource-assoc{self.suffix}",
+            resource_arn=self.environment_prefix_list.arn,
+            resource_share_arn=ram_resource_share.arn,
+            opts=pulumi.ResourceOptions(
+                parent=ram_resource_share, providers=child_opts.providers
+            ),
+        )
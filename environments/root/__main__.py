@@ -3,7 +3,7 @@
 import pulumi
 import pulumi_aws as aws
 from leviathan.account import Account
-from leviathan.environment import Environment
+from leviathan import account_pool, catalog, invoke_cache, stack_refs, tracing
 
 # The Networking account serves as the central hub for network routing between
 # AMS multi-account landing zone accounts, your on-premises network,
@@ -11,13 +11,26 @@ from leviathan.environment import Environment
 
 networking_account = Account("networking")
 
-# create development environments
+# create the environments listed in the catalog (`environments` stack config),
+# new ones take a pre-created account when `account_pool_size` is set
 
-environments = {"dev": Environment("dev")}
+pool = account_pool.from_config()
+environments = {
+    environment.name: environment
+    for environment in catalog.build(catalog.load(), pool=pool)
+}
 
 org = aws.organizations.get_organization()
 
 # Export the name of the bucket
 pulumi.export("organization", {"id": org.id, "arn": org.arn})
-pulumi.export("environments", environments)
-pulumi.export("networking_account", networking_account)
+pulumi.export(
+    "environments", {name: env.to_export() for name, env in environments.items()}
+)
+pulumi.export("networking_account", networking_account.to_export())
+if pool is not None:
+    pulumi.export("account_pool", pool.to_export())
+
+invoke_cache.default().report()
+stack_refs.default().report()
+tracing.default().report()
@@ -1,12 +1,14 @@
 
+from typing import Dict, Optional
 from pulumi import ComponentResource, ResourceOptions, Output
 import pulumi_aws as aws
 import pulumi_random as random
-from leviathan import consts
+from leviathan import consts, exports, tracing
 
 
 class Account(ComponentResource):
-    def __init__(self, name: str, opts=None) -> None:
+    @tracing.traced
+    def __init__(self, name: str, opts=None, tags: Optional[Dict[str, str]] = None) -> None:
         # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
         super().__init__('pkg:leviathan:account', name, None, opts=opts)
         # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
@@ -29,6 +31,15 @@ class Account(ComponentResource):
             close_on_deletion=True,
             iam_user_access_to_billing='ALLOW',
             role_name=consts.OrganizationAccountAccessRoleName,
+            tags=tags,
             opts=child_opts)
 
+        self.name = name
         self.register_outputs({'account' : self.account})
+
+    def to_export(self) -> dict:
+        return exports.versioned({
+            'name': self.name,
+            'id': self.account.id,
+            'role_name': self.account.role_name,
+        })
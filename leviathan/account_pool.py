@@ -0,0 +1,132 @@
+import copy
+from typing import Any, Dict, Optional
+import pulumi
+from pulumi import ComponentResource, ResourceOptions
+from leviathan import exports, stack_refs, tracing
+from leviathan.account import Account
+
+
+class AccountPool(ComponentResource):
+    """Organization accounts created ahead of the environments that will use them.
+
+    Creating an organization account takes minutes and everything in an
+    environment waits for it, as its provider assumes a role in the account.
+    With `account_pool_size: N` the root stack keeps N spare accounts, a new
+    environment claims one of them, whose creation finished in an earlier
+    `pulumi up`, and the pool is refilled by creating new spares alongside
+    everything else, without anything waiting on them.
+
+    Slots and claims are the pool's `state`, exported as `account_pool.state`
+    and read back from the last update of the stack, so an environment keeps
+    its account across runs. Without a previous state the pool is first
+    enabled: environments already in the catalog keep the account they have.
+    """
+
+    @tracing.traced
+    def __init__(
+        self,
+        size: int,
+        state: Optional[Dict[str, Any]] = None,
+        name: str = "account-pool",
+        opts=None,
+    ) -> None:
+        # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
+        super().__init__("pkg:leviathan:account_pool", name, None, opts=opts)
+        # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
+        self.child_opts = ResourceOptions(parent=self)
+
+        self.size = size
+        self.accounts: Dict[str, Account] = {}
+        self._first_run = state is None
+        self._state = (
+            copy.deepcopy(state)
+            if state is not None
+            else {"next_slot": 0, "free": [], "claims": {}, "dedicated": []}
+        )
+
+    def claim(self, environment: str) -> Optional[Account]:
+        # None when the environment keeps an account of its own
+        state = self._state
+        if environment in state["dedicated"]:
+            return None
+        if environment not in state["claims"]:
+            if self._first_run:
+                state["dedicated"].append(environment)
+                return None
+            if not state["free"]:
+                # An empty pool falls back to creating the account right away
+                state["free"].append(self._new_slot())
+            state["claims"][environment] = state["free"].pop(0)
+
+        return self._account(state["claims"][environment], environment)
+
+    def refill(self) -> None:
+        """Creates spare accounts up to `size`, call once every claim is made.
+
+        The pool never shrinks, lowering `size` keeps the spares already created.
+        """
+        state = self._state
+        while len(state["free"]) < self.size:
+            state["free"].append(self._new_slot())
+
+        for slot in state["free"]:
+            self._account(slot)
+        # Claims of environments no longer in the catalog keep their account,
+        # it may still hold resources and can not go back into the pool
+        for environment, slot in state["claims"].items():
+            if slot not in self.accounts:
+                pulumi.log.warn(
+                    f"{slot} is still claimed by {environment}, which is not in the catalog"
+                )
+                self._account(slot, environment)
+
+        self.register_outputs({})
+
+    def to_export(self) -> dict:
+        return exports.versioned(
+            {
+                "size": self.size,
+                "free": [
+                    self.accounts[slot].account.id for slot in self._state["free"]
+                ],
+                "claims": {
+                    environment: self.accounts[slot].account.id
+                    for environment, slot in self._state["claims"].items()
+                },
+                "state": copy.deepcopy(self._state),
+            }
+        )
+
+    def _new_slot(self) -> str:
+        slot = f"pool-{self._state['next_slot']}"
+        self._state["next_slot"] += 1
+        return slot
+
+    def _account(self, slot: str, environment: Optional[str] = None) -> Account:
+        if slot not in self.accounts:
+            self.accounts[slot] = Account(
+                slot,
+                self.child_opts,
+                tags={"leviathan:environment": environment or "unclaimed"},
+            )
+        return self.accounts[slot]
+
+
+def from_config(config: Optional[pulumi.Config] = None) -> Optional[AccountPool]:
+    """The pool of the current stack, None unless `account_pool_size` is set.
+
+    The state is the `account_pool` output of the last update of this very
+    stack. A pool that has claims stays in use with a size of 0, so the
+    claimed accounts are kept.
+    """
+    config = config or pulumi.Config()
+    size = config.get_int("account_pool_size") or 0
+    previous = exports.load(
+        exports.AccountPoolExport,
+        stack_refs.default().stack(pulumi.get_stack()).plain("account_pool"),
+    )
+    state = previous.state if previous is not None else None
+    if size <= 0 and not (state and (state["claims"] or state["free"])):
+        return None
+
+    return AccountPool(size, state=state)
@@ -0,0 +1,26 @@
+from typing import Optional, Tuple
+import pulumi
+
+
+def moved_from(
+    component: pulumi.Resource,
+    *ancestors: Tuple[str, str],
+    name: Optional[str] = None,
+) -> pulumi.Alias:
+    """Alias for a child of `component` that used to be nested under custom resources.
+
+    `ancestors` are the (type, name) of the former parents from the component
+    down, `name` the former name of the child when it was renamed too. The
+    alias is built from the component's URN, aliasing the former parent
+    resource itself would wait for its creation all over again.
+    """
+
+    def urn(component_urn: str) -> str:
+        prefix, project, qualified_type, name = component_urn.split("::", 3)
+        for typ, ancestor in ancestors:
+            qualified_type, name = f"{qualified_type}${typ}", ancestor
+        return "::".join((prefix, project, qualified_type, name))
+
+    if name is None:
+        return pulumi.Alias(parent=component.urn.apply(urn))
+    return pulumi.Alias(name=name, parent=component.urn.apply(urn))
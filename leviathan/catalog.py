@@ -0,0 +1,179 @@
+import json
+import re
+from typing import Any, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+import pulumi
+from leviathan import consts, regions
+from leviathan.account_pool import AccountPool
+from leviathan.environment import Environment
+
+ENVIRONMENT_NAME = re.compile(r"^[a-z][a-z0-9-]{0,30}$")
+ENVIRONMENT_KEYS = {"name", "endpoints", "availability_zones", "features", "regions"}
+
+
+class CatalogError(Exception):
+    def __init__(self, errors: List[str]) -> None:
+        super().__init__(
+            "invalid environment catalog:\n" + "\n".join(f"  - {e}" for e in errors)
+        )
+        self.errors = errors
+
+
+class EnvironmentSpec(NamedTuple):
+    name: str
+    endpoints: List[str]
+    availability_zones: Optional[int]
+    features: FrozenSet[str]
+    regions: List[str]  # besides the primary region
+
+
+def load(config: Optional[pulumi.Config] = None) -> List[EnvironmentSpec]:
+    """Reads and validates the environment catalog of the current stack.
+
+    The catalog is the `environments` config object, or the JSON file named by
+    `environments_file`. Without either the stack gets a single `dev` environment.
+    """
+    config = config or pulumi.Config()
+
+    entries = config.get_object("environments")
+    if entries is None and config.get("environments_file"):
+        with open(config.get("environments_file")) as f:
+            entries = json.load(f)
+    if entries is None:
+        entries = [{"name": "dev"}]
+
+    return parse(entries, known_regions=regions.configured(config))
+
+
+def parse(
+    entries: Any, known_regions: Optional[List[str]] = None
+) -> List[EnvironmentSpec]:
+    # Every entry is validated before anything is constructed, and all problems
+    # are reported together
+    if not isinstance(entries, list):
+        raise CatalogError(["the catalog must be a list of environments"])
+
+    errors = []
+    specs = []
+    names = set()
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            errors.append(f"environments[{index}]: expected an object")
+            continue
+
+        name = entry.get("name")
+        where = f"environments[{index}] ({name})" if name else f"environments[{index}]"
+
+        endpoints = entry.get("endpoints", consts.DefaultEndpoints)
+        availability_zones = entry.get("availability_zones")
+        features = entry.get("features", consts.DefaultFeatures)
+        environment_regions = entry.get("regions", [])
+
+        problems = (
+            _check_keys(entry)
+            + _check_name(name, names)
+            + _check_endpoints(endpoints)
+            + _check_availability_zones(availability_zones)
+            + _check_features(features)
+            + _check_regions(environment_regions, known_regions)
+        )
+        errors.extend(f"{where}: {problem}" for problem in problems)
+        if isinstance(name, str):
+            names.add(name)
+
+        specs.append(
+            EnvironmentSpec(
+                name=name,
+                endpoints=endpoints,
+                availability_zones=availability_zones,
+                features=(
+                    frozenset(features) if _is_list_of_str(features) else frozenset()
+                ),
+                regions=environment_regions,
+            )
+        )
+
+    if errors:
+        raise CatalogError(errors)
+
+    return specs
+
+
+def build(
+    specs: Iterable[EnvironmentSpec], pool: Optional[AccountPool] = None
+) -> List[Environment]:
+    environments = [
+        Environment(
+            spec.name,
+            endpoints=list(spec.endpoints),
+            availability_zones=spec.availability_zones,
+            features=spec.features,
+            account=pool.claim(spec.name) if pool is not None else None,
+            regions=list(spec.regions),
+        )
+        for spec in specs
+    ]
+
+    if pool is not None:
+        pool.refill()
+
+    return environments
+
+
+def _check_keys(entry: dict) -> List[str]:
+    return [f"unknown key '{key}'" for key in sorted(set(entry) - ENVIRONMENT_KEYS)]
+
+
+def _check_name(name: Any, names: Set[str]) -> List[str]:
+    if not isinstance(name, str) or not ENVIRONMENT_NAME.match(name):
+        return [f"name must match {ENVIRONMENT_NAME.pattern}"]
+    if name in names:
+        return ["duplicate environment name"]
+    return []
+
+
+def _check_endpoints(endpoints: Any) -> List[str]:
+    if not _is_list_of_str(endpoints):
+        return ["endpoints must be a list of service names"]
+    if len(set(endpoints)) != len(endpoints):
+        return ["duplicate endpoints"]
+    return []
+
+
+def _check_availability_zones(availability_zones: Any) -> List[str]:
+    if availability_zones is None:
+        return []
+    if (
+        not isinstance(availability_zones, int)
+        or isinstance(availability_zones, bool)
+        or availability_zones < 1
+    ):
+        return ["availability_zones must be a positive integer"]
+    return []
+
+
+def _check_features(features: Any) -> List[str]:
+    if not _is_list_of_str(features):
+        return ["features must be a list"]
+    return [
+        f"unknown feature '{feature}'"
+        for feature in sorted(set(features) - set(consts.Features))
+    ]
+
+
+def _check_regions(
+    environment_regions: Any, known_regions: Optional[List[str]]
+) -> List[str]:
+    if not _is_list_of_str(environment_regions):
+        return ["regions must be a list of region names"]
+    if known_regions is None:
+        return []
+    # Environments attach to the hub of their region, only regions with a hub
+    # (the `regions` stack config) are possible
+    return [
+        f"region '{region}' has no networking hub"
+        for region in sorted(set(environment_regions) - set(known_regions))
+    ]
+
+
+def _is_list_of_str(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
@@ -1,12 +1,11 @@
 # The default CIDR block and prefix for all VPCs
+# VPC and subnet blocks are allocated from it by leviathan.ipam and recorded
+# in allocations.json
 DEFAULT_CIDR_BLOCK = '10.0.0.0/8'
 
-CIDR_PREFIX_NETWORKING = '10.100'
-
-# NEXT STEPS: CIDRs per project
-CIDR_PREFIX_DEV = '10.101'
-CIDR_PREFIX_TEST = '10.102'
-CIDR_PREFIX_PROD = '10.103'
-
 
 EVERYWHERE = '0.0.0.0/0'
+EVERYWHERE_IPV6 = '::/0'
+
+# Well-known prefix of IPv4 addresses synthesized by DNS64 and translated by NAT64
+NAT64_PREFIX = '64:ff9b::/96'
@@ -1 +1,19 @@
-OrganizationAccountAccessRoleName = 'OrganizationAccountAccessRole'
\ No newline at end of file
+OrganizationAccountAccessRoleName = 'OrganizationAccountAccessRole'
+
+DefaultEndpoints = [
+    'ec2',
+    'ec2messages',
+    'ssm',
+    'ssmmessages',
+    's3',
+    'dynamodb',
+    'ecr.dkr',
+    'ecr.api',
+    'ecs',
+    'ecs-agent',
+    'ecs-telemetry',
+]
+
+# Optional parts of an environment that can be switched on or off in the catalog
+Features = ['iam', 'flow_logs', 'dual_stack']
+DefaultFeatures = ['iam', 'flow_logs']
@@ -0,0 +1,286 @@
+"""Estimates the critical path of a deployment from its resource graph.
+
+Reads a `pulumi stack export` checkpoint, or the graph recorded by
+`benchmarks/construction.py --graph`, weights every resource with a typical
+creation latency for its type and reports the longest chain of waits. Edges
+that carry no data, i.e. `depends_on` only, a parent that is a custom resource
+or a value only used in tags, are reported as avoidable together with how much
+sooner the longest chain through each of them would end without it. Exits with
+1 when avoidable edges lengthen the critical path, so CI can guard against new
+ones.
+
+    python -m leviathan.critical_path checkpoint.json
+    python -m leviathan.critical_path graph.json --latency aws:ec2/natGateway:NatGateway=150
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# Typical creation time in seconds, anything not listed takes DEFAULT_LATENCY
+LATENCIES = {
+    "aws:organizations/account:Account": 240.0,
+    "aws:ec2transitgateway/transitGateway:TransitGateway": 150.0,
+    "aws:ec2transitgateway/vpcAttachment:VpcAttachment": 90.0,
+    "aws:ec2transitgateway/route:Route": 5.0,
+    "aws:ec2/natGateway:NatGateway": 110.0,
+    "aws:ec2/vpcEndpoint:VpcEndpoint": 80.0,
+    "aws:ec2/vpc:Vpc": 5.0,
+    "aws:ec2/eip:Eip": 2.0,
+    "aws:ec2/flowLog:FlowLog": 5.0,
+    "aws:route53/zone:Zone": 45.0,
+    "aws:route53/record:Record": 40.0,
+    "aws:route53/resolverEndpoint:ResolverEndpoint": 120.0,
+    "aws:route53/resolverRule:ResolverRule": 30.0,
+    "aws:route53/resolverRuleAssociation:ResolverRuleAssociation": 60.0,
+    "aws:ram/resourceShare:ResourceShare": 3.0,
+    "aws:iam/role:Role": 5.0,
+    "aws:iam/instanceProfile:InstanceProfile": 10.0,
+    "aws:glue/catalogTable:CatalogTable": 3.0,
+    "pulumi:providers:aws": 0.0,
+    "pulumi:pulumi:StackReference": 1.0,
+}
+DEFAULT_LATENCY = 3.0
+
+# `depends_on` edges AWS needs although no value flows along them
+ORDERING = {
+    (
+        "aws:ec2transitgateway/vpcAttachment:VpcAttachment",
+        "aws:ec2/route:Route",
+    ),
+    ("aws:ec2/internetGateway:InternetGateway", "aws:ec2/natGateway:NatGateway"),
+}
+
+
+class Resource(NamedTuple):
+    urn: str
+    type: str
+    custom: bool
+    latency: float
+
+
+class Edge(NamedTuple):
+    source: str  # waited for
+    target: str  # waits
+    kind: str  # data, ordering, depends_on, parent or tags
+
+
+class Report(NamedTuple):
+    duration: float
+    minimum: float  # duration without the avoidable edges
+    path: List[str]
+    # Edge and how much sooner the longest chain through it ends without it
+    avoidable: List[Tuple[Edge, float]]
+
+
+def load(path: str) -> List[dict]:
+    with open(path) as f:
+        data = json.load(f)
+    # `pulumi stack export` wraps the resources in a deployment
+    return data.get("deployment", data).get("resources", [])
+
+
+def graph(
+    resources: Iterable[dict], latencies: Optional[Dict[str, float]] = None
+) -> Tuple[Dict[str, Resource], List[Edge]]:
+    latencies = {**LATENCIES, **(latencies or {})}
+    nodes = {}
+    raw = []
+    for r in resources:
+        if r["type"] == "pulumi:pulumi:Stack":
+            continue
+        custom = bool(r.get("custom"))
+        nodes[r["urn"]] = Resource(
+            r["urn"],
+            r["type"],
+            custom,
+            latencies.get(r["type"], DEFAULT_LATENCY) if custom else 0.0,
+        )
+        raw.append(r)
+
+    edges = []
+    for r in raw:
+        edges += _edges(r, nodes)
+    return nodes, edges
+
+
+def _edges(r: dict, nodes: Dict[str, Resource]) -> List[Edge]:
+    # Everything the resource `r` waits for, see Edge for the kinds
+    by_property: Dict[str, Set[str]] = {}
+    for prop, urns in (r.get("propertyDependencies") or {}).items():
+        for urn in urns:
+            by_property.setdefault(urn, set()).add(prop)
+
+    edges = []
+    for urn in sorted(set(r.get("dependencies") or []) | set(by_property)):
+        if urn in nodes and urn != r["urn"]:
+            kind = _kind(nodes[urn].type, r["type"], by_property.get(urn))
+            edges.append(Edge(urn, r["urn"], kind))
+
+    # Provider references are `<urn>::<id>`, the resource needs the provider
+    provider = (r.get("provider") or "").rsplit("::", 1)[0]
+    if provider in nodes and provider not in by_property:
+        edges.append(Edge(provider, r["urn"], "data"))
+
+    # Children register only once their parent's URN is known, for custom
+    # resources that is after the parent has been created
+    parent = r.get("parent")
+    if (
+        parent in nodes
+        and nodes[parent].custom
+        and parent not in by_property
+        and parent not in (r.get("dependencies") or [])
+    ):
+        edges.append(Edge(parent, r["urn"], "parent"))
+
+    return edges
+
+
+def _kind(source_type: str, target_type: str, props: Optional[Set[str]]) -> str:
+    if not props:
+        return "ordering" if (source_type, target_type) in ORDERING else "depends_on"
+    if props <= {"tags", "tagsAll"}:
+        return "tags"
+    return "data"
+
+
+def _schedule(
+    nodes: Dict[str, Resource], edges: List[Edge]
+) -> Tuple[List[str], Dict[str, float], Dict[str, Optional[str]]]:
+    incoming: Dict[str, List[str]] = {urn: [] for urn in nodes}
+    outgoing: Dict[str, List[str]] = {urn: [] for urn in nodes}
+    for edge in edges:
+        incoming[edge.target].append(edge.source)
+        outgoing[edge.source].append(edge.target)
+
+    # Kahn's algorithm, a resource finishes its latency after the last one it waits for
+    remaining = {urn: len(sources) for urn, sources in incoming.items()}
+    ready = [urn for urn, n in remaining.items() if n == 0]
+    order = []
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+    while ready:
+        urn = ready.pop()
+        order.append(urn)
+        start, before = 0.0, None
+        for source in incoming[urn]:
+            if finish[source] > start:
+                start, before = finish[source], source
+        finish[urn] = start + nodes[urn].latency
+        previous[urn] = before
+        for target in outgoing[urn]:
+            remaining[target] -= 1
+            if remaining[target] == 0:
+                ready.append(target)
+
+    if len(order) != len(nodes):
+        raise ValueError("the resource graph has a cycle")
+    return order, finish, previous
+
+
+def critical_path(
+    nodes: Dict[str, Resource], edges: List[Edge]
+) -> Tuple[float, List[str]]:
+    _, finish, previous = _schedule(nodes, edges)
+    if not finish:
+        return 0.0, []
+
+    end = max(finish, key=finish.get)
+    path = [end]
+    while previous[path[-1]] is not None:
+        path.append(previous[path[-1]])
+    return finish[end], path[::-1]
+
+
+def analyze(
+    resources: Iterable[dict], latencies: Optional[Dict[str, float]] = None
+) -> Report:
+    nodes, edges = graph(resources, latencies)
+    order, finish, _ = _schedule(nodes, edges)
+    duration, path = critical_path(nodes, edges)
+
+    # Longest chain from the start of a resource to the end of the deployment
+    outgoing: Dict[str, List[str]] = {urn: [] for urn in nodes}
+    incoming: Dict[str, List[Edge]] = {urn: [] for urn in nodes}
+    for edge in edges:
+        outgoing[edge.source].append(edge.target)
+        incoming[edge.target].append(edge)
+    tail: Dict[str, float] = {}
+    for urn in reversed(order):
+        tail[urn] = nodes[urn].latency + max(
+            (tail[t] for t in outgoing[urn]), default=0.0
+        )
+
+    # An edge is avoidable when it carries no data, what it costs is how much
+    # sooner the longest chain through it ends once the target stops waiting
+    avoidable = []
+    for edge in edges:
+        if edge.kind in ("data", "ordering"):
+            continue
+        through = finish[edge.source] + tail[edge.target]
+        start = max(
+            (finish[e.source] for e in incoming[edge.target] if e is not edge),
+            default=0.0,
+        )
+        saved = through - (start + tail[edge.target])
+        if saved > 0:
+            avoidable.append((edge, saved))
+
+    avoidable.sort(key=lambda item: item[1], reverse=True)
+    minimum = critical_path(
+        nodes, [e for e in edges if e.kind in ("data", "ordering")]
+    )[0]
+    return Report(duration, minimum, path, avoidable)
+
+
+def _short(urn: str) -> str:
+    # urn:pulumi:stack::project::type$type::name -> name (type)
+    parts = urn.split("::")
+    return f"{parts[-1]} ({parts[-2].split('$')[-1]})" if len(parts) >= 4 else urn
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("graph", help="checkpoint or recorded graph JSON")
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="TYPE=SECONDS",
+        help="override the creation latency of a resource type",
+    )
+    parser.add_argument("--limit", type=int, default=20, help="avoidable edges to list")
+    args = parser.parse_args()
+
+    latencies = {}
+    for item in args.latency:
+        typ, _, seconds = item.rpartition("=")
+        latencies[typ] = float(seconds)
+
+    resources = load(args.graph)
+    report = analyze(resources, latencies)
+    nodes, _ = graph(resources, latencies)
+
+    print(f"critical path: {report.duration:.0f}s over {len(report.path)} resources")
+    for urn in report.path:
+        print(f"  {nodes[urn].latency:>6.0f}s  {_short(urn)}")
+
+    if not report.avoidable:
+        print("no avoidable edges")
+        return
+    print(
+        f"{len(report.avoidable)} avoidable edges, {report.minimum:.0f}s "
+        "without them:"
+    )
+    for edge, saved in report.avoidable[: args.limit]:
+        print(
+            f"  {saved:>6.0f}s  {edge.kind:<10} {_short(edge.source)} -> {_short(edge.target)}"
+        )
+    if len(report.avoidable) > args.limit:
+        print(f"  ... and {len(report.avoidable) - args.limit} more")
+    sys.exit(1 if report.minimum < report.duration else 0)
+
+
+if __name__ == "__main__":
+    main()
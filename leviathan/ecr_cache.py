@@ -0,0 +1,160 @@
+from typing import Dict, Iterable, Optional
+from pulumi import ComponentResource, ResourceOptions
+import pulumi
+import pulumi_aws as aws
+from leviathan import exports, policy, tracing
+
+# Upstream registries ECR caches without credentials, by repository prefix.
+# Docker Hub, GitHub and Azure need a Secrets Manager credential on the rule,
+# which pulumi-aws 5 does not support yet.
+UPSTREAMS = {
+    "ecr-public": "public.ecr.aws",
+    "quay": "quay.io",
+    "k8s": "registry.k8s.io",
+}
+
+PULL_ACTIONS = [
+    "ecr:BatchCheckLayerAvailability",
+    "ecr:BatchGetImage",
+    "ecr:GetDownloadUrlForLayer",
+]
+
+
+class EcrPullThroughCache(ComponentResource):
+    """Pull through cache of public registries in the networking account.
+
+    Spokes pull `<registry>/<prefix>/<image>` over their `ecr.dkr`, `ecr.api`
+    and S3 gateway endpoints, so images stay on the AWS backbone and only the
+    first pull of a tag leaves through the NAT Gateways, from ECR itself.
+
+    Every account of the organization may create cached repositories and import
+    upstream images. Repositories the cache creates have no policy of their own,
+    the ones listed in `repositories` (e.g. `ecr-public/nginx/nginx`) are
+    created up front with an organization wide pull policy, the cache fills
+    them on the first pull. The cached prefixes are replicated to
+    `replica_regions`.
+    """
+
+    @tracing.traced
+    def __init__(
+        self,
+        name: str,
+        registry_id: pulumi.Input[str],
+        organization_id: pulumi.Input[str],
+        region: str,
+        upstreams: Optional[Dict[str, str]] = None,
+        repositories: Iterable[str] = (),
+        replica_regions: Iterable[str] = (),
+        opts=None,
+    ) -> None:
+        # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
+        super().__init__("pkg:leviathan:ecr_cache", name, None, opts=opts)
+        # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
+        child_opts = ResourceOptions(parent=self, providers=opts.providers)
+
+        self.registry_id = registry_id
+        self.region = region
+        self.upstreams = dict(upstreams or UPSTREAMS)
+        in_organization = policy.condition(
+            "StringEquals", "aws:PrincipalOrgID", organization_id
+        )
+        everyone = policy.Principal("AWS", ("*",))
+
+        for prefix, upstream in sorted(self.upstreams.items()):
+            aws.ecr.PullThroughCacheRule(
+                f"{name}-{prefix}-cache",
+                ecr_repository_prefix=prefix,
+                upstream_registry_url=upstream,
+                opts=child_opts,
+            )
+
+        aws.ecr.RegistryPolicy(
+            f"{name}-registry-policy",
+            policy=policy.document(
+                policy.allow(
+                    ["ecr:BatchImportUpstreamImage", "ecr:CreateRepository"],
+                    resources=[
+                        pulumi.Output.concat(
+                            "arn:aws:ecr:",
+                            region,
+                            ":",
+                            registry_id,
+                            f":repository/{prefix}/*",
+                        )
+                        for prefix in sorted(self.upstreams)
+                    ],
+                    principals=[everyone],
+                    conditions=[in_organization],
+                    sid="OrganizationPullThroughCache",
+                ),
+                kind="registry",
+            ),
+            opts=child_opts,
+        )
+
+        pull_policy = policy.document(
+            policy.allow(
+                PULL_ACTIONS,
+                principals=[everyone],
+                conditions=[in_organization],
+                sid="OrganizationPull",
+            ),
+            kind="repository",
+        )
+        for repository in repositories:
+            if repository.split("/", 1)[0] not in self.upstreams:
+                raise ValueError(
+                    f"{repository} is not under a cached prefix "
+                    f"({', '.join(sorted(self.upstreams))})"
+                )
+            cached = aws.ecr.Repository(
+                f"{name}-{repository.replace('/', '-')}",
+                name=repository,
+                image_scanning_configuration=aws.ecr.RepositoryImageScanningConfigurationArgs(
+                    scan_on_push=True
+                ),
+                opts=child_opts,
+            )
+            aws.ecr.RepositoryPolicy(
+                f"{name}-{repository.replace('/', '-')}-policy",
+                repository=cached.name,
+                policy=pull_policy,
+                opts=ResourceOptions(parent=cached, providers=opts.providers),
+            )
+
+        replica_regions = [r for r in replica_regions if r != region]
+        if replica_regions:
+            aws.ecr.ReplicationConfiguration(
+                f"{name}-replication",
+                replication_configuration=aws.ecr.ReplicationConfigurationReplicationConfigurationArgs(
+                    rules=[
+                        aws.ecr.ReplicationConfigurationReplicationConfigurationRuleArgs(
+                            destinations=[
+                                aws.ecr.ReplicationConfigurationReplicationConfigurationRuleDestinationArgs(
+                                    region=replica, registry_id=registry_id
+                                )
+                                for replica in replica_regions
+                            ],
+                            repository_filters=[
+                                aws.ecr.ReplicationConfigurationReplicationConfigurationRuleRepositoryFilterArgs(
+                                    filter=prefix, filter_type="PREFIX_MATCH"
+                                )
+                                for prefix in sorted(self.upstreams)
+                            ],
+                        )
+                    ]
+                ),
+                opts=child_opts,
+            )
+
+        self.register_outputs({})
+
+    def to_export(self) -> dict:
+        return exports.versioned(
+            {
+                "registry": pulumi.Output.concat(
+                    self.registry_id, ".dkr.ecr.", self.region, ".amazonaws.com"
+                ),
+                "upstreams": self.upstreams,
+            }
+        )
@@ -0,0 +1,240 @@
+from typing import Iterable, List, Optional, Tuple
+from pulumi import ComponentResource, ResourceOptions
+import pulumi
+import pulumi_aws as aws
+from leviathan import exports, tracing
+from leviathan.configuration import cidrs
+from leviathan.vpc import Vpc
+
+# Always created in the spoke VPC itself, they cost nothing and use no ENIs
+GATEWAY_ENDPOINTS = ["s3", "dynamodb"]
+
+# Services whose private DNS names (ecs-a-*.<region>.amazonaws.com, ...) cannot be
+# served from a hosted zone of their own, spokes keep these as local endpoints
+LOCAL_ENDPOINTS = ["ecs-agent", "ecs-telemetry"]
+
+
+def is_shared(service: str) -> bool:
+    return service not in GATEWAY_ENDPOINTS and service not in LOCAL_ENDPOINTS
+
+
+def private_dns_name(service: str, region: str) -> Tuple[str, str]:
+    # Hosted zone and record that replace the private DNS name of the endpoint
+    if service == "ecr.dkr":
+        return f"dkr.ecr.{region}.amazonaws.com", "*"
+    if service == "ecr.api":
+        return f"api.ecr.{region}.amazonaws.com", ""
+    return f"{service}.{region}.amazonaws.com", ""
+
+
+class SharedEndpoints(ComponentResource):
+    """Interface endpoints hosted once in the networking VPC for every spoke.
+
+    Each endpoint gets a private hosted zone in place of its private DNS name,
+    pointing at the endpoint ENIs in every AZ of the networking VPC. A Route 53
+    Resolver rule per zone, shared with the organization, forwards the spoke
+    queries to the networking VPC, and the traffic itself flows over the TGW.
+
+    In a dual-stack networking VPC the endpoints are dual-stack too, the zones
+    get AAAA records next to the A records, and `ipv6_prefix_list_id` (the
+    IPv6 blocks of the environments) may reach them over IPv6.
+    """
+
+    @tracing.traced
+    def __init__(
+        self,
+        name: str,
+        vpc: Vpc,
+        services: Iterable[str],
+        organization_arn: pulumi.Input[str],
+        region: str,
+        ipv6_prefix_list_id: Optional[pulumi.Input[str]] = None,
+        opts=None,
+    ) -> None:
+        # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
+        super().__init__("pkg:leviathan:endpoints", name, None, opts=opts)
+        # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
+        child_opts = ResourceOptions(parent=self, providers=opts.providers)
+
+        self.endpoint_sg = aws.ec2.SecurityGroup(
+            f"{name}-shared-endpoint-sg",
+            description="Allow TLS inbound traffic for shared Endpoints",
+            vpc_id=vpc.id,
+            ingress=[
+                aws.ec2.SecurityGroupIngressArgs(
+                    description="TLS from every environment",
+                    from_port=443,
+                    to_port=443,
+                    protocol="tcp",
+                    cidr_blocks=[cidrs.DEFAULT_CIDR_BLOCK],
+                )
+            ]
+            + (
+                [
+                    aws.ec2.SecurityGroupIngressArgs(
+                        description="TLS from every environment over IPv6",
+                        from_port=443,
+                        to_port=443,
+                        protocol="tcp",
+                        prefix_list_ids=[ipv6_prefix_list_id],
+                    )
+                ]
+                if vpc.dual_stack and ipv6_prefix_list_id is not None
+                else []
+            ),
+            egress=[
+                aws.ec2.SecurityGroupEgressArgs(
+                    from_port=0,
+                    to_port=0,
+                    protocol="-1",
+                    cidr_blocks=[cidrs.EVERYWHERE],
+                )
+            ],
+            opts=child_opts,
+        )
+
+        self._resolver_endpoints(name, vpc, child_opts)
+
+        ram_resource_share = aws.ram.ResourceShare(
+            f"{name}-resolver-rules-share",
+            allow_external_principals=False,
+            opts=child_opts,
+        )
+
+        aws.ram.PrincipalAssociation(
+            f"{name}-resolver-rules-share-principal-assoc",
+            principal=organization_arn,
+            resource_share_arn=ram_resource_share.arn,
+            opts=ResourceOptions(parent=ram_resource_share, providers=opts.providers),
+        )
+
+        record_types = ["A", "AAAA"] if vpc.dual_stack else ["A"]
+        self.resolver_rules = {}
+        for service in services:
+            endpoint = aws.ec2.VpcEndpoint(
+                f"{name}-{service}",
+                private_dns_enabled=False,
+                security_group_ids=[self.endpoint_sg.id],
+                service_name=f"com.amazonaws.{region}.{service}",
+                subnet_ids=[subnet.id for subnet in vpc.private_subnets],
+                vpc_endpoint_type="Interface",
+                vpc_id=vpc.id,
+                ip_address_type="dualstack" if vpc.dual_stack else None,
+                dns_options=(
+                    aws.ec2.VpcEndpointDnsOptionsArgs(dns_record_ip_type="dualstack")
+                    if vpc.dual_stack
+                    else None
+                ),
+                opts=child_opts,
+            )
+
+            zone_name, record_name = private_dns_name(service, region)
+            zone = aws.route53.Zone(
+                f"{name}-{service}-zone",
+                name=zone_name,
+                comment=f"Shared {service} endpoint",
+                vpcs=[aws.route53.ZoneVpcArgs(vpc_id=vpc.id)],
+                opts=ResourceOptions(parent=endpoint, providers=opts.providers),
+            )
+
+            # The regional DNS entry of the endpoint answers with its ENIs in every
+            # AZ, with their IPv6 addresses as well for a dual-stack endpoint
+            for record_type in record_types:
+                aws.route53.Record(
+                    f"{name}-{service}-record"
+                    + ("-aaaa" if record_type == "AAAA" else ""),
+                    zone_id=zone.zone_id,
+                    name=f"{record_name}.{zone_name}" if record_name else zone_name,
+                    type=record_type,
+                    aliases=[
+                        aws.route53.RecordAliasArgs(
+                            name=endpoint.dns_entries.apply(lambda e: e[0].dns_name),
+                            zone_id=endpoint.dns_entries.apply(
+                                lambda e: e[0].hosted_zone_id
+                            ),
+                            evaluate_target_health=True,
+                        )
+                    ],
+                    opts=ResourceOptions(parent=zone, providers=opts.providers),
+                )
+
+            rule = aws.route53.ResolverRule(
+                f"{name}-{service}-resolver-rule",
+                domain_name=zone_name,
+                rule_type="FORWARD",
+                resolver_endpoint_id=self.outbound_endpoint.id,
+                target_ips=self.inbound_endpoint.ip_addresses.apply(
+                    lambda addresses: [
+                        aws.route53.ResolverRuleTargetIpArgs(ip=a.ip) for a in addresses
+                    ]
+                ),
+                tags={"Name": f"{name}-{service}"},
+                opts=ResourceOptions(parent=zone, providers=opts.providers),
+            )
+
+            aws.ram.ResourceAssociation(
+                f"{name}-{service}-resolver-rule-resource-assoc",
+                resource_arn=rule.arn,
+                resource_share_arn=ram_resource_share.arn,
+                opts=ResourceOptions(parent=rule, providers=opts.providers),
+            )
+
+            self.resolver_rules[service] = rule.id
+
+        self.register_outputs({})
+
+    def to_export(self) -> dict:
+        return exports.versioned({"resolver_rules": self.resolver_rules})
+
+    def _resolver_endpoints(self, name: str, vpc: Vpc, opts: ResourceOptions):
+        # Forwarded queries leave through the outbound endpoint and are answered by
+        # the VPC resolver behind the inbound one, both with an ENI in every AZ
+        resolver_sg = aws.ec2.SecurityGroup(
+            f"{name}-resolver-sg",
+            description="Allow DNS between the Route 53 Resolver endpoints",
+            vpc_id=vpc.id,
+            ingress=[
+                aws.ec2.SecurityGroupIngressArgs(
+                    description=f"DNS over {protocol} from VPC",
+                    from_port=53,
+                    to_port=53,
+                    protocol=protocol,
+                    cidr_blocks=[vpc.cidr_block],
+                )
+                for protocol in ("tcp", "udp")
+            ],
+            egress=[
+                aws.ec2.SecurityGroupEgressArgs(
+                    description=f"DNS over {protocol} to VPC",
+                    from_port=53,
+                    to_port=53,
+                    protocol=protocol,
+                    cidr_blocks=[vpc.cidr_block],
+                )
+                for protocol in ("tcp", "udp")
+            ],
+            opts=opts,
+        )
+
+        ip_addresses: List[aws.route53.ResolverEndpointIpAddressArgs] = [
+            aws.route53.ResolverEndpointIpAddressArgs(subnet_id=subnet.id)
+            for subnet in vpc.private_subnets
+        ]
+
+        self.inbound_endpoint = aws.route53.ResolverEndpoint(
+            f"{name}-resolver-inbound",
+            direction="INBOUND",
+            ip_addresses=ip_addresses,
+            security_group_ids=[resolver_sg.id],
+            tags={"Name": f"{name}-resolver-inbound"},
+            opts=ResourceOptions(parent=resolver_sg, providers=opts.providers),
+        )
+
+        self.outbound_endpoint = aws.route53.ResolverEndpoint(
+            f"{name}-resolver-outbound",
+            direction="OUTBOUND",
+            ip_addresses=ip_addresses,
+            security_group_ids=[resolver_sg.id],
+            tags={"Name": f"{name}-resolver-outbound"},
+            opts=ResourceOptions(parent=resolver_sg, providers=opts.providers),
+        )
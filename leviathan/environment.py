@@ -1,63 +1,127 @@
+from typing import Iterable, List, Optional
 from pulumi import ComponentResource, ResourceOptions, Config
-import pulumi_aws as aws
-from leviathan import consts
+from leviathan import consts, exports, ipam, providers, stack_refs, tracing
+from leviathan import regions as regions_module
 from leviathan.account import Account
 from leviathan.vpc import Vpc
 from leviathan.routing import Routing
 from leviathan.iam import Iam
-from leviathan.configuration import cidrs
 
 
 class Environment(ComponentResource):
-    def __init__(self, name: str) -> None:
+    @tracing.traced
+    def __init__(
+        self,
+        name: str,
+        endpoints: Optional[List[str]] = None,
+        availability_zones: Optional[int] = None,
+        features: Iterable[str] = consts.DefaultFeatures,
+        account: Optional[Account] = None,
+        regions: Optional[List[str]] = None,
+    ) -> None:
         # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
         super().__init__("pkg:leviathan:environment", name, None, opts=None)
         # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
         child_opts = ResourceOptions(parent=self)
+        self.name = name
 
-        account = Account(name, child_opts)
+        # A pool account (see leviathan.account_pool) already exists, so nothing
+        # below waits for an account to be created
+        if account is None:
+            account = Account(name, child_opts)
 
         self.account = account
 
         # Create an AWS provider with assumed OrganizationAccessRole for this specific account
-        config = Config("aws")
-        region = config.require("region")
         role_to_assume = account.account.id.apply(
             lambda v: f"arn:aws:iam::{v}:role/{consts.OrganizationAccountAccessRoleName}"
         )
 
-        provider = aws.Provider(
-            f"{name}_aws_provider",
-            assume_role=aws.ProviderAssumeRoleArgs(
-                role_arn=role_to_assume, session_name="leviathan"
-            ),
-            region=region,
-            opts=child_opts,
-        )
+        # With `flow_logs: central` the VPCs deliver to the networking account archive
+        flow_log_destination = None
+        if Config().get("flow_logs") == "central":
+            flow_log_destination = stack_refs.networking().flow_log_bucket_arn
 
-        # All child resources will use the provider
-        child_opts = ResourceOptions(parent=self, providers={"aws": provider})
+        # A VPC in the primary region and in every other region listed, each
+        # attached to the hub of its own region. The primary region keeps the
+        # names environments had before there were regions.
+        primary_region = regions_module.primary()
+        self.regions = {}
+        for region in [primary_region] + [
+            r for r in regions or [] if r != primary_region
+        ]:
+            suffix = regions_module.suffix(region)
+            with tracing.default().span(
+                f"{name}_aws_provider{suffix}", kind="provider"
+            ):
+                provider = providers.assume_role_provider(
+                    f"{name}_aws_provider{suffix}",
+                    role_to_assume,
+                    region,
+                    opts=child_opts,
+                )
 
-        self.vpc = Vpc(
-            name, eval(f"cidrs.CIDR_PREFIX_{name.upper()}"), child_opts, is_public=False
-        )
+            # The environment's Transit Gateway route table (`tgw_route_domains`)
+            # lives in the networking account that owns the Transit Gateway
+            hub_provider = None
+            if Config().get_bool("tgw_route_domains"):
+                hub_provider = providers.assume_role_provider(
+                    f"{name}_networking_aws_provider{suffix}",
+                    stack_refs.networking()
+                    .regional(region, "routing", "transit_gateway_owner_id")
+                    .apply(
+                        lambda v: f"arn:aws:iam::{v}:role/{consts.OrganizationAccountAccessRoleName}"
+                    ),
+                    region,
+                    opts=child_opts,
+                )
 
-        self.routing = Routing(
-            self.vpc,
-            child_opts,
-            endpoints=[
-                "ec2",
-                "ec2messages",
-                "ssm",
-                "ssmmessages",
-                "s3",
-                "ecr.dkr",
-                "ecs",
-                "ecs-agent",
-                "ecs-telemetry",
-            ],
-        )
+            # All child resources will use the provider
+            region_opts = ResourceOptions(parent=self, providers={"aws": provider})
+            vpc = Vpc(
+                f"{name}{suffix}",
+                ipam.default().vpc_cidr(f"{name}{suffix}"),
+                region_opts,
+                is_public=False,
+                availability_zones=availability_zones,
+                flow_logs="flow_logs" in features,
+                flow_log_destination=flow_log_destination,
+                dual_stack="dual_stack" in features,
+                region=region,
+            )
+            routing = Routing(
+                vpc,
+                region_opts,
+                endpoints=consts.DefaultEndpoints if endpoints is None else endpoints,
+                region=region,
+                hub_provider=hub_provider,
+            )
+            self.regions[region] = (vpc, routing)
+            if region == primary_region:
+                self.vpc, self.routing = vpc, routing
+                # IAM is global, it goes with the primary region
+                iam_opts = region_opts
 
-        Iam(name, child_opts)
+        self.iam = Iam(name, iam_opts) if "iam" in features else None
 
         self.register_outputs({"account": self.account, "vpc": self.vpc})
+
+    def to_export(self) -> dict:
+        # Only the ids, ARNs and CIDRs other stacks need, see leviathan.exports
+        return exports.versioned(
+            {
+                "name": self.name,
+                "account": self.account.to_export(),
+                "vpc": self.vpc.to_export(),
+                "routing": self.routing.to_export(),
+                "iam": self.iam.to_export() if self.iam is not None else None,
+                "regions": {
+                    region: exports.versioned(
+                        {"vpc": vpc.to_export(), "routing": routing.to_export()}
+                    )
+                    for region, (vpc, routing) in self.regions.items()
+                    if region != regions_module.primary()
+                }
+                or None,
+            }
+        )
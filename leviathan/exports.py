@@ -0,0 +1,136 @@
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Type, TypeVar
+
+# Bumped whenever a field is renamed or removed, consumers refuse newer exports
+SCHEMA_VERSION = 1
+
+T = TypeVar("T", bound=tuple)
+
+
+class ExportSchemaError(Exception):
+    pass
+
+
+def versioned(fields: Dict[str, Any]) -> Dict[str, Any]:
+    return {"schema_version": SCHEMA_VERSION, **fields}
+
+
+def load(view: Type[T], data: Optional[Mapping[str, Any]]) -> Optional[T]:
+    """Rebuilds a read-only view from an exported value.
+
+    Fields missing from `data` (exports of an older minor revision) are None,
+    nested views, and maps of them, are rebuilt from their own exported values.
+    """
+    if data is None:
+        return None
+    version = data.get("schema_version")
+    if version != SCHEMA_VERSION:
+        raise ExportSchemaError(
+            f"{view.__name__}: export schema {version}, expected {SCHEMA_VERSION}"
+        )
+
+    nested = getattr(view, "_nested", {})
+    nested_maps = getattr(view, "_nested_maps", {})
+
+    def field_value(field: str) -> Any:
+        value = data.get(field)
+        if field in nested:
+            return load(nested[field], value)
+        if field in nested_maps and value is not None:
+            return {k: load(nested_maps[field], v) for k, v in value.items()}
+        return value
+
+    return view(**{field: field_value(field) for field in view._fields})
+
+
+class AccountExport(NamedTuple):
+    name: str
+    id: str
+    role_name: str
+
+
+class AccountPoolExport(NamedTuple):
+    size: int
+    free: List[str]
+    claims: Dict[str, str]
+    # Slots and claims, read back by leviathan.account_pool
+    state: Optional[Dict[str, Any]]
+
+
+class VpcExport(NamedTuple):
+    id: str
+    cidr_block: str
+    ipv6_cidr_block: Optional[str]
+    availability_zones: List[str]
+    private_subnets: List[str]
+    public_subnets: List[str]
+    private_cidrs: List[str]
+    public_cidrs: List[str]
+
+
+class RoutingExport(NamedTuple):
+    transit_gateway_attachment_id: str
+    private_route_table_id: str
+    # Route table of the environment's route domain, see `tgw_route_domains`
+    transit_gateway_route_table_id: Optional[str]
+
+
+class NetworkingRoutingExport(NamedTuple):
+    transit_gateway_id: str
+    transit_gateway_arn: str
+    transit_gateway_owner_id: str
+    # Attachment of the hub VPC and the route table it is associated with
+    transit_gateway_attachment_id: str
+    transit_gateway_route_table_id: str
+    environments_prefix_list_id: str
+    # Site-to-Site VPN of the primary hub, see leviathan.vpn
+    vpn_attachment_ids: List[str]
+    onprem_prefix_list_id: Optional[str]
+    internet_gateway_id: str
+    nat_gateway_ids: List[str]
+
+
+class FlowLogArchiveExport(NamedTuple):
+    bucket_arn: str
+    database: str
+    table: str
+
+
+class SharedEndpointsExport(NamedTuple):
+    resolver_rules: Dict[str, str]
+
+
+class IamExport(NamedTuple):
+    role_arn: str
+    instance_profile: str
+
+
+class RegionExport(NamedTuple):
+    vpc: VpcExport
+    routing: RoutingExport
+
+    _nested = {"vpc": VpcExport, "routing": RoutingExport}
+
+
+class EnvironmentExport(NamedTuple):
+    name: str
+    account: AccountExport
+    vpc: VpcExport  # in the primary region
+    routing: RoutingExport
+    iam: Optional[IamExport]
+    # The other regions of the environment, see leviathan.regions
+    regions: Optional[Dict[str, RegionExport]]
+
+    _nested = {
+        "account": AccountExport,
+        "vpc": VpcExport,
+        "routing": RoutingExport,
+        "iam": IamExport,
+    }
+    _nested_maps = {"regions": RegionExport}
+
+    def vpc_in(self, region: str, primary: str) -> Optional[VpcExport]:
+        if region == primary:
+            return self.vpc
+        if self.regions and region in self.regions:
+            return self.regions[region].vpc
+        return None
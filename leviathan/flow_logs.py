@@ -0,0 +1,181 @@
+from typing import List
+from pulumi import ComponentResource, ResourceOptions, Output
+import pulumi
+import pulumi_aws as aws
+from leviathan import exports, policy, tracing
+
+# Columns of the default (version 2) flow log record format
+FLOW_LOG_COLUMNS = [
+    ("version", "int"),
+    ("account_id", "string"),
+    ("interface_id", "string"),
+    ("srcaddr", "string"),
+    ("dstaddr", "string"),
+    ("srcport", "int"),
+    ("dstport", "int"),
+    ("protocol", "bigint"),
+    ("packets", "bigint"),
+    ("bytes", "bigint"),
+    ("start", "bigint"),
+    ("end", "bigint"),
+    ("action", "string"),
+    ("log_status", "string"),
+]
+
+PARTITION_KEYS = [
+    "vpc_id",
+    "aws_account_id",
+    "aws_region",
+    "year",
+    "month",
+    "day",
+    "hour",
+]
+
+
+class FlowLogArchive(ComponentResource):
+    """Central, Athena queryable bucket for the Parquet flow logs of every VPC.
+
+    VPCs deliver to `<bucket>/<vpc id>/` with Hive compatible partitions. The Glue
+    table uses partition projection, so queries filtering on vpc_id,
+    aws_account_id and year/month/day/hour only read the matching prefixes and no
+    partitions ever need to be registered. VPCs of every one of `regions`
+    deliver here, they are the values aws_region is projected to.
+    """
+
+    @tracing.traced
+    def __init__(
+        self,
+        name: str,
+        organization_id: pulumi.Input[str],
+        regions: List[str],
+        opts=None,
+    ) -> None:
+        # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
+        super().__init__("pkg:leviathan:flow_logs", name, None, opts=opts)
+        # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
+        child_opts = ResourceOptions(parent=self, providers=opts.providers)
+
+        self.bucket = aws.s3.Bucket(
+            f"{name}-flowlog-archive",
+            acl="private",
+            tags={"Name": f"{name}-flowlog-archive"},
+            opts=child_opts,
+        )
+
+        aws.s3.BucketPublicAccessBlock(
+            f"{name}-flowlog-archive-public-access-block",
+            bucket=self.bucket.id,
+            block_public_acls=True,
+            block_public_policy=True,
+            ignore_public_acls=True,
+            restrict_public_buckets=True,
+            opts=ResourceOptions(parent=self.bucket, providers=opts.providers),
+        )
+
+        # Log delivery from every account of the organization
+        aws.s3.BucketPolicy(
+            f"{name}-flowlog-archive-policy",
+            bucket=self.bucket.id,
+            policy=policy.document(
+                policy.allow(
+                    ["s3:PutObject"],
+                    resources=[Output.concat(self.bucket.arn, "/*")],
+                    principals=[policy.service("delivery.logs.amazonaws.com")],
+                    conditions=[
+                        policy.condition(
+                            "StringEquals",
+                            "s3:x-amz-acl",
+                            "bucket-owner-full-control",
+                        ),
+                        policy.condition(
+                            "StringEquals", "aws:SourceOrgID", organization_id
+                        ),
+                    ],
+                    sid="AWSLogDeliveryWrite",
+                ),
+                policy.allow(
+                    ["s3:GetBucketAcl", "s3:ListBucket"],
+                    resources=[self.bucket.arn],
+                    principals=[policy.service("delivery.logs.amazonaws.com")],
+                    conditions=[
+                        policy.condition(
+                            "StringEquals", "aws:SourceOrgID", organization_id
+                        )
+                    ],
+                    sid="AWSLogDeliveryAclCheck",
+                ),
+                kind="bucket",
+            ),
+            opts=ResourceOptions(parent=self.bucket, providers=opts.providers),
+        )
+
+        self.database = aws.glue.CatalogDatabase(
+            f"{name}-flowlog-database",
+            name=f"{name}_flow_logs",
+            opts=child_opts,
+        )
+
+        location = Output.concat("s3://", self.bucket.bucket, "/")
+        location_template = Output.concat(
+            location,
+            "${vpc_id}/AWSLogs/aws-account-id=${aws_account_id}/aws-service=vpcflowlogs",
+            "/aws-region=${aws_region}/year=${year}/month=${month}/day=${day}/hour=${hour}",
+        )
+
+        self.table = aws.glue.CatalogTable(
+            f"{name}-flowlog-table",
+            name="vpc_flow_logs",
+            database_name=self.database.name,
+            table_type="EXTERNAL_TABLE",
+            parameters={
+                "EXTERNAL": "TRUE",
+                "classification": "parquet",
+                "parquet.compression": "SNAPPY",
+                "projection.enabled": "true",
+                "projection.vpc_id.type": "injected",
+                "projection.aws_account_id.type": "injected",
+                "projection.aws_region.type": "enum",
+                "projection.aws_region.values": ",".join(regions),
+                "projection.year.type": "integer",
+                "projection.year.range": "2020,2100",
+                "projection.month.type": "integer",
+                "projection.month.range": "1,12",
+                "projection.month.digits": "2",
+                "projection.day.type": "integer",
+                "projection.day.range": "1,31",
+                "projection.day.digits": "2",
+                "projection.hour.type": "integer",
+                "projection.hour.range": "0,23",
+                "projection.hour.digits": "2",
+                "storage.location.template": location_template,
+            },
+            partition_keys=[
+                aws.glue.CatalogTablePartitionKeyArgs(name=key, type="string")
+                for key in PARTITION_KEYS
+            ],
+            storage_descriptor=aws.glue.CatalogTableStorageDescriptorArgs(
+                location=location,
+                input_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+                output_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+                ser_de_info=aws.glue.CatalogTableStorageDescriptorSerDeInfoArgs(
+                    serialization_library="org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe",
+                ),
+                columns=[
+                    aws.glue.CatalogTableStorageDescriptorColumnArgs(name=n, type=t)
+                    for n, t in FLOW_LOG_COLUMNS
+                ],
+            ),
+            opts=ResourceOptions(parent=self.database, providers=opts.providers),
+        )
+
+        self.register_outputs({})
+
+    def to_export(self) -> dict:
+        return exports.versioned(
+            {
+                "bucket_arn": self.bucket.arn,
+                "database": self.database.name,
+                "table": self.table.name,
+            }
+        )
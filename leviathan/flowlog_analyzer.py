@@ -0,0 +1,354 @@
+"""Streams VPC flow log files and summarizes where the bytes go.
+
+Reads the default (version 2) plain text format written by `Vpc`, plain or
+gzipped, in fixed size chunks and aggregates every chunk with NumPy, so memory
+stays bounded by the chunk size and the number of tracked talker pairs.
+
+    python -m leviathan.flowlog_analyzer logs/*.log.gz --stack-outputs root.json
+"""
+
+import argparse
+import gzip
+import ipaddress
+import itertools
+import json
+import socket
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from leviathan import exports
+from leviathan.configuration import cidrs
+
+FIELDS = 14
+SRCADDR, DSTADDR, BYTES, ACTION = 3, 4, 9, 12
+
+PRIVATE_RANGES = [
+    ipaddress.ip_network(cidrs.DEFAULT_CIDR_BLOCK),
+    ipaddress.ip_network("172.16.0.0/12"),
+    ipaddress.ip_network("192.168.0.0/16"),
+]
+
+
+class RangeMap:
+    """Maps IPv4 addresses to the code of the (disjoint) CIDR block holding them."""
+
+    def __init__(self, blocks: Iterable[Tuple[str, int]]) -> None:
+        blocks = sorted((ipaddress.ip_network(cidr), code) for cidr, code in blocks)
+        for (a, _), (b, _) in zip(blocks, blocks[1:]):
+            if a.overlaps(b):
+                raise ValueError(f"{a} overlaps {b}")
+
+        self._starts = np.array(
+            [int(n.network_address) for n, _ in blocks], dtype=np.uint32
+        )
+        self._ends = np.array(
+            [int(n.broadcast_address) for n, _ in blocks], dtype=np.uint32
+        )
+        self._codes = np.array([code for _, code in blocks], dtype=np.int64)
+
+    def lookup(self, addresses: np.ndarray) -> np.ndarray:
+        # Code of the block holding every address, -1 where there is none
+        if len(self._codes) == 0:
+            return np.full(len(addresses), -1, dtype=np.int64)
+        index = np.searchsorted(self._starts, addresses, side="right") - 1
+        index = np.maximum(index, 0)
+        found = (addresses >= self._starts[index]) & (addresses <= self._ends[index])
+        return np.where(found, self._codes[index], -1)
+
+
+class Topology:
+    """Subnets, VPCs and AZs of the stacks the flow logs were collected from."""
+
+    def __init__(self) -> None:
+        self.subnets: List[Tuple[str, str, str, str]] = []  # cidr, vpc, az, tier
+        self.vpcs: List[Tuple[str, str]] = []  # cidr, name
+        self.services: List[Tuple[str, str]] = []  # cidr, AWS service
+
+    def add_stack_outputs(self, path: str) -> None:
+        # `pulumi stack output --json` of the root stack (`environments`) or of the
+        # networking stack (`vpc_info`), see leviathan.exports for the schema
+        with open(path) as f:
+            outputs = json.load(f)
+
+        for name, data in sorted((outputs.get("environments") or {}).items()):
+            environment = exports.load(exports.EnvironmentExport, data)
+            self.add_vpc(environment.vpc, name)
+            for region, regional in sorted((environment.regions or {}).items()):
+                self.add_vpc(regional.vpc, f"{name}-{region}")
+
+        if "vpc_info" in outputs:
+            self.add_vpc(
+                exports.load(exports.VpcExport, outputs["vpc_info"]), "networking"
+            )
+        for region, hub in sorted((outputs.get("regions") or {}).items()):
+            if "vpc_info" in hub:
+                self.add_vpc(
+                    exports.load(exports.VpcExport, hub["vpc_info"]),
+                    f"networking-{region}",
+                )
+
+    def add_vpc(self, vpc: Optional[exports.VpcExport], name: str) -> None:
+        if vpc is None:
+            return
+        self.vpcs.append((vpc.cidr_block, name))
+        availability_zones = vpc.availability_zones or []
+        for tier, tier_cidrs in (
+            ("private", vpc.private_cidrs),
+            ("public", vpc.public_cidrs),
+        ):
+            for index, cidr in enumerate(tier_cidrs or []):
+                az = (
+                    availability_zones[index]
+                    if index < len(availability_zones)
+                    else "?"
+                )
+                self.subnets.append((cidr, name, az, tier))
+
+    def add_aws_ip_ranges(self, path: str, services=("S3", "DYNAMODB")) -> None:
+        # https://ip-ranges.amazonaws.com/ip-ranges.json, to tell gateway endpoint
+        # eligible traffic apart from the rest of the internet
+        with open(path) as f:
+            prefixes = json.load(f)["prefixes"]
+
+        networks = {}
+        for prefix in prefixes:
+            if prefix["service"] in services:
+                networks.setdefault(prefix["ip_prefix"], prefix["service"].lower())
+        collapsed = []
+        for service in set(networks.values()):
+            blocks = [
+                ipaddress.ip_network(c) for c, s in networks.items() if s == service
+            ]
+            collapsed += [
+                (str(n), service) for n in ipaddress.collapse_addresses(blocks)
+            ]
+        self.services = collapsed
+
+
+class Aggregator:
+    def __init__(self, topology: Topology, max_pairs: int = 1_000_000) -> None:
+        self.topology = topology
+        self.max_pairs = max_pairs
+        self.approximate = False
+
+        self._subnets = RangeMap((s[0], i) for i, s in enumerate(topology.subnets))
+        self._vpcs = RangeMap((v[0], i) for i, v in enumerate(topology.vpcs))
+        self._services = RangeMap((s[0], i) for i, s in enumerate(topology.services))
+        self._private = RangeMap((str(n), 0) for n in PRIVATE_RANGES)
+
+        # Destination labels, in the order of the codes used by _add_destinations
+        self._labels = [f"subnet {s[0]} ({s[2]})" for s in topology.subnets]
+        self._labels += [f"vpc {name} ({cidr})" for cidr, name in topology.vpcs]
+        self._labels += [f"aws {service}" for _, service in topology.services]
+        self._labels += ["internet", "other private"]
+
+        azs = sorted({s[2] for s in topology.subnets})
+        self._subnet_az = np.array([azs.index(s[2]) for s in topology.subnets] or [0])
+        self._subnet_private = np.array(
+            [s[3] == "private" for s in topology.subnets] or [False]
+        )
+
+        self.records = 0
+        self.skipped = 0
+        self.total_bytes = 0
+        self.cross_az_bytes = 0
+        self.nat_bytes = 0
+        self.rejected_bytes = 0
+        self.destination_bytes: Dict[str, int] = {}
+        self.pairs: Dict[int, int] = {}
+
+    def add(
+        self, src: np.ndarray, dst: np.ndarray, nbytes: np.ndarray, accepted: np.ndarray
+    ) -> None:
+        self.records += len(src)
+        self.total_bytes += int(nbytes.sum())
+        self.rejected_bytes += int(nbytes[~accepted].sum())
+
+        src, dst, nbytes = src[accepted], dst[accepted], nbytes[accepted]
+
+        src_subnet = self._subnets.lookup(src)
+        dst_subnet = self._subnets.lookup(dst)
+
+        # Both ends in known subnets, in different AZs
+        known = (src_subnet >= 0) & (dst_subnet >= 0)
+        cross_az = known & (
+            self._subnet_az[np.maximum(src_subnet, 0)]
+            != self._subnet_az[np.maximum(dst_subnet, 0)]
+        )
+        self.cross_az_bytes += int(nbytes[cross_az].sum())
+
+        # From a private subnet to a public address, i.e. through the NAT gateways
+        internet = self._private.lookup(dst) < 0
+        from_private = (src_subnet >= 0) & self._subnet_private[
+            np.maximum(src_subnet, 0)
+        ]
+        self.nat_bytes += int(nbytes[internet & from_private].sum())
+
+        self._add_destinations(dst, dst_subnet, internet, nbytes)
+        self._add_pairs(src, dst, nbytes)
+
+    def _add_destinations(self, dst, dst_subnet, internet, nbytes) -> None:
+        offset_vpc = len(self.topology.subnets)
+        offset_service = offset_vpc + len(self.topology.vpcs)
+        vpc = self._vpcs.lookup(dst)
+        service = self._services.lookup(dst)
+
+        code = np.select(
+            [dst_subnet >= 0, vpc >= 0, service >= 0, internet],
+            [
+                dst_subnet,
+                offset_vpc + vpc,
+                offset_service + service,
+                len(self._labels) - 2,
+            ],
+            default=len(self._labels) - 1,
+        )
+        totals = np.bincount(code, weights=nbytes, minlength=len(self._labels))
+        for index in np.flatnonzero(totals):
+            label = self._labels[index]
+            self.destination_bytes[label] = self.destination_bytes.get(label, 0) + int(
+                totals[index]
+            )
+
+    def _add_pairs(self, src, dst, nbytes) -> None:
+        keys = (src.astype(np.uint64) << np.uint64(32)) | dst.astype(np.uint64)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=nbytes)
+        for key, total in zip(unique.tolist(), totals.tolist()):
+            self.pairs[key] = self.pairs.get(key, 0) + int(total)
+
+        # Keep memory bounded by dropping the smallest half, top talkers stay exact
+        # unless a pair keeps growing after it has been dropped
+        if len(self.pairs) > self.max_pairs:
+            self.approximate = True
+            keep = sorted(self.pairs.items(), key=lambda kv: kv[1], reverse=True)
+            self.pairs = dict(keep[: self.max_pairs // 2])
+
+    def report(self, top: int = 20) -> dict:
+        talkers = sorted(self.pairs.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        return {
+            "records": self.records,
+            "skipped_records": self.skipped,
+            "bytes": self.total_bytes,
+            "rejected_bytes": self.rejected_bytes,
+            "cross_az_bytes": self.cross_az_bytes,
+            "nat_bytes": self.nat_bytes,
+            "top_talkers": [
+                {
+                    "src": str(ipaddress.ip_address(key >> 32)),
+                    "dst": str(ipaddress.ip_address(key & 0xFFFFFFFF)),
+                    "bytes": total,
+                }
+                for key, total in talkers
+            ],
+            "top_talkers_approximate": self.approximate,
+            "destination_bytes": dict(
+                sorted(
+                    self.destination_bytes.items(), key=lambda kv: kv[1], reverse=True
+                )
+            ),
+        }
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[List[str]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            yield lines
+
+
+def parse_chunk(
+    lines: List[str],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]:
+    # Header lines, NODATA/SKIPDATA records and IPv6 flows are skipped
+    src, dst, nbytes, accepted = [], [], [], []
+    skipped = 0
+    inet_aton = socket.inet_aton
+    for line in lines:
+        fields = line.split()
+        if len(fields) != FIELDS or fields[BYTES] == "-" or fields[0] == "version":
+            skipped += 1
+            continue
+        try:
+            s = inet_aton(fields[SRCADDR])
+            d = inet_aton(fields[DSTADDR])
+        except OSError:
+            skipped += 1
+            continue
+        src.append(s)
+        dst.append(d)
+        nbytes.append(fields[BYTES])
+        accepted.append(fields[ACTION] == "ACCEPT")
+
+    return (
+        np.frombuffer(b"".join(src), dtype=">u4").astype(np.uint32),
+        np.frombuffer(b"".join(dst), dtype=">u4").astype(np.uint32),
+        np.array(nbytes, dtype=np.int64),
+        np.array(accepted, dtype=bool),
+        skipped,
+    )
+
+
+def analyze(
+    paths: Iterable[str],
+    topology: Topology,
+    chunk_size: int = 500_000,
+    max_pairs: int = 1_000_000,
+) -> Aggregator:
+    aggregator = Aggregator(topology, max_pairs=max_pairs)
+    for path in paths:
+        for lines in read_chunks(path, chunk_size):
+            src, dst, nbytes, accepted, skipped = parse_chunk(lines)
+            aggregator.skipped += skipped
+            if len(src):
+                aggregator.add(src, dst, nbytes, accepted)
+    return aggregator
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", help="flow log files, plain text or .gz")
+    parser.add_argument(
+        "--stack-outputs",
+        action="append",
+        default=[],
+        help="`pulumi stack output --json` of the root or networking stack, repeatable",
+    )
+    parser.add_argument(
+        "--aws-ip-ranges", help="AWS ip-ranges.json to classify S3/DynamoDB traffic"
+    )
+    parser.add_argument("--top", type=int, default=20, help="number of top talkers")
+    parser.add_argument(
+        "--chunk-size", type=int, default=500_000, help="lines per chunk"
+    )
+    parser.add_argument(
+        "--max-pairs", type=int, default=1_000_000, help="talker pairs kept in memory"
+    )
+    parser.add_argument(
+        "--output", help="write the JSON report to this file instead of stdout"
+    )
+    args = parser.parse_args(argv)
+
+    topology = Topology()
+    for path in args.stack_outputs:
+        topology.add_stack_outputs(path)
+    if args.aws_ip_ranges:
+        topology.add_aws_ip_ranges(args.aws_ip_ranges)
+
+    report = analyze(args.files, topology, args.chunk_size, args.max_pairs).report(
+        args.top
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Network performance checks over the resources of a stack.
+
+The checks behind the `policy/` CrossGuard pack, on a plain model of the
+resources so that they also run over the graph recorded against mocks by
+`benchmarks/construction.py --graph-dir`:
+
+    python benchmarks/construction.py --cases networking root:10 --graph-dir graphs
+    python -m leviathan.guard graphs/networking.json graphs/root-10.json
+
+Resources are related through their property dependencies (the subnet of a
+NAT Gateway, the route table of a route, ...), which are known in a preview
+before any id is. Exits with 1 when a mandatory check fails.
+"""
+
+import argparse
+import collections
+import json
+import sys
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+ADVISORY = "advisory"
+MANDATORY = "mandatory"
+
+# Value of inputs the engine does not know yet
+UNKNOWN = "04da6b54-80e4-46f7-96ec-b56ff0331ba9"
+
+ROUTE = "aws:ec2/route:Route"
+ROUTE_TABLE_ASSOCIATION = "aws:ec2/routeTableAssociation:RouteTableAssociation"
+NAT_GATEWAY = "aws:ec2/natGateway:NatGateway"
+INTERNET_GATEWAY = "aws:ec2/internetGateway:InternetGateway"
+VPC_ENDPOINT = "aws:ec2/vpcEndpoint:VpcEndpoint"
+VPC_ATTACHMENT = "aws:ec2transitgateway/vpcAttachment:VpcAttachment"
+FLOW_LOG = "aws:ec2/flowLog:FlowLog"
+
+
+class Resource(NamedTuple):
+    urn: str
+    type: str
+    props: Dict[str, Any]
+    # Input property -> URNs of the resources its value comes from
+    dependencies: Dict[str, List[str]]
+
+    def depends(self, prop: str) -> List[str]:
+        return self.dependencies.get(prop) or []
+
+    def prop(self, name: str) -> Any:
+        value = self.props.get(name)
+        return None if value == UNKNOWN else value
+
+
+class Violation(NamedTuple):
+    policy: str
+    urn: str
+    message: str
+
+
+class Policy(NamedTuple):
+    name: str
+    description: str
+    enforcement_level: str
+    check: Callable[["Stack"], Iterable[Violation]]
+
+
+class Stack:
+    """Resources of a stack with the relations the checks need."""
+
+    def __init__(self, resources: Iterable[Resource]) -> None:
+        self.resources = {r.urn: r for r in resources}
+        self.by_type: Dict[str, List[Resource]] = collections.defaultdict(list)
+        self._routes: Dict[str, List[Resource]] = collections.defaultdict(list)
+        for r in self.resources.values():
+            self.by_type[r.type].append(r)
+            if r.type == ROUTE:
+                for route_table in r.depends("routeTableId"):
+                    self._routes[route_table].append(r)
+
+    def related(self, resource: Resource, prop: str) -> List[Resource]:
+        return [
+            self.resources[u] for u in resource.depends(prop) if u in self.resources
+        ]
+
+    def vpc_of(self, resource: Resource) -> Optional[str]:
+        vpcs = resource.depends("vpcId")
+        return vpcs[0] if vpcs else None
+
+    def availability_zone(self, subnet_urn: str) -> Optional[str]:
+        subnet = self.resources.get(subnet_urn)
+        return subnet.prop("availabilityZone") if subnet is not None else None
+
+    def nat_availability_zone(self, nat_gateway: Resource) -> Optional[str]:
+        subnets = nat_gateway.depends("subnetId")
+        return self.availability_zone(subnets[0]) if subnets else None
+
+    def routes(self, route_table_urn: str) -> List[Resource]:
+        return self._routes[route_table_urn]
+
+    def nat_gateways_of(self, route_table_urn: str) -> List[Resource]:
+        return [
+            n
+            for r in self.routes(route_table_urn)
+            for n in self.related(r, "natGatewayId")
+        ]
+
+    def associations(self) -> List[Resource]:
+        return self.by_type[ROUTE_TABLE_ASSOCIATION]
+
+
+def _nat_gateway_per_az(stack: Stack) -> Iterable[Violation]:
+    # AZs whose subnets egress through a NAT Gateway, per VPC
+    egress_azs: Dict[str, Set[str]] = collections.defaultdict(set)
+    for association in stack.associations():
+        for subnet in stack.related(association, "subnetId"):
+            az = subnet.prop("availabilityZone")
+            for route_table in association.depends("routeTableId"):
+                if az and stack.nat_gateways_of(route_table):
+                    egress_azs[stack.vpc_of(subnet)].add(az)
+
+    nat_azs: Dict[str, Set[str]] = collections.defaultdict(set)
+    for nat_gateway in stack.by_type[NAT_GATEWAY]:
+        for subnet in stack.related(nat_gateway, "subnetId"):
+            if subnet.prop("availabilityZone"):
+                nat_azs[stack.vpc_of(subnet)].add(subnet.prop("availabilityZone"))
+
+    for vpc, azs in sorted(egress_azs.items(), key=lambda item: str(item[0])):
+        missing = azs - nat_azs[vpc]
+        if missing:
+            yield Violation(
+                "nat-gateway-per-az",
+                vpc or "",
+                f"no NAT Gateway in {', '.join(sorted(missing))}, egress from there "
+                f"crosses AZs to {', '.join(sorted(nat_azs[vpc])) or 'nothing'}",
+            )
+
+
+def _same_az_egress(stack: Stack) -> Iterable[Violation]:
+    for association in stack.associations():
+        for subnet in association.depends("subnetId"):
+            az = stack.availability_zone(subnet)
+            for route_table in association.depends("routeTableId"):
+                for nat_gateway in stack.nat_gateways_of(route_table):
+                    nat_az = stack.nat_availability_zone(nat_gateway)
+                    if az and nat_az and nat_az != az:
+                        yield Violation(
+                            "same-az-egress",
+                            association.urn,
+                            f"subnet in {az} egresses through a NAT Gateway in {nat_az}",
+                        )
+
+
+def _gateway_endpoints(stack: Stack) -> Iterable[Violation]:
+    # VPCs without an internet gateway reach S3 and DynamoDB over the Transit
+    # Gateway and the central NAT Gateways unless gateway endpoints bypass them
+    with_internet = {stack.vpc_of(g) for g in stack.by_type[INTERNET_GATEWAY]}
+    covered: Dict[str, Set[str]] = collections.defaultdict(set)
+    for endpoint in stack.by_type[VPC_ENDPOINT]:
+        if (endpoint.prop("vpcEndpointType") or "Gateway") != "Gateway":
+            continue
+        service = (endpoint.prop("serviceName") or "").rsplit(".", 1)[-1]
+        for route_table in endpoint.depends("routeTableIds"):
+            covered[route_table].add(service)
+
+    checked = set()
+    for route in stack.by_type[ROUTE]:
+        egress = route.prop("transitGatewayId") or route.depends("transitGatewayId")
+        egress = egress or route.depends("natGatewayId")
+        for route_table_urn in route.depends("routeTableId"):
+            route_table = stack.resources.get(route_table_urn)
+            if not egress or route_table is None or route_table_urn in checked:
+                continue
+            checked.add(route_table_urn)
+            if stack.vpc_of(route_table) in with_internet:
+                continue
+            missing = {"s3", "dynamodb"} - covered[route_table_urn]
+            if missing:
+                yield Violation(
+                    "gateway-endpoints",
+                    route_table_urn,
+                    f"no {' or '.join(sorted(missing))} gateway endpoint, that "
+                    "traffic goes through the Transit Gateway and NAT",
+                )
+
+
+def _duplicate_interface_endpoints(stack: Stack) -> Iterable[Violation]:
+    seen: Dict[tuple, str] = {}
+    for endpoint in stack.by_type[VPC_ENDPOINT]:
+        if endpoint.prop("vpcEndpointType") != "Interface":
+            continue
+        key = (stack.vpc_of(endpoint), endpoint.prop("serviceName"))
+        if key in seen:
+            yield Violation(
+                "duplicate-interface-endpoints",
+                endpoint.urn,
+                f"{key[1]} already has an interface endpoint in the VPC, {seen[key]}",
+            )
+        else:
+            seen[key] = endpoint.urn
+
+
+def _flow_log_format(stack: Stack) -> Iterable[Violation]:
+    for flow_log in stack.by_type[FLOW_LOG]:
+        if flow_log.prop("logDestinationType") != "s3":
+            continue
+        options = flow_log.prop("destinationOptions") or {}
+        if options.get("fileFormat") != "parquet":
+            yield Violation(
+                "flow-log-format",
+                flow_log.urn,
+                "plain text flow logs are read in full by every Athena query, "
+                "use parquet",
+            )
+        if not options.get("hiveCompatiblePartitions"):
+            yield Violation(
+                "flow-log-format",
+                flow_log.urn,
+                "without Hive compatible partitions queries can not prune by date",
+            )
+
+
+def _subnet_vpc_mismatch(stack: Stack) -> Iterable[Violation]:
+    # Subnets of another VPC, e.g. from a subnet list shared between Vpc instances
+    def check(resource: Resource, vpc: Optional[str], prop: str) -> Iterable[Violation]:
+        for subnet in stack.related(resource, prop):
+            subnet_vpc = stack.vpc_of(subnet)
+            if vpc and subnet_vpc and subnet_vpc != vpc:
+                yield Violation(
+                    "subnet-vpc-mismatch",
+                    resource.urn,
+                    f"{subnet.urn} belongs to {subnet_vpc}, not {vpc}",
+                )
+
+    for association in stack.associations():
+        for route_table in stack.related(association, "routeTableId"):
+            yield from check(association, stack.vpc_of(route_table), "subnetId")
+    for attachment in stack.by_type[VPC_ATTACHMENT]:
+        yield from check(attachment, stack.vpc_of(attachment), "subnetIds")
+    for endpoint in stack.by_type[VPC_ENDPOINT]:
+        yield from check(endpoint, stack.vpc_of(endpoint), "subnetIds")
+
+
+POLICIES = [
+    Policy(
+        "nat-gateway-per-az",
+        "Every AZ that egresses through NAT has a NAT Gateway of its own.",
+        MANDATORY,
+        _nat_gateway_per_az,
+    ),
+    Policy(
+        "same-az-egress",
+        "Subnets egress through a NAT Gateway in their own AZ.",
+        MANDATORY,
+        _same_az_egress,
+    ),
+    Policy(
+        "gateway-endpoints",
+        "Spoke route tables have S3 and DynamoDB gateway endpoints.",
+        ADVISORY,
+        _gateway_endpoints,
+    ),
+    Policy(
+        "duplicate-interface-endpoints",
+        "A VPC has at most one interface endpoint per service.",
+        MANDATORY,
+        _duplicate_interface_endpoints,
+    ),
+    Policy(
+        "flow-log-format",
+        "Flow logs in S3 are parquet with Hive compatible partitions.",
+        ADVISORY,
+        _flow_log_format,
+    ),
+    Policy(
+        "subnet-vpc-mismatch",
+        "Route tables, attachments and endpoints only use subnets of their VPC.",
+        MANDATORY,
+        _subnet_vpc_mismatch,
+    ),
+]
+
+
+def check(
+    resources: Iterable[Resource], policies: Optional[Iterable[str]] = None
+) -> List[Violation]:
+    stack = Stack(resources)
+    names = set(policies) if policies is not None else None
+    return [
+        violation
+        for policy in POLICIES
+        if names is None or policy.name in names
+        for violation in policy.check(stack)
+    ]
+
+
+def from_graph(resources: Iterable[dict]) -> List[Resource]:
+    """Resources of a `pulumi stack export` checkpoint or a recorded graph."""
+    return [
+        Resource(
+            r["urn"],
+            r["type"],
+            r.get("inputs") or {},
+            r.get("propertyDependencies") or {},
+        )
+        for r in resources
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("graphs", nargs="+", help="checkpoints or recorded graphs")
+    parser.add_argument(
+        "--level",
+        action="append",
+        default=[],
+        metavar="POLICY=LEVEL",
+        help="override the enforcement level (advisory, mandatory or disabled)",
+    )
+    args = parser.parse_args()
+
+    levels = {p.name: p.enforcement_level for p in POLICIES}
+    for item in args.level:
+        name, _, level = item.partition("=")
+        levels[name] = level
+
+    failed = False
+    for path in args.graphs:
+        with open(path) as f:
+            data = json.load(f)
+        resources = from_graph(data.get("deployment", data).get("resources", []))
+        enabled = [name for name, level in levels.items() if level != "disabled"]
+        for violation in check(resources, enabled):
+            level = levels[violation.policy]
+            failed = failed or level == MANDATORY
+            print(f"{path}: {level} {violation.policy}: {violation.urn}")
+            print(f"  {violation.message}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
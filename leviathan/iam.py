@@ -1,40 +1,30 @@
-from pulumi import ComponentResource, ResourceOptions, InvokeOptions
+from pulumi import ComponentResource, ResourceOptions
 import pulumi_aws as aws
 import pulumi_random as random
-from leviathan import consts
+from leviathan import consts, exports, policy, tracing
 
 
 class Iam(ComponentResource):
+    @tracing.traced
     def __init__(self, name: str, opts=None) -> None:
         # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
         super().__init__("pkg:leviathan:iam", name, None, opts=opts)
         # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
         child_opts = ResourceOptions(parent=self)
 
-        ec2_assume_role = aws.iam.get_policy_document(
-            statements=[
-                aws.iam.GetPolicyDocumentStatementArgs(
-                    effect="Allow",
-                    principals=[
-                        aws.iam.GetPolicyDocumentStatementPrincipalArgs(
-                            type="Service",
-                            identifiers=["ec2.amazonaws.com"],
-                        )
-                    ],
-                    actions=["sts:AssumeRole"],
-                )
-            ],
-            opts=InvokeOptions(parent=self, provider=opts.providers["aws"])
+        ec2_assume_role = policy.document(
+            policy.allow(["sts:AssumeRole"], principals=[policy.service("ec2.amazonaws.com")]),
+            kind="trust"
         )
 
-        role = aws.iam.Role(
+        self.role = role = aws.iam.Role(
             f"{name}-ec2-ssm-role",
             path="/",
-            assume_role_policy=ec2_assume_role.json,
+            assume_role_policy=ec2_assume_role,
             opts=child_opts
         )
 
-        aws.iam.InstanceProfile(
+        self.instance_profile = aws.iam.InstanceProfile(
             f"{name}-ec2-ssm-instance-profile",
             role=role.name,
             opts=ResourceOptions(parent=role, providers=child_opts.providers)
@@ -48,3 +38,9 @@ class Iam(ComponentResource):
         )
 
         self.register_outputs({})
+
+    def to_export(self) -> dict:
+        return exports.versioned({
+            "role_arn": self.role.arn,
+            "instance_profile": self.instance_profile.name,
+        })
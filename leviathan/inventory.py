@@ -0,0 +1,391 @@
+"""Which account, VPC, subnet and AZ own an address, and how it egresses.
+
+Loads the exports of the root and networking stacks, from `pulumi stack
+export` files, `pulumi stack output --json` files or the checkpoints of a
+file backend, into radix tries of the VPC and subnet CIDRs and answers by
+longest prefix match:
+
+    python -m leviathan.inventory root.json networking.json 10.101.20.37
+    python -m leviathan.inventory ~/.pulumi/stacks/leviathan/*.json \\
+        --batch addresses.txt --json
+
+The index is pickled to `.leviathan/inventory.pickle` and only rebuilt when an
+input file changes (path, size or modification time), so a lookup does not
+parse the exports again. A lookup walks at most one node per address bit.
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import pickle
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+DEFAULT_CACHE = os.path.join(".leviathan", "inventory.pickle")
+# Bumped whenever the pickled index changes shape
+INDEX_VERSION = 1
+
+STACK = "pulumi:pulumi:Stack"
+
+
+class Owner(NamedTuple):
+    cidr: str
+    kind: str  # vpc or subnet
+    stack: str
+    vpc: str
+    vpc_id: Optional[str]
+    account: Optional[str]
+    region: Optional[str]
+    availability_zone: Optional[str]
+    subnet_id: Optional[str]
+    tier: Optional[str]  # private or public
+    # Hops from the owner to the internet, most of them resource ids
+    egress: List[str]
+    # Interface endpoint services resolved through the hub, by resolver rule
+    endpoints: Dict[str, str]
+
+
+class PrefixTrie:
+    """Binary radix trie of CIDR blocks of one address family.
+
+    A node is `[zero, one, value]`, the value of a block sits on the node at
+    the depth of its prefix length. Lookups follow the address bits and keep
+    every value met on the way, the last one is the longest prefix match.
+    """
+
+    def __init__(self, bits: int) -> None:
+        self.bits = bits
+        self._root: List[Any] = [None, None, None]
+        self.size = 0
+
+    def insert(self, network, value: Any) -> None:
+        address = int(network.network_address)
+        node = self._root
+        for depth in range(network.prefixlen):
+            bit = (address >> (self.bits - 1 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            self.size += 1
+        node[2] = value
+
+    def matches(self, address: int) -> List[Any]:
+        # Values of every block holding `address`, shortest prefix first
+        found = []
+        node = self._root
+        shift = self.bits - 1
+        while node is not None:
+            if node[2] is not None:
+                found.append(node[2])
+            if shift < 0:
+                break
+            node = node[(address >> shift) & 1]
+            shift -= 1
+        return found
+
+
+class Index:
+    """Owners of the VPC and subnet blocks of a set of stacks."""
+
+    def __init__(self) -> None:
+        self.tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        self.stacks: List[str] = []
+        # Hub of every region: vpc id, transit gateway, NAT Gateways, ...
+        self.hubs: Dict[str, Dict[str, Any]] = {}
+        # Environment VPCs, indexed by build() once every hub is known
+        self._spokes: List[Tuple[str, str, Optional[str], Optional[str], dict]] = []
+
+    def add(self, stack: str, outputs: Dict[str, Any]) -> None:
+        self.stacks.append(stack)
+        if "vpc_info" in outputs:
+            self._add_networking(stack, outputs)
+        for name, environment in (outputs.get("environments") or {}).items():
+            account = (environment.get("account") or {}).get("id")
+            regional = [(None, environment)] + sorted(
+                (environment.get("regions") or {}).items()
+            )
+            for region, spoke in regional:
+                self._spokes.append((stack, name, account, region, spoke))
+
+    def build(self) -> "Index":
+        for stack, name, account, region, spoke in self._spokes:
+            vpc, routing = spoke["vpc"], spoke.get("routing") or {}
+            region = region or _region_of(vpc)
+            hub = self.hubs.get(region)
+            egress = [
+                f"route table {routing.get('private_route_table_id')}",
+                f"transit gateway attachment {routing.get('transit_gateway_attachment_id')}",
+            ]
+            if routing.get("transit_gateway_route_table_id"):
+                egress.append(
+                    f"transit gateway route table {routing['transit_gateway_route_table_id']}"
+                )
+            if hub is None:
+                egress.append(f"hub of {region} (networking stack not loaded)")
+            else:
+                egress.append(f"transit gateway {hub['transit_gateway_id']}")
+                egress += _hub_egress(hub, "private")
+            self._add_vpc(
+                stack,
+                name,
+                vpc,
+                account,
+                region,
+                {"private": egress, "public": egress},
+                hub["endpoints"] if hub else {},
+            )
+        self._spokes = []
+        return self
+
+    def lookup(self, address: str) -> List[Owner]:
+        # Owners of the blocks holding `address`, the most specific one last
+        ip = ipaddress.ip_address(address)
+        return self.tries[ip.version].matches(int(ip))
+
+    def _add_networking(self, stack: str, outputs: Dict[str, Any]) -> None:
+        hubs = [(None, outputs)] + sorted((outputs.get("regions") or {}).items())
+        for region, hub in hubs:
+            vpc, routing = hub["vpc_info"], hub.get("routing") or {}
+            region = region or _region_of(vpc)
+            self.hubs[region] = {
+                "vpc_id": vpc.get("id"),
+                "account": routing.get("transit_gateway_owner_id"),
+                "transit_gateway_id": routing.get("transit_gateway_id"),
+                "nat_gateway_ids": routing.get("nat_gateway_ids") or [],
+                "internet_gateway_id": routing.get("internet_gateway_id"),
+                "endpoints": (hub.get("shared_endpoints") or {}).get("resolver_rules")
+                or {},
+            }
+            self._add_vpc(
+                stack,
+                "networking",
+                vpc,
+                self.hubs[region]["account"],
+                region,
+                {
+                    "private": _hub_egress(self.hubs[region], "private"),
+                    "public": _hub_egress(self.hubs[region], "public"),
+                },
+                self.hubs[region]["endpoints"],
+            )
+
+    def _add_vpc(
+        self,
+        stack: str,
+        name: str,
+        vpc: Dict[str, Any],
+        account: Optional[str],
+        region: Optional[str],
+        egress: Dict[str, List[str]],
+        endpoints: Dict[str, str],
+    ) -> None:
+        def owner(cidr, kind, az=None, subnet_id=None, tier=None):
+            return Owner(
+                cidr,
+                kind,
+                stack,
+                name,
+                vpc.get("id"),
+                account,
+                region,
+                az,
+                subnet_id,
+                tier,
+                egress[tier] if tier else [f"VPC {vpc.get('id')}"],
+                endpoints,
+            )
+
+        for cidr in (vpc.get("cidr_block"), vpc.get("ipv6_cidr_block")):
+            if cidr:
+                network = ipaddress.ip_network(cidr)
+                self.tries[network.version].insert(network, owner(cidr, "vpc"))
+
+        availability_zones = vpc.get("availability_zones") or []
+        for tier in ("private", "public"):
+            subnet_ids = vpc.get(f"{tier}_subnets") or []
+            for index, cidr in enumerate(vpc.get(f"{tier}_cidrs") or []):
+                network = ipaddress.ip_network(cidr)
+                self.tries[network.version].insert(
+                    network,
+                    owner(
+                        cidr,
+                        "subnet",
+                        _item(availability_zones, index),
+                        _item(subnet_ids, index),
+                        tier,
+                    ),
+                )
+
+
+def _item(items: List[Any], index: int) -> Any:
+    return items[index] if index < len(items) else None
+
+
+def _region_of(vpc: Dict[str, Any]) -> Optional[str]:
+    # eu-central-1a -> eu-central-1
+    availability_zones = vpc.get("availability_zones") or []
+    return availability_zones[0][:-1] if availability_zones else None
+
+
+def _hub_egress(hub: Dict[str, Any], tier: str) -> List[str]:
+    hops = []
+    if tier == "private":
+        hops.append(f"NAT Gateway {', '.join(hub['nat_gateway_ids']) or '?'}")
+    hops.append(f"internet gateway {hub['internet_gateway_id']}")
+    return hops
+
+
+def read_outputs(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Stack name and outputs of every stack in an export or output file."""
+    with open(path) as f:
+        data = json.load(f)
+
+    # File backend checkpoint, `pulumi stack export`, or plain stack outputs
+    deployment = (data.get("checkpoint") or {}).get("latest") or data.get("deployment")
+    if deployment is None:
+        yield os.path.splitext(os.path.basename(path))[0], data
+        return
+    for resource in deployment.get("resources") or []:
+        if resource.get("type") == STACK:
+            # urn:pulumi:<stack>::<project>::pulumi:pulumi:Stack::<name>
+            stack = resource["urn"].split("::")[0].rpartition(":")[2]
+            yield stack, resource.get("outputs") or {}
+
+
+def fingerprint(paths: Iterable[str]) -> List[Tuple[str, int, int]]:
+    fingerprint = []
+    for path in paths:
+        stat = os.stat(path)
+        fingerprint.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+    return sorted(fingerprint)
+
+
+def build(paths: Iterable[str]) -> Index:
+    index = Index()
+    for path in paths:
+        for stack, outputs in read_outputs(path):
+            index.add(stack, outputs)
+    return index.build()
+
+
+def load(paths: List[str], cache: Optional[str] = DEFAULT_CACHE) -> Index:
+    """Index of `paths`, from the cache while none of them changed."""
+    key = (INDEX_VERSION, fingerprint(paths))
+    if cache is not None:
+        try:
+            with open(cache, "rb") as f:
+                cached_key, index = pickle.load(f)
+            if cached_key == key:
+                return index
+        except (OSError, EOFError, AttributeError, ImportError, pickle.PickleError):
+            # Missing, truncated or written by another revision of this module
+            pass
+
+    index = build(paths)
+    if cache is not None:
+        os.makedirs(os.path.dirname(cache) or ".", exist_ok=True)
+        # Written aside and renamed, a concurrent run never reads half a file
+        with open(f"{cache}.tmp", "wb") as f:
+            pickle.dump((key, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{cache}.tmp", cache)
+    return index
+
+
+def read_addresses(path: str) -> Iterator[str]:
+    # One address per line, `#` comments; `-` reads stdin
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        for line in f:
+            address = line.split("#", 1)[0].strip()
+            if address:
+                yield address
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def describe(address: str, owners: List[Owner]) -> str:
+    if not owners:
+        return f"{address}: no VPC"
+    owner = owners[-1]
+    lines = [
+        f"{address}: {owner.vpc} {owner.kind} {owner.cidr} ({owner.stack})",
+        f"  account {owner.account or '?'}, {owner.region or '?'}, VPC {owner.vpc_id}",
+    ]
+    if owner.kind == "subnet":
+        lines.append(
+            f"  {owner.tier} subnet {owner.subnet_id or '?'} in {owner.availability_zone}"
+        )
+    lines.append(f"  egress: {' -> '.join(owner.egress)}")
+    if owner.endpoints:
+        lines.append(
+            "  endpoints through the hub: "
+            + ", ".join(f"{s} ({r})" for s, r in sorted(owner.endpoints.items()))
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="stack exports, outputs or checkpoints, then IPv4 or IPv6 addresses",
+    )
+    parser.add_argument(
+        "--batch", action="append", default=[], help="file of addresses, - for stdin"
+    )
+    parser.add_argument("--json", action="store_true", help="one JSON line each")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="pickled index")
+    parser.add_argument(
+        "--no-cache", action="store_true", help="always rebuild the index"
+    )
+    args = parser.parse_args(argv)
+
+    files = [i for i in args.inputs if os.path.isfile(i)]
+    addresses = [i for i in args.inputs if not os.path.isfile(i)]
+    for path in args.batch:
+        addresses += read_addresses(path)
+
+    started = time.perf_counter()
+    index = load(files, None if args.no_cache else args.cache)
+    loaded = time.perf_counter()
+
+    failed = False
+    results = []
+    for address in addresses:
+        try:
+            results.append((address, index.lookup(address)))
+        except ValueError:
+            print(f"{address}: not an IP address", file=sys.stderr)
+            failed = True
+    finished = time.perf_counter()
+
+    for address, owners in results:
+        if args.json:
+            print(
+                json.dumps(
+                    {
+                        "address": address,
+                        "owner": owners[-1]._asdict() if owners else None,
+                        "within": [o.cidr for o in owners[:-1]],
+                    }
+                )
+            )
+        else:
+            print(describe(address, owners))
+
+    print(
+        f"{sum(t.size for t in index.tries.values())} blocks of {len(index.stacks)} "
+        f"stacks loaded in {(loaded - started) * 1000:.1f} ms, {len(results)} "
+        f"lookups in {(finished - loaded) * 1e6:.0f} us",
+        file=sys.stderr,
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import atexit
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+import pulumi
+from pulumi.runtime.sync_await import _sync_await
+from leviathan import tracing
+
+DEFAULT_PATH = os.path.join(".leviathan", "invoke-cache.json")
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class InvokeCache:
+    """Memoizes provider invoke results in memory and persists them on disk.
+
+    Entries are keyed by invoke token, account (the role ARN or id of the
+    account the invoke runs in), region and arguments, and are evicted once
+    they are older than `ttl` seconds.
+    """
+
+    def __init__(
+        self, path: str = DEFAULT_PATH, ttl: int = DEFAULT_TTL, enabled: bool = True
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._entries: Dict[str, Dict[str, Any]] = self._load() if enabled else {}
+
+    def invoke(
+        self,
+        token: str,
+        args: Dict[str, Any],
+        fetch: Callable[[], Any],
+        account: Optional[pulumi.Input[str]] = None,
+        region: Optional[str] = None,
+    ) -> Any:
+        # `fetch` runs the actual invoke and must return a JSON serializable value,
+        # `account` is the role ARN or id of the account the invoke runs in, as
+        # answers differ between accounts. Invokes with the ambient credentials
+        # (no `account`) or in an account that isn't known yet are not cached.
+        if account is not None:
+            # Known before anything waits on the provider of the invoke, see
+            # providers.assume_role_provider
+            account = _sync_await(pulumi.Output.from_input(account).future())
+        if not self.enabled or account is None:
+            self.misses += 1
+            with tracing.default().span(token, kind="invoke", cached=False):
+                return fetch()
+
+        key = self._key(token, args, account, region)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires_at"] > now:
+            self.hits += 1
+            return entry["value"]
+
+        self.misses += 1
+        with tracing.default().span(token, kind="invoke", cached=False):
+            value = fetch()
+        self._entries[key] = {"expires_at": now + self.ttl, "value": value}
+        self._dirty = True
+        return value
+
+    def save(self) -> None:
+        if not self.enabled or not self._dirty:
+            return
+
+        now = time.time()
+        entries = {k: v for k, v in self._entries.items() if v["expires_at"] > now}
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def report(self) -> None:
+        pulumi.log.info(
+            f"invoke cache: {self.hits} hits, {self.misses} misses"
+            + ("" if self.enabled else " (disabled)")
+        )
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        now = time.time()
+        return {k: v for k, v in entries.items() if v.get("expires_at", 0) > now}
+
+    @staticmethod
+    def _key(
+        token: str,
+        args: Dict[str, Any],
+        account: str,
+        region: Optional[str],
+    ) -> str:
+        region = region or pulumi.Config("aws").get("region")
+        payload = json.dumps(
+            [pulumi.get_stack(), account, region, token, args],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+
+_default_cache: Optional[InvokeCache] = None
+
+
+def default() -> InvokeCache:
+    """Process wide cache configured from the stack config.
+
+    `invoke_cache: false` bypasses the cache, `invoke_cache_ttl` sets the TTL in
+    seconds and `invoke_cache_path` overrides the location of the cache file.
+    """
+    global _default_cache
+    if _default_cache is None:
+        config = pulumi.Config()
+        _default_cache = InvokeCache(
+            path=config.get("invoke_cache_path") or DEFAULT_PATH,
+            ttl=config.get_int("invoke_cache_ttl") or DEFAULT_TTL,
+            enabled=config.get_bool("invoke_cache") is not False,
+        )
+        atexit.register(_default_cache.save)
+
+    return _default_cache
@@ -0,0 +1,285 @@
+import atexit
+import ipaddress
+import json
+import os
+from typing import Dict, List, Optional
+import pulumi
+from leviathan.configuration import cidrs
+
+ALLOCATIONS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "configuration", "allocations.json"
+)
+# Room for 1024 environments in DEFAULT_CIDR_BLOCK; pre-existing VPCs keep their /16
+VPC_PREFIXLEN = 18
+
+
+class CidrAllocationError(Exception):
+    pass
+
+
+class CidrOverlapError(CidrAllocationError):
+    pass
+
+
+class _Node:
+    __slots__ = ("children", "allocated", "largest_free")
+
+    def __init__(self) -> None:
+        self.children: List[Optional["_Node"]] = [None, None]
+        self.allocated = False
+        # Prefix length of the largest free block below this node, None when full
+        self.largest_free: Optional[int] = None
+
+
+class CidrTree:
+    """Binary radix tree of the blocks allocated from a supernet.
+
+    Every node stands for a CIDR block, its children for the two halves of it.
+    Overlap checks and first-fit allocations only walk a single root-to-leaf
+    path, so they cost O(prefix length) regardless of how many blocks exist.
+    """
+
+    def __init__(self, supernet: str) -> None:
+        self.supernet = ipaddress.ip_network(supernet)
+        self._root = _Node()
+        self._root.largest_free = self.supernet.prefixlen
+        self._bits = self.supernet.max_prefixlen
+        self._base = int(self.supernet.network_address)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.allocations())
+
+    def overlap(self, cidr: str) -> Optional[str]:
+        # Returns an allocated block overlapping `cidr`, or None
+        network = self._network(cidr)
+        offset = int(network.network_address) - self._base
+        node = self._root
+        for depth in range(network.prefixlen - self.supernet.prefixlen):
+            if node.allocated:
+                return str(self._block(offset, depth))
+            node = node.children[self._bit(offset, depth)]
+            if node is None:
+                return None
+
+        if node.allocated:
+            return str(network)
+        if node.children != [None, None]:
+            return next(self._walk(node, offset, network.prefixlen))
+        return None
+
+    def reserve(self, cidr: str) -> str:
+        conflict = self.overlap(cidr)
+        if conflict is not None:
+            raise CidrOverlapError(f"{cidr} overlaps already allocated {conflict}")
+
+        network = self._network(cidr)
+        self._insert(
+            int(network.network_address) - self._base,
+            network.prefixlen - self.supernet.prefixlen,
+        )
+        return str(network)
+
+    def allocate(self, prefixlen: int) -> str:
+        # First fit: always descend into the lowest half that still has room
+        if self._root.largest_free is None or self._root.largest_free > prefixlen:
+            raise CidrAllocationError(f"no free /{prefixlen} left in {self.supernet}")
+        if prefixlen < self.supernet.prefixlen:
+            raise CidrAllocationError(f"/{prefixlen} is larger than {self.supernet}")
+
+        offset = 0
+        node = self._root
+        depth = prefixlen - self.supernet.prefixlen
+        for d in range(depth):
+            left = node.children[0]
+            bit = 0 if left is None or (
+                left.largest_free is not None and left.largest_free <= prefixlen
+            ) else 1
+            offset |= bit << (self._bits - self.supernet.prefixlen - 1 - d)
+            node = node.children[bit]
+            if node is None:
+                break
+
+        self._insert(offset, depth)
+        return str(self._block(offset, depth))
+
+    def release(self, cidr: str) -> None:
+        # Frees a block returned by allocate() or reserve(), it is handed out again
+        network = self._network(cidr)
+        offset = int(network.network_address) - self._base
+        depth = network.prefixlen - self.supernet.prefixlen
+        path = [self._root]
+        for d in range(depth):
+            node = path[-1].children[self._bit(offset, d)]
+            if node is None:
+                break
+            path.append(node)
+        if len(path) != depth + 1 or not path[-1].allocated:
+            raise CidrAllocationError(f"{cidr} is not allocated")
+
+        path[-1].allocated = False
+        # Drop the nodes that no longer lead to an allocated block
+        for d in range(depth, 0, -1):
+            if path[d].children != [None, None]:
+                break
+            path[d - 1].children[self._bit(offset, d - 1)] = None
+        self._update(path)
+
+    def allocations(self):
+        return self._walk(self._root, 0, self.supernet.prefixlen)
+
+    def _insert(self, offset: int, depth: int) -> None:
+        path = [self._root]
+        node = self._root
+        for d in range(depth):
+            bit = self._bit(offset, d)
+            if node.children[bit] is None:
+                node.children[bit] = _Node()
+            node = node.children[bit]
+            path.append(node)
+
+        node.allocated = True
+        self._update(path)
+
+    def _update(self, path: List[_Node]) -> None:
+        # Recomputes largest_free from the end of a root-to-node path up
+        for d in range(len(path) - 1, -1, -1):
+            node = path[d]
+            if node.allocated:
+                node.largest_free = None
+                continue
+            sizes = [
+                self.supernet.prefixlen + d + 1 if child is None else child.largest_free
+                for child in node.children
+            ]
+            sizes = [s for s in sizes if s is not None]
+            if node.children == [None, None]:
+                sizes = [self.supernet.prefixlen + d]
+            node.largest_free = min(sizes) if sizes else None
+
+    def _walk(self, node: _Node, offset: int, prefixlen: int):
+        if node.allocated:
+            yield str(self._block(offset, prefixlen - self.supernet.prefixlen))
+            return
+        for bit, child in enumerate(node.children):
+            if child is not None:
+                child_offset = offset | bit << (self._bits - prefixlen - 1)
+                yield from self._walk(child, child_offset, prefixlen + 1)
+
+    def _network(self, cidr: str):
+        network = ipaddress.ip_network(cidr)
+        if not network.subnet_of(self.supernet):
+            raise CidrAllocationError(f"{cidr} is outside of {self.supernet}")
+        return network
+
+    def _bit(self, offset: int, depth: int) -> int:
+        return (offset >> (self._bits - self.supernet.prefixlen - 1 - depth)) & 1
+
+    def _block(self, offset: int, depth: int):
+        return ipaddress.ip_network(
+            (self._base + offset, self.supernet.prefixlen + depth), strict=False
+        )
+
+
+class Ipam:
+    """Deterministic VPC and subnet CIDR allocations over DEFAULT_CIDR_BLOCK.
+
+    Allocations are recorded in a JSON file, so a VPC or subnet keeps its block
+    across runs no matter in which order environments are constructed.
+    """
+
+    def __init__(
+        self, path: str = ALLOCATIONS_PATH, supernet: str = cidrs.DEFAULT_CIDR_BLOCK
+    ) -> None:
+        self.path = path
+        self._dirty = False
+        self._vpcs = CidrTree(supernet)
+        self._subnets: Dict[str, CidrTree] = {}
+        self._owners: Dict[str, str] = {}
+
+        try:
+            with open(path) as f:
+                self._allocations = json.load(f)
+        except FileNotFoundError:
+            self._allocations = {}
+
+        for name, allocation in self._allocations.items():
+            self._add_vpc(name, self._vpcs.reserve(allocation["cidr"]))
+            for cidr in allocation.get("subnets", {}).values():
+                self._subnets[name].reserve(cidr)
+
+    def vpc_cidr(self, name: str, prefixlen: int = VPC_PREFIXLEN) -> str:
+        if name not in self._allocations:
+            cidr = self._vpcs.allocate(prefixlen)
+            self._allocations[name] = {"cidr": cidr, "subnets": {}}
+            self._add_vpc(name, cidr)
+            self._dirty = True
+
+        return self._allocations[name]["cidr"]
+
+    def subnet_cidrs(
+        self, vpc_cidr: str, tier: str, availability_zones: List[str]
+    ) -> List[str]:
+        # Each VPC is split into enough equal blocks for a public and a private
+        # subnet in every AZ, so subnets grow with the VPC instead of being /24s
+        name = self._owners[str(ipaddress.ip_network(vpc_cidr))]
+        subnets = self._allocations[name].setdefault("subnets", {})
+        prefixlen = self._subnets[name].supernet.prefixlen + (
+            2 * len(availability_zones) - 1
+        ).bit_length()
+
+        result = []
+        for az in availability_zones:
+            key = f"{tier}/{az}"
+            if key not in subnets:
+                subnets[key] = self._subnets[name].allocate(prefixlen)
+                self._dirty = True
+            result.append(subnets[key])
+
+        return result
+
+    def release(self, name: str) -> None:
+        # Frees the block of a VPC that is gone, together with its subnets
+        allocation = self._allocations.pop(name)
+        self._vpcs.release(allocation["cidr"])
+        del self._owners[str(ipaddress.ip_network(allocation["cidr"]))]
+        del self._subnets[name]
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._allocations, f, indent=2, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def _add_vpc(self, name: str, cidr: str) -> None:
+        self._owners[cidr] = name
+        self._subnets[name] = CidrTree(cidr)
+
+
+_default_ipam: Optional[Ipam] = None
+
+
+def default() -> Ipam:
+    """Process wide allocator, `ipam_allocations` overrides the allocations file.
+
+    The allocations file is not stack state: `pulumi up` writes the blocks of
+    new VPCs to it, and the change is committed together with the catalog or
+    config change that caused it, so that every operator and CI run allocates
+    the same blocks. Previews allocate in memory only and never write it, the
+    same blocks come out of the `pulumi up` that follows as allocation is
+    deterministic.
+    """
+    global _default_ipam
+    if _default_ipam is None:
+        _default_ipam = Ipam(
+            path=pulumi.Config().get("ipam_allocations") or ALLOCATIONS_PATH
+        )
+        if not pulumi.runtime.is_dry_run():
+            atexit.register(_default_ipam.save)
+
+    return _default_ipam
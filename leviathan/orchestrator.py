@@ -0,0 +1,462 @@
+"""Deploys every leviathan stack in dependency order through the Automation API.
+
+Stacks are the `Pulumi.<stack>.yaml` files next to each program in
+`environments/`. A stack depends on the stacks its program, or the leviathan
+modules it imports, references (`stack_refs.networking()`,
+`StackReference("<org>/leviathan/root")`, ...) and on the ones listed in its
+`leviathan:depends_on` config. Independent stacks run side by side, and a
+failed stack only skips the stacks that depend on it.
+
+Stacks that reference each other are deployed through a bootstrap pass. The
+`leviathan:bootstrap` config of a stack holds config values that leave out
+everything it reads from other stacks, e.g. `environments: []` for root. On
+`up`, a stack that was never deployed first goes up with those values, and
+the stacks of its cycle only wait for that pass:
+
+    root (bootstrap) -> networking -> root
+
+    python -m leviathan.orchestrator preview
+    python -m leviathan.orchestrator up --workers 4 --parallel networking=32
+    python -m leviathan.orchestrator refresh --stacks networking --backend file://~/.state
+
+`destroy` runs in the reverse order, a stack is destroyed once every stack
+that depends on it is gone.
+"""
+
+import argparse
+import ast
+import concurrent.futures
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+import yaml
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENVIRONMENTS_DIR = os.path.join(os.path.dirname(PACKAGE_DIR), "environments")
+OPERATIONS = ("preview", "up", "refresh", "destroy")
+# Pass of a stack with its `bootstrap` config, see the module docstring
+BOOTSTRAP = "bootstrap"
+
+# Stack names referenced from a program, through leviathan.stack_refs or directly
+_REFERENCE_PATTERNS = [
+    re.compile(r"stack_refs\.(?!default\b)(\w+)\(\)"),
+    re.compile(r"\.stack\(\s*[\"'](\w+)[\"']"),
+    re.compile(r"StackReference\(\s*f?[\"'][^\"']*/(\w+)[\"']"),
+]
+
+
+class OrchestrationError(Exception):
+    pass
+
+
+class StackSpec(NamedTuple):
+    name: str
+    project: str
+    org: Optional[str]
+    program_dir: str
+    depends_on: FrozenSet[str]
+    parallel: Optional[int]
+    bootstrap: Optional[Dict[str, Any]] = None
+
+    @property
+    def qualified_name(self) -> str:
+        return f"{self.org}/{self.project}/{self.name}" if self.org else self.name
+
+
+class Result(NamedTuple):
+    stack: str
+    status: str  # succeeded, failed or skipped
+    duration: float
+    error: Optional[str] = None
+
+
+# (stack, operation, parallel, on_output) -> None, raises on failure
+Runner = Callable[[StackSpec, str, Optional[int], Callable[[str], None]], None]
+
+
+def discover(environments_dir: str = ENVIRONMENTS_DIR) -> Dict[str, StackSpec]:
+    stacks = {}
+    for project_file in sorted(
+        glob.glob(os.path.join(environments_dir, "*", "Pulumi.yaml"))
+    ):
+        program_dir = os.path.dirname(project_file)
+        with open(project_file) as f:
+            project = yaml.safe_load(f)["name"]
+        references = _references(program_dir)
+
+        for stack_file in sorted(glob.glob(os.path.join(program_dir, "Pulumi.*.yaml"))):
+            name = os.path.basename(stack_file)[len("Pulumi.") : -len(".yaml")]
+            with open(stack_file) as f:
+                config = (yaml.safe_load(f) or {}).get("config", {})
+
+            def get(key):
+                # Keys of the project namespace may be written with or without it
+                return config.get(f"{project}:{key}", config.get(key))
+
+            if name in stacks:
+                raise OrchestrationError(
+                    f"stack {name} is defined in {stacks[name].program_dir} and {program_dir}"
+                )
+            stacks[name] = StackSpec(
+                name=name,
+                project=project,
+                org=get("org"),
+                program_dir=program_dir,
+                depends_on=frozenset(
+                    (references | set(get("depends_on") or [])) - {name}
+                ),
+                parallel=get("parallel"),
+                bootstrap=get("bootstrap"),
+            )
+
+    return stacks
+
+
+def _references(program_dir: str) -> set:
+    references = set()
+    for path in _sources(program_dir):
+        with open(path) as f:
+            source = f.read()
+        for pattern in _REFERENCE_PATTERNS:
+            references.update(pattern.findall(source))
+    return references
+
+
+def _sources(program_dir: str) -> Set[str]:
+    # The program's files and every leviathan module they import, directly or
+    # through other leviathan modules
+    sources: Set[str] = set()
+    pending = glob.glob(os.path.join(program_dir, "*.py"))
+    while pending:
+        path = pending.pop()
+        if path in sources:
+            continue
+        sources.add(path)
+        with open(path) as f:
+            tree = ast.parse(f.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                modules = [node.module or ""] + [
+                    f"{node.module}.{alias.name}" for alias in node.names
+                ]
+            else:
+                continue
+            for module in modules:
+                package, _, name = module.partition(".")
+                if package != "leviathan" or not name:
+                    continue
+                module_path = os.path.join(PACKAGE_DIR, *name.split(".")) + ".py"
+                if os.path.exists(module_path):
+                    pending.append(module_path)
+    return sources
+
+
+def bootstrap_edges(stacks: Dict[str, StackSpec]) -> Set[Tuple[str, str]]:
+    """(stack, dependency) pairs where the stack only needs the dependency's bootstrap pass.
+
+    These are the dependencies on a stack with `bootstrap` config that itself
+    depends, directly or not, on the stack: the edges that close a cycle.
+    """
+
+    def reaches(start: str, target: str) -> bool:
+        seen, pending = set(), [start]
+        while pending:
+            name = pending.pop()
+            if name == target:
+                return True
+            if name in seen or name not in stacks:
+                continue
+            seen.add(name)
+            pending.extend(stacks[name].depends_on)
+        return False
+
+    return {
+        (stack.name, dependency)
+        for stack in stacks.values()
+        for dependency in stack.depends_on
+        if dependency in stacks
+        and stacks[dependency].bootstrap
+        and reaches(dependency, stack.name)
+    }
+
+
+def order(stacks: Dict[str, StackSpec]) -> List[List[str]]:
+    """Topological levels of the stacks, every level only depends on earlier ones."""
+    for stack in stacks.values():
+        unknown = stack.depends_on - set(stacks)
+        if unknown:
+            raise OrchestrationError(
+                f"stack {stack.name} depends on unknown stacks {', '.join(sorted(unknown))}"
+            )
+
+    bootstrapped = bootstrap_edges(stacks)
+    depends_on = {
+        name: {d for d in stack.depends_on if (name, d) not in bootstrapped}
+        for name, stack in stacks.items()
+    }
+
+    levels = []
+    done: Set[str] = set()
+    pending = set(stacks)
+    while pending:
+        level = sorted(s for s in pending if depends_on[s] <= done)
+        if not level:
+            raise OrchestrationError(
+                f"dependency cycle between stacks {', '.join(sorted(pending))}"
+            )
+        levels.append(level)
+        done.update(level)
+        pending.difference_update(level)
+
+    return levels
+
+
+class AutomationRunner:
+    """Runs a stack operation with the Pulumi Automation API.
+
+    `backend_url` (e.g. `file:///tmp/state`) is passed as PULUMI_BACKEND_URL, so
+    the programs can run against a local backend without Pulumi Cloud.
+    `on_event` receives the stack and every engine event of its operations.
+    The `bootstrap` operation is an `up` with the stack's bootstrap config,
+    only for stacks without outputs yet.
+    """
+
+    def __init__(
+        self,
+        backend_url: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        on_event: Optional[Callable[[StackSpec, Any], None]] = None,
+    ) -> None:
+        self.env = dict(env or {})
+        if backend_url:
+            self.env["PULUMI_BACKEND_URL"] = backend_url
+        self.on_event = on_event
+
+    def __call__(
+        self,
+        stack: StackSpec,
+        operation: str,
+        parallel: Optional[int],
+        on_output: Callable[[str], None],
+    ) -> None:
+        # Imported here so that discovery and ordering work without the SDK
+        from pulumi import automation as auto
+
+        workspace_stack = auto.create_or_select_stack(
+            stack_name=stack.qualified_name,
+            work_dir=stack.program_dir,
+            opts=auto.LocalWorkspaceOptions(env_vars=self.env),
+        )
+        kwargs: Dict[str, Any] = {"on_output": on_output}
+        if self.on_event is not None:
+            kwargs["on_event"] = lambda event: self.on_event(stack, event)
+        if parallel:
+            kwargs["parallel"] = parallel
+        if operation != BOOTSTRAP:
+            getattr(workspace_stack, operation)(**kwargs)
+            return
+
+        if workspace_stack.outputs():
+            on_output("deployed before, nothing to bootstrap")
+            return
+        # The config is written to the stack file, which is put back afterwards
+        stack_file = os.path.join(stack.program_dir, f"Pulumi.{stack.name}.yaml")
+        with open(stack_file) as f:
+            original = f.read()
+        try:
+            workspace_stack.set_all_config(
+                {
+                    f"{stack.project}:{key}": auto.ConfigValue(
+                        value if isinstance(value, str) else json.dumps(value)
+                    )
+                    for key, value in (stack.bootstrap or {}).items()
+                }
+            )
+            workspace_stack.up(**kwargs)
+        finally:
+            with open(stack_file, "w") as f:
+                f.write(original)
+
+
+class Orchestrator:
+    def __init__(
+        self,
+        stacks: Dict[str, StackSpec],
+        runner: Optional[Runner] = None,
+        workers: int = 4,
+        parallel: Optional[Dict[str, int]] = None,
+        output=None,
+    ) -> None:
+        self.stacks = stacks
+        self.runner = runner or AutomationRunner()
+        self.workers = workers
+        self.parallel = parallel or {}
+        self.output = output or sys.stdout
+        self._output_lock = threading.Lock()
+        order(stacks)  # fail early on cycles and unknown stacks
+
+    def run(
+        self, operation: str, only: Optional[Iterable[str]] = None
+    ) -> Dict[str, Result]:
+        if operation not in OPERATIONS:
+            raise OrchestrationError(f"unknown operation {operation}")
+        selected = set(only) if only is not None else set(self.stacks)
+        unknown = selected - set(self.stacks)
+        if unknown:
+            raise OrchestrationError(f"unknown stacks {', '.join(sorted(unknown))}")
+
+        results: Dict[str, Result] = {}
+        running: Dict[concurrent.futures.Future, str] = {}
+        pending = self._pending(operation, selected)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while pending or running:
+                for name, depends_on in list(pending.items()):
+                    failed = [
+                        d
+                        for d in depends_on
+                        if d in results and results[d].status != "succeeded"
+                    ]
+                    if failed:
+                        del pending[name]
+                        results[name] = Result(
+                            name, "skipped", 0.0, f"{failed[0]} did not succeed"
+                        )
+                        self._write(name, f"skipped, {results[name].error}")
+                    elif all(d in results for d in depends_on):
+                        del pending[name]
+                        running[pool.submit(self._run_stack, name, operation)] = name
+
+                if not running:
+                    continue
+                finished, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in finished:
+                    result = future.result()
+                    results[result.stack] = result
+                    del running[future]
+
+        return results
+
+    def _pending(self, operation: str, selected: Set[str]) -> Dict[str, Set[str]]:
+        # What every run waits for, dependencies outside the selection are
+        # assumed to be deployed already
+        bootstrapped = bootstrap_edges(self.stacks)
+        pending = {
+            name: {
+                d
+                for d in self.stacks[name].depends_on & selected
+                if (name, d) not in bootstrapped
+            }
+            for name in sorted(selected)
+        }
+        if operation == "up":
+            # The stacks of a cycle wait for the bootstrap pass of the stack
+            # they depend on, which waits for nothing
+            for name, dependency in sorted(bootstrapped):
+                if name in selected and dependency in selected:
+                    pending[name].add(_bootstrap_name(dependency))
+                    pending[_bootstrap_name(dependency)] = set()
+        if operation == "destroy":
+            # Stacks wait for the ones that depend on them instead
+            pending = {
+                name: {s for s in selected if name in pending[s]} for name in pending
+            }
+        return pending
+
+    def _run_stack(self, name: str, operation: str) -> Result:
+        stack = self.stacks[name.partition(":")[0]]
+        if name != stack.name:
+            operation = BOOTSTRAP
+        parallel = self.parallel.get(stack.name, stack.parallel)
+        self._write(name, f"{operation} started")
+        started = time.perf_counter()
+        try:
+            self.runner(
+                stack, operation, parallel, lambda line: self._write(name, line)
+            )
+        except Exception as e:  # every failure is reported, not raised
+            duration = time.perf_counter() - started
+            self._write(name, f"{operation} failed after {duration:.1f}s: {e}")
+            return Result(name, "failed", duration, str(e))
+
+        duration = time.perf_counter() - started
+        self._write(name, f"{operation} succeeded in {duration:.1f}s")
+        return Result(name, "succeeded", duration)
+
+    def _write(self, stack: str, text: str) -> None:
+        with self._output_lock:
+            for line in text.rstrip("\n").splitlines() or [""]:
+                self.output.write(f"[{stack}] {line}\n")
+            self.output.flush()
+
+
+def _bootstrap_name(stack: str) -> str:
+    return f"{stack}:{BOOTSTRAP}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("operation", choices=OPERATIONS)
+    parser.add_argument("--stacks", nargs="+", help="run only these stacks")
+    parser.add_argument(
+        "--workers", type=int, default=4, help="stacks run at the same time"
+    )
+    parser.add_argument(
+        "--parallel",
+        action="append",
+        default=[],
+        metavar="STACK=N",
+        help="resource operations in parallel within a stack",
+    )
+    parser.add_argument("--backend", help="state backend URL, e.g. file:///tmp/state")
+    parser.add_argument("--environments-dir", default=ENVIRONMENTS_DIR)
+    args = parser.parse_args()
+
+    parallel = {}
+    for item in args.parallel:
+        stack, _, value = item.partition("=")
+        parallel[stack] = int(value)
+
+    stacks = discover(args.environments_dir)
+    bootstrapped = sorted({d for _, d in bootstrap_edges(stacks)})
+    if bootstrapped:
+        print(f"bootstrap: {', '.join(bootstrapped)}")
+    for level, names in enumerate(order(stacks)):
+        print(f"level {level}: {', '.join(names)}")
+
+    orchestrator = Orchestrator(
+        stacks,
+        runner=AutomationRunner(backend_url=args.backend),
+        workers=args.workers,
+        parallel=parallel,
+    )
+    results = orchestrator.run(args.operation, only=args.stacks)
+
+    for result in results.values():
+        print(f"{result.stack:<16} {result.status:<10} {result.duration:>8.1f}s")
+    if any(r.status != "succeeded" for r in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,517 @@
+"""Hop by hop latency, cost and bandwidth model of the hub and spoke topology.
+
+Reads the resource graphs of the root and networking stacks (`pulumi stack
+export`, or `benchmarks/construction.py --graph-dir` against mocks), works out
+for every environment and destination class the hops its traffic takes, the
+share of it that crosses AZs, the per-GB charges, the fixed monthly charges and
+the bandwidth ceiling of the path, and compares the current topology with
+alternatives (NAT Gateway per AZ, gateway endpoints everywhere, central or
+local interface endpoints, ...). Runs offline.
+
+    python -m leviathan.path_model graphs/root-10.json graphs/networking.json
+    python -m leviathan.path_model root.json networking.json \\
+        --profile dev=flowlogs-dev.json --price nat_gb=0.052 --output paths.json
+
+A profile is the GB per month of every destination class, either as
+`{"internet": 120, "s3": 900, ...}` or a `leviathan.flowlog_analyzer` report.
+Without one every class carries 1 GB, i.e. the figures are per GB. AZs are
+compared by name, which assumes the accounts share the AZ mapping.
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+from leviathan import consts, guard
+from leviathan.endpoints import GATEWAY_ENDPOINTS, is_shared
+
+HOURS_PER_MONTH = 730
+
+# USD, per GB processed or per hour, of the primary region
+PRICES = {
+    "tgw_gb": 0.02,
+    "tgw_attachment_hour": 0.05,
+    "nat_gb": 0.045,
+    "nat_hour": 0.045,
+    "interface_endpoint_gb": 0.01,
+    "interface_endpoint_az_hour": 0.01,
+    "resolver_endpoint_eni_hour": 0.125,
+    "cross_az_gb": 0.02,  # 0.01 charged on each side
+    "internet_gb": 0.09,
+}
+
+# Added one way latency in ms and the ceiling in Gbps of a single instance in
+# one AZ, None where there is none worth modelling
+HOPS = {
+    "vpc": (0.05, None),
+    "cross-az": (0.5, None),
+    "transit-gateway": (0.5, 100.0),
+    "nat-gateway": (0.1, 100.0),
+    "internet-gateway": (0.05, None),
+    "gateway-endpoint": (0.05, None),
+    "interface-endpoint": (0.1, 100.0),
+}
+
+DESTINATIONS = ("internet", "s3", "dynamodb", "aws-api", "spoke")
+# Services `aws-api` traffic is spread over
+API_SERVICES = [e for e in consts.DefaultEndpoints if e not in GATEWAY_ENDPOINTS]
+
+RESOLVER_RULE_ASSOCIATION = (
+    "aws:route53/resolverRuleAssociation:ResolverRuleAssociation"
+)
+RESOLVER_ENDPOINT = "aws:route53/resolverEndpoint:ResolverEndpoint"
+
+
+class Hub(NamedTuple):
+    name: str
+    azs: Tuple[str, ...]
+    nat_gateways: Dict[str, int]  # per AZ
+    shared_endpoints: FrozenSet[str]
+    resolver_endpoint_enis: int
+
+
+class Environment(NamedTuple):
+    name: str
+    hub: str
+    azs: Tuple[str, ...]
+    gateway_endpoints: FrozenSet[str]
+    interface_endpoints: FrozenSet[str]
+    # Services resolved to the interface endpoints of the hub
+    shared_endpoints: FrozenSet[str]
+
+
+class Topology(NamedTuple):
+    hubs: Dict[str, Hub]
+    environments: Dict[str, Environment]
+
+
+class Path(NamedTuple):
+    hops: Tuple[str, ...]
+    cross_az: float  # share of the traffic
+    per_gb: float
+    latency_ms: float
+    ceiling_gbps: Optional[float]
+
+
+def _service(endpoint: guard.Resource) -> str:
+    # com.amazonaws.<region>.<service>, services may have dots (ecr.dkr)
+    return (endpoint.prop("serviceName") or "").split(".", 3)[-1]
+
+
+def _name(urn: str) -> str:
+    return urn.split("::")[-1]
+
+
+def from_graphs(graphs: Iterable[List[dict]]) -> Topology:
+    """Hubs are the VPCs with an internet gateway, environments the attached ones."""
+    stack = guard.Stack(r for resources in graphs for r in guard.from_graph(resources))
+
+    def in_vpc(typ: str) -> Dict[str, List[guard.Resource]]:
+        found: Dict[str, List[guard.Resource]] = {}
+        for r in stack.by_type[typ]:
+            found.setdefault(stack.vpc_of(r), []).append(r)
+        return found
+
+    subnets = in_vpc("aws:ec2/subnet:Subnet")
+    endpoints = in_vpc(guard.VPC_ENDPOINT)
+    with_internet = set(in_vpc(guard.INTERNET_GATEWAY))
+    attached = set(in_vpc(guard.VPC_ATTACHMENT))
+    resolver_rules = in_vpc(RESOLVER_RULE_ASSOCIATION)
+
+    def azs(vpc: str) -> Tuple[str, ...]:
+        return tuple(
+            sorted({s.prop("availabilityZone") for s in subnets.get(vpc, [])} - {None})
+        )
+
+    def services(vpc: str, endpoint_type: str) -> FrozenSet[str]:
+        return frozenset(
+            _service(e)
+            for e in endpoints.get(vpc, [])
+            if (e.prop("vpcEndpointType") or "Gateway") == endpoint_type
+        )
+
+    hubs = {}
+    for vpc in sorted(with_internet - {None}):
+        nat_gateways: Dict[str, int] = {}
+        for nat_gateway in stack.by_type[guard.NAT_GATEWAY]:
+            for subnet in stack.related(nat_gateway, "subnetId"):
+                if stack.vpc_of(subnet) == vpc:
+                    az = subnet.prop("availabilityZone")
+                    nat_gateways[az] = nat_gateways.get(az, 0) + 1
+        enis = sum(
+            len(r.prop("ipAddresses") or [])
+            for r in stack.by_type[RESOLVER_ENDPOINT]
+            # The subnets of a resolver endpoint are nested in its ipAddresses
+            if any(stack.vpc_of(s) == vpc for s in stack.related(r, "ipAddresses"))
+        )
+        name = _name(vpc)
+        hubs[name] = Hub(name, azs(vpc), nat_gateways, services(vpc, "Interface"), enis)
+
+    environments = {}
+    for vpc in sorted(attached - with_internet - {None}):
+        name = _name(vpc)
+        shared = frozenset(
+            _name(r.urn)[len(name) + 1 : -len("-resolver-rule-association")]
+            for r in resolver_rules.get(vpc, [])
+        )
+        environments[name] = Environment(
+            name,
+            _hub_for(name, hubs),
+            azs(vpc),
+            services(vpc, "Gateway"),
+            services(vpc, "Interface"),
+            shared,
+        )
+
+    return Topology(hubs, environments)
+
+
+def _hub_for(environment: str, hubs: Dict[str, Hub]) -> str:
+    # Names outside the primary region end in the region, see leviathan.regions
+    for hub in sorted(hubs, key=len, reverse=True):
+        suffix = hub[len("main") :]
+        if suffix and environment.endswith(suffix):
+            return hub
+    return "main" if "main" in hubs else next(iter(sorted(hubs)), "")
+
+
+def _hop(name: str) -> Tuple[float, Optional[float]]:
+    return HOPS[name]
+
+
+def _path(
+    hops: List[str],
+    cross_az: float,
+    per_gb: float,
+    ceilings: Dict[str, float],
+) -> Path:
+    latency = sum(_hop(h)[0] for h in hops) + cross_az * _hop("cross-az")[0]
+    limits = [ceilings[h] for h in hops if h in ceilings]
+    return Path(
+        tuple(hops),
+        round(cross_az, 3),
+        round(per_gb + cross_az * PRICES["cross_az_gb"], 4),
+        round(latency, 3),
+        min(limits) if limits else None,
+    )
+
+
+def path(
+    topology: Topology, environment: str, destination: str, service: str = ""
+) -> Path:
+    """Path of the traffic of an environment to a destination class.
+
+    `service` picks the interface endpoint service for `aws-api`.
+    """
+    env = topology.environments[environment]
+    hub = topology.hubs.get(env.hub)
+    prices = PRICES
+    env_azs = max(len(env.azs), 1)
+
+    # The Transit Gateway keeps traffic in its AZ when the hub is attached there
+    hub_azs = set(hub.azs) if hub else set()
+    nat_azs = {az for az, count in (hub.nat_gateways if hub else {}).items() if count}
+    tgw_cross = sum(1 for az in env.azs if az not in hub_azs) / env_azs
+    nat_cross = sum(1 for az in env.azs if az not in nat_azs) / env_azs
+    nat_count = sum(hub.nat_gateways.values()) if hub else 0
+    ceilings = {
+        "transit-gateway": _hop("transit-gateway")[1] * env_azs,
+        "nat-gateway": _hop("nat-gateway")[1] * max(nat_count, 1),
+        "interface-endpoint": _hop("interface-endpoint")[1] * env_azs,
+    }
+
+    through_nat = (
+        ["vpc", "transit-gateway", "nat-gateway", "internet-gateway"],
+        max(tgw_cross, nat_cross),
+        prices["tgw_gb"] + prices["nat_gb"],
+    )
+    if destination == "internet":
+        hops, cross, per_gb = through_nat
+        return _path(hops, cross, per_gb + prices["internet_gb"], ceilings)
+    if destination in GATEWAY_ENDPOINTS:
+        if destination in env.gateway_endpoints:
+            return _path(["vpc", "gateway-endpoint"], 0.0, 0.0, ceilings)
+        return _path(*through_nat, ceilings)
+    if destination == "aws-api":
+        if service in env.interface_endpoints:
+            return _path(
+                ["vpc", "interface-endpoint"],
+                0.0,
+                prices["interface_endpoint_gb"],
+                ceilings,
+            )
+        if service in env.shared_endpoints and hub and service in hub.shared_endpoints:
+            return _path(
+                ["vpc", "transit-gateway", "interface-endpoint"],
+                tgw_cross,
+                prices["tgw_gb"] + prices["interface_endpoint_gb"],
+                ceilings,
+            )
+        return _path(*through_nat, ceilings)
+    if destination == "spoke":
+        return _path(["vpc", "transit-gateway", "vpc"], 0.0, prices["tgw_gb"], ceilings)
+    raise ValueError(f"unknown destination class {destination}")
+
+
+def fixed_monthly(topology: Topology) -> Dict[str, float]:
+    hours = HOURS_PER_MONTH
+    nat_gateways = sum(sum(h.nat_gateways.values()) for h in topology.hubs.values())
+    attachments = len(topology.hubs) + len(topology.environments)
+    endpoint_azs = sum(
+        len(h.azs) * len(h.shared_endpoints) for h in topology.hubs.values()
+    )
+    endpoint_azs += sum(
+        len(e.azs) * len(e.interface_endpoints) for e in topology.environments.values()
+    )
+    enis = sum(h.resolver_endpoint_enis for h in topology.hubs.values())
+    return {
+        "nat_gateways": round(nat_gateways * PRICES["nat_hour"] * hours, 2),
+        "tgw_attachments": round(
+            attachments * PRICES["tgw_attachment_hour"] * hours, 2
+        ),
+        "interface_endpoints": round(
+            endpoint_azs * PRICES["interface_endpoint_az_hour"] * hours, 2
+        ),
+        "resolver_endpoints": round(
+            enis * PRICES["resolver_endpoint_eni_hour"] * hours, 2
+        ),
+    }
+
+
+def _nat_per_az(t: Topology) -> Topology:
+    return t._replace(
+        hubs={
+            name: hub._replace(
+                nat_gateways={az: max(hub.nat_gateways.get(az, 0), 1) for az in hub.azs}
+            )
+            for name, hub in t.hubs.items()
+        }
+    )
+
+
+def _single_nat(t: Topology) -> Topology:
+    return t._replace(
+        hubs={
+            name: hub._replace(nat_gateways={hub.azs[0]: 1} if hub.azs else {})
+            for name, hub in t.hubs.items()
+        }
+    )
+
+
+def _gateway_endpoints(t: Topology) -> Topology:
+    return t._replace(
+        environments={
+            name: env._replace(gateway_endpoints=frozenset(GATEWAY_ENDPOINTS))
+            for name, env in t.environments.items()
+        }
+    )
+
+
+def _central_endpoints(t: Topology) -> Topology:
+    moved = {
+        name: frozenset(s for s in env.interface_endpoints if is_shared(s))
+        for name, env in t.environments.items()
+    }
+    shared = frozenset(s for services in moved.values() for s in services)
+    return t._replace(
+        hubs={
+            name: hub._replace(
+                shared_endpoints=hub.shared_endpoints | shared,
+                # An inbound resolver endpoint, two ENIs, answers for the zones
+                resolver_endpoint_enis=max(hub.resolver_endpoint_enis, 2),
+            )
+            for name, hub in t.hubs.items()
+        },
+        environments={
+            name: env._replace(
+                interface_endpoints=env.interface_endpoints - moved[name],
+                shared_endpoints=env.shared_endpoints | moved[name],
+            )
+            for name, env in t.environments.items()
+        },
+    )
+
+
+def _local_endpoints(t: Topology) -> Topology:
+    return t._replace(
+        hubs={
+            name: hub._replace(shared_endpoints=frozenset(), resolver_endpoint_enis=0)
+            for name, hub in t.hubs.items()
+        },
+        environments={
+            name: env._replace(
+                interface_endpoints=env.interface_endpoints | env.shared_endpoints,
+                shared_endpoints=frozenset(),
+            )
+            for name, env in t.environments.items()
+        },
+    )
+
+
+VARIANTS = {
+    "current": lambda t: t,
+    "nat-per-az": _nat_per_az,
+    "single-nat": _single_nat,
+    "gateway-endpoints": _gateway_endpoints,
+    "central-endpoints": _central_endpoints,
+    "local-endpoints": _local_endpoints,
+}
+
+
+def load_profile(path: str) -> Dict[str, float]:
+    """GB per destination class, from a plain map or a flow log analyzer report."""
+    with open(path) as f:
+        data = json.load(f)
+    if "destination_bytes" not in data:
+        return {k: float(v) for k, v in data.items()}
+
+    profile: Dict[str, float] = {}
+    for label, nbytes in data["destination_bytes"].items():
+        if label == "internet":
+            destination = "internet"
+        elif label.startswith("aws "):
+            destination = label[len("aws ") :]
+        elif label.startswith("vpc ") or label == "other private":
+            destination = "spoke"
+        else:
+            continue  # within the VPC
+        profile[destination] = profile.get(destination, 0.0) + nbytes / 1e9
+    return profile
+
+
+def evaluate(
+    topology: Topology, profiles: Optional[Dict[str, Dict[str, float]]] = None
+) -> dict:
+    """Paths and monthly charges of every environment of a topology."""
+    profiles = profiles or {}
+    environments = {}
+    data_cost = 0.0
+    for name, env in sorted(topology.environments.items()):
+        profile = (
+            profiles.get(name) or profiles.get("*") or {d: 1.0 for d in DESTINATIONS}
+        )
+        classes = {}
+        for destination in DESTINATIONS:
+            gb = profile.get(destination, 0.0)
+            if destination == "aws-api":
+                # Spread over the interface endpoint services
+                services = API_SERVICES
+                paths = [path(topology, name, destination, s) for s in services]
+                per_gb = sum(p.per_gb for p in paths) / len(paths)
+                worst = max(paths, key=lambda p: p.latency_ms)
+                classes[destination] = {
+                    "hops": {s: list(p.hops) for s, p in zip(services, paths)},
+                    "cross_az": round(sum(p.cross_az for p in paths) / len(paths), 3),
+                    "per_gb": round(per_gb, 4),
+                    "latency_ms": worst.latency_ms,
+                    "ceiling_gbps": min(
+                        (p.ceiling_gbps for p in paths if p.ceiling_gbps), default=None
+                    ),
+                    "gb": gb,
+                    "cost": round(gb * per_gb, 2),
+                }
+            else:
+                p = path(topology, name, destination)
+                classes[destination] = {
+                    "hops": list(p.hops),
+                    "cross_az": p.cross_az,
+                    "per_gb": p.per_gb,
+                    "latency_ms": p.latency_ms,
+                    "ceiling_gbps": p.ceiling_gbps,
+                    "gb": gb,
+                    "cost": round(gb * p.per_gb, 2),
+                }
+            data_cost += classes[destination]["cost"]
+        environments[name] = classes
+
+    fixed = fixed_monthly(topology)
+    return {
+        "fixed_monthly": fixed,
+        "data_monthly": round(data_cost, 2),
+        "total_monthly": round(sum(fixed.values()) + data_cost, 2),
+        "environments": environments,
+    }
+
+
+def compare(
+    topology: Topology,
+    profiles: Optional[Dict[str, Dict[str, float]]] = None,
+    variants: Optional[Iterable[str]] = None,
+) -> Dict[str, dict]:
+    return {
+        name: evaluate(VARIANTS[name](topology), profiles)
+        for name in (variants or VARIANTS)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("graphs", nargs="+", help="checkpoints or recorded graphs")
+    parser.add_argument(
+        "--profile",
+        action="append",
+        default=[],
+        metavar="[ENV=]PATH",
+        help="traffic profile of an environment, or of all of them",
+    )
+    parser.add_argument(
+        "--price",
+        action="append",
+        default=[],
+        metavar="NAME=USD",
+        help=f"override a price, one of {', '.join(PRICES)}",
+    )
+    parser.add_argument(
+        "--variant",
+        action="append",
+        choices=list(VARIANTS),
+        help="topologies to compare, all by default",
+    )
+    parser.add_argument("--output", help="write the JSON comparison to this file")
+    args = parser.parse_args()
+
+    for item in args.price:
+        name, _, value = item.partition("=")
+        if name not in PRICES:
+            parser.error(f"unknown price {name}")
+        PRICES[name] = float(value)
+
+    profiles = {}
+    for item in args.profile:
+        environment, _, profile_path = item.rpartition("=")
+        profiles[environment or "*"] = load_profile(profile_path)
+
+    graphs = []
+    for graph_path in args.graphs:
+        with open(graph_path) as f:
+            data = json.load(f)
+        graphs.append(data.get("deployment", data).get("resources", []))
+    topology = from_graphs(graphs)
+    if not topology.environments:
+        sys.exit("no environment VPCs attached to a Transit Gateway in the graphs")
+
+    comparison = compare(topology, profiles, args.variant)
+    print(f"{'topology':<20} {'fixed':>10} {'data':>10} {'total':>10}  USD/month")
+    for name, result in comparison.items():
+        print(
+            f"{name:<20} {sum(result['fixed_monthly'].values()):>10.2f} "
+            f"{result['data_monthly']:>10.2f} {result['total_monthly']:>10.2f}"
+        )
+    current = comparison.get("current") or next(iter(comparison.values()))
+    for environment, classes in current["environments"].items():
+        print(environment)
+        for destination, c in classes.items():
+            chains = [c["hops"]] if isinstance(c["hops"], list) else c["hops"].values()
+            print(
+                f"  {destination:<9} {c['per_gb']:>7.4f}/GB {c['latency_ms']:>6.2f}ms "
+                f"cross-AZ {c['cross_az']:>4.0%}  "
+                + " | ".join(sorted({" > ".join(hops) for hops in chains}))
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(comparison, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
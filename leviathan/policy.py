@@ -0,0 +1,258 @@
+import json
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import pulumi
+
+VERSION = "2012-10-17"
+
+# Maximum characters (whitespace excluded) per kind of policy document
+SIZE_LIMITS = {
+    "managed": 6144,
+    "inline": 10240,
+    "trust": 2048,
+    "bucket": 20480,
+    "registry": 10240,
+    "repository": 10240,
+}
+
+# Statement keys in the order AWS documents them
+_KEY_ORDER = {
+    key: index
+    for index, key in enumerate(
+        ("Sid", "Effect", "Principal", "Action", "NotAction")
+        + ("Resource", "NotResource", "Condition")
+    )
+}
+
+
+class PolicyError(Exception):
+    pass
+
+
+class Principal(NamedTuple):
+    type: str  # AWS, Service, Federated or *
+    identifiers: Tuple[pulumi.Input[str], ...]
+
+
+class Condition(NamedTuple):
+    test: str  # StringEquals, ArnLike, Bool, ...
+    variable: str
+    values: Tuple[pulumi.Input[str], ...]
+
+
+class Statement(NamedTuple):
+    actions: Tuple[str, ...] = ()
+    resources: Tuple[pulumi.Input[str], ...] = ()
+    effect: str = "Allow"
+    principals: Tuple[Principal, ...] = ()
+    conditions: Tuple[Condition, ...] = ()
+    not_actions: Tuple[str, ...] = ()
+    not_resources: Tuple[pulumi.Input[str], ...] = ()
+    sid: Optional[str] = None
+
+
+def service(*services: str) -> Principal:
+    return Principal("Service", tuple(services))
+
+
+def condition(test: str, variable: str, *values: pulumi.Input[str]) -> Condition:
+    return Condition(test, variable, tuple(values))
+
+
+def allow(
+    actions: Iterable[str],
+    resources: Iterable[pulumi.Input[str]] = (),
+    principals: Iterable[Principal] = (),
+    conditions: Iterable[Condition] = (),
+    sid: Optional[str] = None,
+) -> Statement:
+    return Statement(
+        actions=tuple(actions),
+        resources=tuple(resources),
+        principals=tuple(principals),
+        conditions=tuple(conditions),
+        sid=sid,
+    )
+
+
+def deny(
+    actions: Iterable[str],
+    resources: Iterable[pulumi.Input[str]] = (),
+    principals: Iterable[Principal] = (),
+    conditions: Iterable[Condition] = (),
+    sid: Optional[str] = None,
+) -> Statement:
+    return allow(actions, resources, principals, conditions, sid)._replace(
+        effect="Deny"
+    )
+
+
+class PolicyCache:
+    """Canonical JSON of every policy document rendered by the program.
+
+    Identical statements render once, so the documents every environment
+    shares (assume role policies, the flow log role policy, ...) are built a
+    single time and are the same string object everywhere.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._documents: Dict[Tuple[str, Tuple[Statement, ...]], str] = {}
+
+    def render(self, kind: str, statements: Tuple[Statement, ...]) -> str:
+        key = (kind, statements)
+        document = self._documents.get(key)
+        if document is not None:
+            self.hits += 1
+            return document
+
+        self.misses += 1
+        document = _render(kind, statements)
+        self._documents[key] = document
+        return document
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "documents": len(self._documents),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_default_cache = PolicyCache()
+
+
+def default() -> PolicyCache:
+    return _default_cache
+
+
+def document(*statements: Statement, kind: str = "managed") -> pulumi.Input[str]:
+    """Canonical, minified JSON policy document.
+
+    Statements are checked right away, values that are Outputs (bucket ARNs,
+    the organization id, ...) are filled in once known and the document is a
+    plain string otherwise, so no provider invoke is needed either way.
+    """
+    if kind not in SIZE_LIMITS:
+        raise PolicyError(f"unknown policy kind {kind}")
+    if not statements:
+        raise PolicyError("a policy document needs at least one statement")
+
+    sids = [s.sid for s in statements if s.sid]
+    if len(sids) != len(set(sids)):
+        raise PolicyError(f"duplicate statement ids in {sids}")
+    for statement in statements:
+        _check(statement)
+    if len(set(statements)) != len(statements):
+        raise PolicyError("duplicate statements")
+
+    outputs = [v for s in statements for v in _values(s) if _is_output(v)]
+    if not outputs:
+        return _default_cache.render(kind, statements)
+
+    def resolve(values: List[Any]) -> str:
+        resolved = iter(values)
+        known = {id(o): next(resolved) for o in outputs}
+        return _default_cache.render(
+            kind, tuple(_substitute(s, known) for s in statements)
+        )
+
+    return pulumi.Output.all(*outputs).apply(resolve)
+
+
+def _check(statement: Statement) -> None:
+    if statement.effect not in ("Allow", "Deny"):
+        raise PolicyError(f"effect must be Allow or Deny, not {statement.effect}")
+    if bool(statement.actions) == bool(statement.not_actions):
+        raise PolicyError("a statement needs either actions or not_actions")
+    if statement.resources and statement.not_resources:
+        raise PolicyError("a statement takes either resources or not_resources")
+    for action in (*statement.actions, *statement.not_actions):
+        if action != "*" and ":" not in action:
+            raise PolicyError(f"action {action} is not <service>:<action>")
+
+
+def _values(statement: Statement) -> Iterable[pulumi.Input[str]]:
+    yield from statement.resources
+    yield from statement.not_resources
+    for principal in statement.principals:
+        yield from principal.identifiers
+    for c in statement.conditions:
+        yield from c.values
+
+
+def _is_output(value: Any) -> bool:
+    return isinstance(value, pulumi.Output)
+
+
+def _substitute(statement: Statement, known: Dict[int, str]) -> Statement:
+    def plain(values):
+        return tuple(known[id(v)] if _is_output(v) else v for v in values)
+
+    return statement._replace(
+        resources=plain(statement.resources),
+        not_resources=plain(statement.not_resources),
+        principals=tuple(
+            p._replace(identifiers=plain(p.identifiers)) for p in statement.principals
+        ),
+        conditions=tuple(
+            c._replace(values=plain(c.values)) for c in statement.conditions
+        ),
+    )
+
+
+def _one_or_many(values: Iterable[str]) -> Any:
+    # Sorted and deduplicated, a single value is written on its own like AWS does
+    values = sorted(set(values))
+    return values[0] if len(values) == 1 else values
+
+
+def _statement_json(statement: Statement) -> Dict[str, Any]:
+    data: Dict[str, Any] = {"Effect": statement.effect}
+    if statement.sid:
+        data["Sid"] = statement.sid
+    if statement.principals:
+        principals: Dict[str, List[str]] = {}
+        for p in statement.principals:
+            principals.setdefault(p.type, []).extend(p.identifiers)
+        data["Principal"] = (
+            "*"
+            if set(principals) == {"*"}
+            else {t: _one_or_many(ids) for t, ids in sorted(principals.items())}
+        )
+    if statement.actions:
+        data["Action"] = _one_or_many(statement.actions)
+    if statement.not_actions:
+        data["NotAction"] = _one_or_many(statement.not_actions)
+    if statement.resources:
+        data["Resource"] = _one_or_many(statement.resources)
+    if statement.not_resources:
+        data["NotResource"] = _one_or_many(statement.not_resources)
+    if statement.conditions:
+        conditions: Dict[str, Dict[str, List[str]]] = {}
+        for c in statement.conditions:
+            conditions.setdefault(c.test, {}).setdefault(c.variable, []).extend(
+                c.values
+            )
+        data["Condition"] = {
+            test: {v: _one_or_many(values) for v, values in sorted(variables.items())}
+            for test, variables in sorted(conditions.items())
+        }
+    return dict(sorted(data.items(), key=lambda item: _KEY_ORDER[item[0]]))
+
+
+def _render(kind: str, statements: Tuple[Statement, ...]) -> str:
+    rendered = [_statement_json(s) for s in statements]
+    # Statements equal once normalized, e.g. the same actions in another order
+    if len({json.dumps(s, sort_keys=True) for s in rendered}) != len(rendered):
+        raise PolicyError("duplicate statements")
+
+    document = json.dumps(
+        {"Version": VERSION, "Statement": rendered}, separators=(",", ":")
+    )
+    if len(document) > SIZE_LIMITS[kind]:
+        raise PolicyError(
+            f"{kind} policy is {len(document)} characters, "
+            f"the limit is {SIZE_LIMITS[kind]}"
+        )
+    return document
@@ -0,0 +1,75 @@
+from typing import Dict, Optional
+import pulumi
+import pulumi_aws as aws
+
+# Services the programs call, all sent to `aws_endpoint` when it is set
+EMULATED_SERVICES = [
+    "cloudwatch",
+    "ec2",
+    "glue",
+    "iam",
+    "organizations",
+    "ram",
+    "route53",
+    "route53resolver",
+    "s3",
+    "sts",
+]
+
+
+def emulator_config(endpoint: str) -> Dict[str, object]:
+    """`aws:` stack config sending the default provider to a local AWS emulator."""
+    return {
+        "aws:accessKey": "test",
+        "aws:secretKey": "test",
+        "aws:skipCredentialsValidation": True,
+        "aws:skipRequestingAccountId": True,
+        "aws:skipMetadataApiCheck": True,
+        "aws:s3UsePathStyle": True,
+        "aws:endpoints": [{service: endpoint for service in EMULATED_SERVICES}],
+    }
+
+
+def assume_role_provider(
+    name: str,
+    role_arn: pulumi.Input[str],
+    region: str,
+    opts: Optional[pulumi.ResourceOptions] = None,
+) -> aws.Provider:
+    """Provider for an organization account, through its access role.
+
+    The role is kept as the provider's `role_arn`.
+
+    With `aws_endpoint` (e.g. a moto server at http://localhost:5000) every
+    service is sent to that endpoint instead of AWS, see
+    benchmarks/integration.py. Without it the provider is the same as before.
+    """
+    endpoint = pulumi.Config().get("aws_endpoint")
+    emulator = {}
+    if endpoint:
+        emulator = dict(
+            access_key="test",
+            secret_key="test",
+            skip_credentials_validation=True,
+            skip_requesting_account_id=True,
+            skip_metadata_api_check=True,
+            s3_use_path_style=True,
+            endpoints=[
+                aws.ProviderEndpointArgs(
+                    **{service: endpoint for service in EMULATED_SERVICES}
+                )
+            ],
+        )
+
+    provider = aws.Provider(
+        name,
+        assume_role=aws.ProviderAssumeRoleArgs(
+            role_arn=role_arn, session_name="leviathan"
+        ),
+        region=region,
+        opts=opts,
+        **emulator,
+    )
+    # The account the provider acts in, what leviathan.invoke_cache keys on
+    provider.role_arn = pulumi.Output.from_input(role_arn)
+    return provider
@@ -0,0 +1,29 @@
+from typing import List, Optional
+import pulumi
+
+
+def primary() -> str:
+    """The `aws:region` of the stack, resources in it keep their original names."""
+    return pulumi.Config("aws").require("region")
+
+
+def configured(config: Optional[pulumi.Config] = None) -> List[str]:
+    """Every region of the stack, the primary one first.
+
+    `regions` lists the regions networking and environments are deployed to,
+    the primary region is always one of them.
+    """
+    config = config or pulumi.Config()
+    regions = [primary()]
+    for region in config.get_object("regions") or []:
+        if region not in regions:
+            regions.append(region)
+    return regions
+
+
+def suffix(region: Optional[str]) -> str:
+    # Appended to resource names outside the primary region, so that adding a
+    # region leaves the names, and URNs, of the existing resources alone
+    if region is None or region == primary():
+        return ""
+    return f"-{region}"
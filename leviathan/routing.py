@@ -1,39 +1,68 @@
-from typing import List
+from typing import List, Optional
 from pulumi import ComponentResource
 import pulumi_aws as aws
 import pulumi
+from leviathan import (
+    endpoints as shared_endpoints,
+    exports,
+    regions,
+    stack_refs,
+    tracing,
+)
+from leviathan.configuration import cidrs
 from leviathan.vpc import Vpc
 
 
 class Routing(ComponentResource):
-    def __init__(self, vpc: Vpc, opts, endpoints: List[str] = None) -> None:
+    @tracing.traced
+    def __init__(
+        self,
+        vpc: Vpc,
+        opts,
+        endpoints: List[str] = None,
+        region: Optional[str] = None,
+        hub_provider: Optional[aws.Provider] = None,
+    ) -> None:
         # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
-        super().__init__("pkg:leviathan:routing", "routing", None, opts=opts)
+        super().__init__(
+            "pkg:leviathan:routing", f"{vpc.name}-routing", None, opts=opts
+        )
         # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
         child_opts = pulumi.ResourceOptions(parent=self, providers=opts.providers)
 
-        org = pulumi.Config().require("org")
-        stack_ref = pulumi.StackReference(f"{org}/leviathan/networking")
-        transit_gateway_id = stack_ref.get_output("routing")["transit_gateway"]["id"]
-        egress_vpc_cidr = stack_ref.get_output("vpc_info")["cidr_block"]
+        # Egress goes to the hub in the region of the VPC
+        self.region = region or regions.primary()
+        networking = stack_refs.networking()
+        transit_gateway_id = networking.regional(
+            region, "routing", "transit_gateway_id"
+        )
+        egress_vpc_cidr = networking.regional(region, "vpc_info", "cidr_block")
 
         self.central_transit_attach = aws.ec2transitgateway.VpcAttachment(
             f"{vpc.name}-transit-gateway-attachment",
             transit_gateway_id=transit_gateway_id,
             vpc_id=vpc.id,
             subnet_ids=vpc.private_subnets,
+            ipv6_support="enable" if vpc.dual_stack else None,
             opts=child_opts,
             tags={"Name": vpc.name},
         )
+        # Routes through the Transit Gateway wait until the attachment is usable
+        self.attached = [self.central_transit_attach]
+
+        # With `tgw_route_domains` the attachment has a Transit Gateway route
+        # table of its own, managed from the hub account through `hub_provider`
+        self.transit_gateway_route_table = None
+        if pulumi.Config().get_bool("tgw_route_domains"):
+            if hub_provider is None:
+                raise ValueError(f"{vpc.name}: tgw_route_domains needs a hub_provider")
+            self._route_domain(vpc, transit_gateway_id, hub_provider)
 
         # Private route table
-        private_route_table = aws.ec2.RouteTable(
+        self.private_route_table = private_route_table = aws.ec2.RouteTable(
             f"{vpc.name}-priv-route-table",
             vpc_id=vpc.id,
-            tags={
-                "Name": f"{vpc.name}-priv-route-table",
-                "tgw_attachment": self.central_transit_attach.id,  # wait for transit gateway attachment
-            },
+            tags={"Name": f"{vpc.name}-priv-route-table"},
             opts=pulumi.ResourceOptions(parent=vpc, providers=child_opts.providers),
         )
 
@@ -45,27 +74,214 @@ class Routing(ComponentResource):
                 opts=pulumi.ResourceOptions(parent=private_route_table),
             )
 
-        tgw_route = aws.ec2.Route(
+        aws.ec2.Route(
             f"{vpc.name}-all-traffic-to-egress-vpc",
             destination_cidr_block=egress_vpc_cidr,
             route_table_id=private_route_table,
             transit_gateway_id=transit_gateway_id,
+            # Only routes through the Transit Gateway wait for the attachment, the
+            # route table, its associations and the gateway endpoints do not
             opts=pulumi.ResourceOptions(
-                parent=private_route_table, providers=child_opts.providers
+                depends_on=self.attached,
+                parent=private_route_table,
+                providers=child_opts.providers,
             ),
         )
 
-        self._interface_endpoints(vpc, private_route_table, child_opts, endpoints)
+        # Every environment of the region through one route to the shared
+        # prefix list of their CIDRs (`spoke_to_spoke`), the local route wins
+        # for the VPC's own entry. The environments stay apart when each one
+        # has a route domain of its own.
+        if pulumi.Config().get_bool("spoke_to_spoke"):
+            if self.transit_gateway_route_table is not None:
+                raise ValueError(
+                    "spoke_to_spoke and tgw_route_domains exclude each other"
+                )
+            aws.ec2.Route(
+                f"{vpc.name}-environments-route",
+                destination_prefix_list_id=networking.regional(
+                    region, "routing", "environments_prefix_list_id"
+                ),
+                route_table_id=private_route_table,
+                transit_gateway_id=transit_gateway_id,
+                opts=pulumi.ResourceOptions(
+                    depends_on=self.attached,
+                    parent=private_route_table,
+                    providers=child_opts.providers,
+                ),
+            )
+
+        # On-premises networks behind the VPN of the primary hub
+        if self.region == regions.primary():
+            self._onprem(vpc, transit_gateway_id, child_opts)
 
-        routing_data = {
-            "vpc": vpc.id,
-            "transit_gateway_attachment": self.central_transit_attach,
-            "transit_gateway_route": tgw_route,
-        }
+        if vpc.dual_stack:
+            self._ipv6_egress(vpc, private_route_table, transit_gateway_id, child_opts)
+
+        self._interface_endpoints(vpc, private_route_table, child_opts, endpoints)
 
-        pulumi.export("routing", routing_data)
         self.register_outputs({})
 
+    def to_export(self) -> dict:
+        return exports.versioned(
+            {
+                "transit_gateway_attachment_id": self.central_transit_attach.id,
+                "private_route_table_id": self.private_route_table.id,
+                "transit_gateway_route_table_id": (
+                    self.transit_gateway_route_table.id
+                    if self.transit_gateway_route_table is not None
+                    else None
+                ),
+            }
+        )
+
+    def _route_domain(
+        self,
+        vpc: Vpc,
+        transit_gateway_id: pulumi.Input[str],
+        hub_provider: aws.Provider,
+    ):
+        # The environment only reaches the hub: its route table holds the
+        # default route and the hub VPC, and the attachment propagates into the
+        # default route table for the replies. Nothing else changes when an
+        # environment is added, unlike the default route table every attachment
+        # used to share.
+        networking = stack_refs.networking()
+        hub_attachment_id = networking.regional(
+            self.region, "routing", "transit_gateway_attachment_id"
+        )
+        hub_opts = pulumi.ResourceOptions(parent=self, provider=hub_provider)
+
+        accepter = aws.ec2transitgateway.VpcAttachmentAccepter(
+            f"{vpc.name}-transit-gateway-attachment-accepter",
+            transit_gateway_attachment_id=self.central_transit_attach.id,
+            transit_gateway_default_route_table_association=False,
+            transit_gateway_default_route_table_propagation=True,
+            tags={"Name": vpc.name},
+            opts=hub_opts,
+        )
+        self.attached.append(accepter)
+
+        self.transit_gateway_route_table = aws.ec2transitgateway.RouteTable(
+            f"{vpc.name}-tgw-route-table",
+            transit_gateway_id=transit_gateway_id,
+            tags={"Name": f"{vpc.name}-tgw-route-table"},
+            opts=hub_opts,
+        )
+        route_table_opts = pulumi.ResourceOptions(
+            depends_on=[accepter],
+            parent=self.transit_gateway_route_table,
+            provider=hub_provider,
+        )
+
+        aws.ec2transitgateway.RouteTableAssociation(
+            f"{vpc.name}-tgw-route-table-association",
+            transit_gateway_attachment_id=accepter.transit_gateway_attachment_id,
+            transit_gateway_route_table_id=self.transit_gateway_route_table.id,
+            opts=route_table_opts,
+        )
+
+        aws.ec2transitgateway.RouteTablePropagation(
+            f"{vpc.name}-tgw-hub-propagation",
+            transit_gateway_attachment_id=hub_attachment_id,
+            transit_gateway_route_table_id=self.transit_gateway_route_table.id,
+            opts=route_table_opts,
+        )
+
+        self._route_table_opts = route_table_opts
+
+        destinations = [("egress", cidrs.EVERYWHERE)]
+        if vpc.dual_stack:
+            destinations.append(("nat64", cidrs.NAT64_PREFIX))
+        for name, destination in destinations:
+            aws.ec2transitgateway.Route(
+                f"{vpc.name}-tgw-{name}-route",
+                destination_cidr_block=destination,
+                transit_gateway_attachment_id=hub_attachment_id,
+                transit_gateway_route_table_id=self.transit_gateway_route_table.id,
+                opts=route_table_opts,
+            )
+
+    def _onprem(
+        self,
+        vpc: Vpc,
+        transit_gateway_id: pulumi.Input[str],
+        opts: pulumi.ResourceOptions,
+    ):
+        # The VPN lives in the networking stack (`vpn`), its attachments and
+        # on-premises prefix list are given to this stack as
+        # `vpn_attachment_ids` and `onprem_prefix_list_id`, the values of the
+        # networking stack's `routing` output. Resources can't be declared from
+        # stack reference outputs, they would be missing from previews and
+        # from the dependency graph.
+        config = pulumi.Config()
+
+        # Every VPN attachment propagates into the route domain, so that flows to
+        # on-premises keep spreading over all the tunnels
+        if self.transit_gateway_route_table is not None:
+            for index, attachment_id in enumerate(
+                config.get_object("vpn_attachment_ids") or []
+            ):
+                aws.ec2transitgateway.RouteTablePropagation(
+                    f"{vpc.name}-tgw-vpn-propagation-{index}",
+                    transit_gateway_attachment_id=attachment_id,
+                    transit_gateway_route_table_id=self.transit_gateway_route_table.id,
+                    opts=self._route_table_opts,
+                )
+
+        onprem_prefix_list_id = config.get("onprem_prefix_list_id")
+        if onprem_prefix_list_id:
+            aws.ec2.Route(
+                f"{vpc.name}-onprem-route",
+                destination_prefix_list_id=onprem_prefix_list_id,
+                route_table_id=self.private_route_table.id,
+                transit_gateway_id=transit_gateway_id,
+                opts=pulumi.ResourceOptions(
+                    depends_on=self.attached,
+                    parent=self.private_route_table,
+                    providers=opts.providers,
+                ),
+            )
+
+    def _ipv6_egress(
+        self,
+        vpc: Vpc,
+        private_route_table: aws.ec2.RouteTable,
+        transit_gateway_id: pulumi.Input[str],
+        opts: pulumi.ResourceOptions,
+    ):
+        # IPv6 leaves the VPC directly through an egress-only internet gateway
+        # and never touches the central NAT Gateways, only traffic to IPv4 only
+        # destinations (DNS64 answers in 64:ff9b::/96) goes to their NAT64
+        egress_only_gateway = aws.ec2.EgressOnlyInternetGateway(
+            f"{vpc.name}-egress-only-igw",
+            vpc_id=vpc.id,
+            tags={"Name": f"{vpc.name}-egress-only-igw"},
+            opts=pulumi.ResourceOptions(parent=vpc, providers=opts.providers),
+        )
+
+        aws.ec2.Route(
+            f"{vpc.name}-ipv6-egress-route",
+            destination_ipv6_cidr_block=cidrs.EVERYWHERE_IPV6,
+            egress_only_gateway_id=egress_only_gateway.id,
+            route_table_id=private_route_table.id,
+            opts=pulumi.ResourceOptions(
+                parent=private_route_table, providers=opts.providers
+            ),
+        )
+
+        aws.ec2.Route(
+            f"{vpc.name}-nat64-route",
+            destination_ipv6_cidr_block=cidrs.NAT64_PREFIX,
+            transit_gateway_id=transit_gateway_id,
+            route_table_id=private_route_table.id,
+            opts=pulumi.ResourceOptions(
+                depends_on=self.attached,
+                parent=private_route_table,
+                providers=opts.providers,
+            ),
+        )
+
     def _interface_endpoints(
         self,
         vpc: Vpc,
@@ -73,9 +289,31 @@ class Routing(ComponentResource):
         opts: pulumi.ResourceOptions,
         endpoints: List[str] = None,
     ):
-        region = pulumi.Config("aws").require("region")
+        region = self.region
+        if endpoints is None:
+            return
+
+        # With `endpoints_mode: central` the interface endpoints live in the
+        # networking VPC (see leviathan.endpoints) and only their resolver rules
+        # are associated here
+        if pulumi.Config().get("endpoints_mode") == "central":
+            resolver_rules = stack_refs.networking().regional(
+                self.region, "shared_endpoints", "resolver_rules"
+            )
+            for e in endpoints:
+                if shared_endpoints.is_shared(e):
+                    aws.route53.ResolverRuleAssociation(
+                        f"{vpc.name}-{e}-resolver-rule-association",
+                        resolver_rule_id=resolver_rules[e],
+                        vpc_id=vpc.id,
+                        opts=pulumi.ResourceOptions(
+                            parent=vpc, providers=opts.providers
+                        ),
+                    )
+            endpoints = [e for e in endpoints if not shared_endpoints.is_shared(e)]
+
         # AWS Interface Endpoints Security Group
-        if endpoints is not None:
+        if any(e not in shared_endpoints.GATEWAY_ENDPOINTS for e in endpoints):
             self.endpoint_sg = aws.ec2.SecurityGroup(
                 f"{vpc.name}-endpoint-sg",
                 description="Allow TLS inbound traffic for Endpoints",
@@ -101,29 +339,25 @@ class Routing(ComponentResource):
                 opts=pulumi.ResourceOptions(parent=vpc, providers=opts.providers),
             )
 
-            # AWS Interface Endpoints
-            for e in endpoints:
-                if e == "s3":
-                    aws.ec2.VpcEndpoint(
-                        f"{vpc.name}-{e}",
-                        vpc_id=vpc.id,
-                        service_name=f"com.amazonaws.{region}.{e}",
-                        vpc_endpoint_type="Gateway",
-                        route_table_ids=[private_route_table.id],
-                        opts=pulumi.ResourceOptions(
-                            parent=vpc, providers=opts.providers
-                        ),
-                    )
-                else:
-                    aws.ec2.VpcEndpoint(
-                        f"{vpc.name}-{e}",
-                        private_dns_enabled=True,
-                        security_group_ids=[self.endpoint_sg],
-                        service_name=f"com.amazonaws.{region}.{e}",
-                        subnet_ids=vpc.private_subnets,
-                        vpc_endpoint_type="Interface",
-                        vpc_id=vpc.id,
-                        opts=pulumi.ResourceOptions(
-                            parent=vpc, providers=opts.providers
-                        ),
-                    )
+        # AWS Interface Endpoints
+        for e in endpoints:
+            if e in shared_endpoints.GATEWAY_ENDPOINTS:
+                aws.ec2.VpcEndpoint(
+                    f"{vpc.name}-{e}",
+                    vpc_id=vpc.id,
+                    service_name=f"com.amazonaws.{region}.{e}",
+                    vpc_endpoint_type="Gateway",
+                    route_table_ids=[private_route_table.id],
+                    opts=pulumi.ResourceOptions(parent=vpc, providers=opts.providers),
+                )
+            else:
+                aws.ec2.VpcEndpoint(
+                    f"{vpc.name}-{e}",
+                    private_dns_enabled=True,
+                    security_group_ids=[self.endpoint_sg],
+                    service_name=f"com.amazonaws.{region}.{e}",
+                    subnet_ids=vpc.private_subnets,
+                    vpc_endpoint_type="Interface",
+                    vpc_id=vpc.id,
+                    opts=pulumi.ResourceOptions(parent=vpc, providers=opts.providers),
+                )
@@ -0,0 +1,173 @@
+from typing import Any, Dict, Optional, Type, TypeVar
+import pulumi
+from pulumi.runtime.sync_await import _sync_await
+from leviathan import exports, regions, tracing
+
+T = TypeVar("T", bound="StackOutputs")
+
+
+class StackOutputs:
+    """Lazily created StackReference with memoized outputs.
+
+    The reference is only registered on the first lookup, and every output path
+    is looked up once; later lookups return the same Output.
+    """
+
+    def __init__(self, registry: "StackRefs", stack: str) -> None:
+        self.stack = stack
+        self._registry = registry
+        self._reference: Optional[pulumi.StackReference] = None
+        self._values: Dict[tuple, pulumi.Output] = {}
+
+    @property
+    def reference(self) -> pulumi.StackReference:
+        if self._reference is None:
+            self._reference = pulumi.StackReference(self.stack)
+            self._registry.references += 1
+        return self._reference
+
+    def value(self, name: str, *path: str) -> pulumi.Output[Any]:
+        key = (name, *path)
+        if key in self._values:
+            self._registry.saved_reads += 1
+            return self._values[key]
+
+        self._registry.reads += 1
+        output = self.reference.get_output(name)
+        for item in path:
+            output = output[item]
+        output = tracing.default().track(output, f"{self.stack}:{'.'.join(key)}")
+        self._values[key] = output
+        return output
+
+    def plain(self, name: str) -> Any:
+        # Value of an output while the program is constructed, for what decides
+        # which resources there are. Blocks until the reference is read, like
+        # the invokes of pulumi_aws do, stack outputs are known in previews too.
+        self._registry.reads += 1
+        return _sync_await(self.reference.outputs.future()).get(name)
+
+    def view(self, name: str, view: Type[tuple]) -> pulumi.Output[Any]:
+        # Read-only view of an output exported with leviathan.exports
+        return self.value(name).apply(lambda data: exports.load(view, data))
+
+
+class RootOutputs(StackOutputs):
+    @property
+    def organization_id(self) -> pulumi.Output[str]:
+        return self.value("organization", "id")
+
+    @property
+    def organization_arn(self) -> pulumi.Output[str]:
+        return self.value("organization", "arn")
+
+    @property
+    def networking_account_id(self) -> pulumi.Output[str]:
+        return self.value("networking_account", "id")
+
+    @property
+    def networking_role_arn(self) -> pulumi.Output[str]:
+        return pulumi.Output.all(
+            self.networking_account_id,
+            self.value("networking_account", "role_name"),
+        ).apply(lambda v: f"arn:aws:iam::{v[0]}:role/{v[1]}")
+
+    @property
+    def environments(self) -> pulumi.Output[Dict[str, exports.EnvironmentExport]]:
+        return self.value("environments").apply(
+            lambda data: {
+                name: exports.load(exports.EnvironmentExport, environment)
+                for name, environment in (data or {}).items()
+            }
+        )
+
+
+class NetworkingOutputs(StackOutputs):
+    @property
+    def vpc(self) -> pulumi.Output[exports.VpcExport]:
+        return self.view("vpc_info", exports.VpcExport)
+
+    @property
+    def routing(self) -> pulumi.Output[exports.NetworkingRoutingExport]:
+        return self.view("routing", exports.NetworkingRoutingExport)
+
+    @property
+    def transit_gateway_id(self) -> pulumi.Output[str]:
+        return self.value("routing", "transit_gateway_id")
+
+    @property
+    def egress_cidr(self) -> pulumi.Output[str]:
+        return self.value("vpc_info", "cidr_block")
+
+    @property
+    def flow_log_bucket_arn(self) -> pulumi.Output[str]:
+        return self.value("flow_logs", "bucket_arn")
+
+    @property
+    def resolver_rules(self) -> pulumi.Output[Dict[str, str]]:
+        return self.value("shared_endpoints", "resolver_rules")
+
+    def regional(
+        self, region: Optional[str], name: str, *path: str
+    ) -> pulumi.Output[Any]:
+        # Output of the hub in `region`, hubs outside the primary region are
+        # exported under `regions`
+        if region is None or region == regions.primary():
+            return self.value(name, *path)
+        return self.value("regions", region, name, *path)
+
+
+class StackRefs:
+    """One StackReference per stack of the project for the whole program."""
+
+    def __init__(self, org: str, project: str = "leviathan") -> None:
+        self.org = org
+        self.project = project
+        self.references = 0
+        self.reads = 0
+        self.saved_reads = 0
+        self._stacks: Dict[str, StackOutputs] = {}
+
+    def stack(self, name: str, cls: Type[T] = StackOutputs) -> T:
+        if name not in self._stacks:
+            self._stacks[name] = cls(self, f"{self.org}/{self.project}/{name}")
+        return self._stacks[name]
+
+    def root(self) -> RootOutputs:
+        return self.stack("root", RootOutputs)
+
+    def networking(self) -> NetworkingOutputs:
+        return self.stack("networking", NetworkingOutputs)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "references": self.references,
+            "reads": self.reads,
+            "saved_reads": self.saved_reads,
+        }
+
+    def report(self) -> None:
+        pulumi.log.info(
+            f"stack references: {self.references} created, "
+            f"{self.reads} outputs read, {self.saved_reads} reads saved"
+        )
+
+
+_default_refs: Optional[StackRefs] = None
+
+
+def default() -> StackRefs:
+    """Process wide registry for the `org` of the current stack."""
+    global _default_refs
+    if _default_refs is None:
+        _default_refs = StackRefs(pulumi.Config().require("org"))
+
+    return _default_refs
+
+
+def root() -> RootOutputs:
+    return default().root()
+
+
+def networking() -> NetworkingOutputs:
+    return default().networking()
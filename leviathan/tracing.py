@@ -0,0 +1,204 @@
+import atexit
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import pulumi
+
+DEFAULT_PATH = os.path.join(".leviathan", "trace.json")
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "leviathan_span", default=None
+)
+
+
+class Span:
+    __slots__ = ("id", "name", "kind", "parent", "start", "end", "resources", "args")
+
+    def __init__(
+        self, id: int, name: str, kind: str, parent: Optional["Span"], args: Dict
+    ) -> None:
+        self.id = id
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        # Resources registered while this span was the innermost one
+        self.resources = 0
+        self.args = args
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+
+class Tracer:
+    """Records a span per component construction, invoke and Output resolution.
+
+    Spans nest through a context variable, so a component's span is the parent
+    of everything constructed, invoked or registered inside its constructor.
+    Traces are written in the Chrome trace event format, which chrome://tracing,
+    Perfetto and speedscope open directly.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, enabled: bool = True) -> None:
+        self.path = path
+        self.enabled = enabled
+        self.spans: List[Span] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._transformation_registered = False
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str = "component", **args: Any) -> Iterator[Span]:
+        if not self.enabled:
+            yield None
+            return
+
+        self._count_resources()
+        span = self._start(name, kind, _current.get(), args)
+        token = _current.set(span)
+        try:
+            yield span
+        finally:
+            _current.reset(token)
+            span.end = time.perf_counter()
+
+    def track(self, output: pulumi.Output, name: str, **args: Any) -> pulumi.Output:
+        # Times an Output from the moment it is tracked until its value is known
+        if not self.enabled:
+            return output
+
+        span = self._start(name, "output", _current.get(), args)
+
+        def resolved(value):
+            span.end = time.perf_counter()
+            return value
+
+        return output.apply(resolved)
+
+    def save(self) -> None:
+        if not self.enabled or not self.spans:
+            return
+
+        events = []
+        for span in self.spans:
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.kind,
+                    "ph": "X",
+                    "ts": round((span.start - self._origin) * 1e6),
+                    "dur": round(span.duration * 1e6) if span.end else 0,
+                    "pid": os.getpid(),
+                    # Output resolutions overlap each other, give them their own track
+                    "tid": 2 if span.kind == "output" else 1,
+                    "args": {
+                        **span.args,
+                        "id": span.id,
+                        "parent": span.parent.id if span.parent else None,
+                        "resources": span.resources,
+                        "resolved": span.end is not None,
+                    },
+                }
+            )
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        os.replace(tmp_path, self.path)
+
+    def summary(self, limit: int = 10) -> str:
+        # Children always start after their parent, so one reverse pass sums up
+        # the resources of every subtree
+        resources = [span.resources for span in self.spans]
+        for span in reversed(self.spans):
+            if span.parent is not None:
+                resources[span.parent.id] += resources[span.id]
+
+        lines = []
+        for kind, title in (("component", "components"), ("invoke", "invokes")):
+            spans = sorted(
+                (s for s in self.spans if s.kind == kind and s.end is not None),
+                key=lambda s: s.duration,
+                reverse=True,
+            )
+            if not spans:
+                continue
+            lines.append(f"slowest {title}:")
+            for span in spans[:limit]:
+                lines.append(
+                    f"  {span.duration * 1000:>9.1f}ms {resources[span.id]:>6} "
+                    f"resources  {span.name}"
+                )
+        return "\n".join(lines)
+
+    def report(self) -> None:
+        if self.enabled:
+            pulumi.log.info(f"trace written to {self.path}\n{self.summary()}")
+
+    def _start(self, name: str, kind: str, parent: Optional[Span], args: Dict) -> Span:
+        with self._lock:
+            span = Span(len(self.spans), name, kind, parent, args)
+            self.spans.append(span)
+        return span
+
+    def _count_resources(self) -> None:
+        # A stack transformation sees every resource registration, the innermost
+        # span at that moment is the component constructing it
+        if self._transformation_registered:
+            return
+        self._transformation_registered = True
+
+        def count(args: pulumi.ResourceTransformationArgs):
+            span = _current.get()
+            if span is not None:
+                span.resources += 1
+            return None
+
+        pulumi.runtime.register_stack_transformation(count)
+
+
+def traced(init: Callable) -> Callable:
+    """Wraps a ComponentResource constructor in a span named after the resource."""
+
+    @functools.wraps(init)
+    def wrapper(self, *args, **kwargs):
+        tracer = default()
+        if not tracer.enabled:
+            return init(self, *args, **kwargs)
+
+        with tracer.span(type(self).__name__) as span:
+            init(self, *args, **kwargs)
+            span.name = f"{type(self).__name__}:{self._name}"
+
+    return wrapper
+
+
+_default_tracer: Optional[Tracer] = None
+
+
+def default() -> Tracer:
+    """Process wide tracer, off unless `tracing: true` or LEVIATHAN_TRACE is set.
+
+    LEVIATHAN_TRACE may name the trace file, `tracing_path` does the same in the
+    stack config.
+    """
+    global _default_tracer
+    if _default_tracer is None:
+        config = pulumi.Config()
+        env = os.environ.get("LEVIATHAN_TRACE", "")
+        enabled = bool(config.get_bool("tracing")) or env not in ("", "0", "false")
+        path = config.get("tracing_path") or (
+            env if env.endswith(".json") else DEFAULT_PATH
+        )
+        _default_tracer = Tracer(path=path, enabled=enabled)
+        atexit.register(_default_tracer.save)
+
+    return _default_tracer
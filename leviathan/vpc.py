@@ -1,18 +1,28 @@
+import ipaddress
+from typing import Optional
 from pulumi import ComponentResource, ResourceOptions, InvokeOptions
 import pulumi_aws as aws
 import pulumi
-import json
+from leviathan import exports, invoke_cache, ipam, policy, tracing
+from leviathan.aliases import moved_from
 
+# Public /64s are numbered from here, so adding AZs never renumbers a subnet
+PUBLIC_IPV6_SUBNET_OFFSET = 128
 
-class Vpc(ComponentResource):
-    private_subnets = []
-    private_subnet_suffixes = ["30.0/24", "20.0/24", "10.0/24"]
-
-    public_subnets = []
-    public_subnet_suffixes = ["60.0/24", "50.0/24", "40.0/24"]
 
+class Vpc(ComponentResource):
+    @tracing.traced
     def __init__(
-        self, name: str, cidr_prefix: str, opts, is_public: bool = False
+        self,
+        name: str,
+        cidr_block: str,
+        opts,
+        is_public: bool = False,
+        availability_zones: Optional[int] = None,
+        flow_logs: bool = True,
+        flow_log_destination: Optional[pulumi.Input[str]] = None,
+        dual_stack: bool = False,
+        region: Optional[str] = None,
     ) -> None:
         # By calling super(), we ensure any instantiation of this class inherits from the ComponentResource class so we don't have to declare all the same things all over again.
         super().__init__(
@@ -21,13 +31,19 @@ class Vpc(ComponentResource):
         # This definition ensures the new component resource acts like anything else in the Pulumi ecosystem when being called in code.
         child_opts = pulumi.ResourceOptions(parent=self, providers=opts.providers)
         self.name = name
-        self.cidr_block = f"{cidr_prefix}.0.0/16"
+        self.cidr_block = cidr_block
+        self.dual_stack = dual_stack
+        self.region = region
+        self.private_subnets = []
+        self.public_subnets = []
 
         main_vpc = aws.ec2.Vpc(
             name,
             cidr_block=self.cidr_block,
             enable_dns_hostnames=True,
             enable_dns_support=True,
+            # Amazon provided /56, every subnet gets a /64 of it
+            assign_generated_ipv6_cidr_block=dual_stack,
             tags={
                 "Name": name,
             },
@@ -35,39 +51,74 @@ class Vpc(ComponentResource):
         )
 
         self.id = main_vpc.id
+        self.ipv6_cidr_block = main_vpc.ipv6_cidr_block if dual_stack else None
 
         child_opts = pulumi.ResourceOptions(parent=main_vpc, providers=opts.providers)
 
-        self._add_subnets(main_vpc, cidr_prefix, is_public, child_opts)
-        self._add_vpc_flow_logs(main_vpc, name, child_opts)
-
-        vpc_data = {
-            "vpc": main_vpc.id,
-            "cidr_block": self.cidr_block,
-            "public_cidrs": [ps.cidr_block for ps in self.public_subnets],
-            "private_cidrs": [ps.cidr_block for ps in self.private_subnets],
-            "public_subnets": [ps.id for ps in self.public_subnets],
-            "private_subnets": [ps.id for ps in self.private_subnets],
-        }
-
-        pulumi.export("vpc_info", vpc_data)
+        self._add_subnets(main_vpc, is_public, availability_zones, child_opts)
+        if flow_logs and flow_log_destination is not None:
+            self._add_central_vpc_flow_logs(
+                main_vpc, name, flow_log_destination, child_opts
+            )
+        elif flow_logs:
+            self._add_vpc_flow_logs(main_vpc, name, child_opts)
 
         self.register_outputs({})
 
+    def to_export(self) -> dict:
+        return exports.versioned(
+            {
+                "id": self.id,
+                "cidr_block": self.cidr_block,
+                "ipv6_cidr_block": self.ipv6_cidr_block,
+                "availability_zones": self.availability_zones,
+                "public_cidrs": [ps.cidr_block for ps in self.public_subnets],
+                "private_cidrs": [ps.cidr_block for ps in self.private_subnets],
+                "public_subnets": [ps.id for ps in self.public_subnets],
+                "private_subnets": [ps.id for ps in self.private_subnets],
+            }
+        )
+
     def _add_subnets(
-        self, main_vpc: aws.ec2.Vpc, cidr_prefix: str, is_public: bool, opts
+        self,
+        main_vpc: aws.ec2.Vpc,
+        is_public: bool,
+        availability_zone_count: Optional[int],
+        opts,
     ):
-        availability_zones = aws.get_availability_zones(
-            opts=InvokeOptions(provider=opts.providers["aws"])
-        ).names
+        provider = opts.providers["aws"]
+        availability_zones = invoke_cache.default().invoke(
+            "aws:index/getAvailabilityZones:getAvailabilityZones",
+            {},
+            lambda: aws.get_availability_zones(
+                opts=InvokeOptions(provider=provider)
+            ).names,
+            # Answers differ between the accounts of the providers
+            account=getattr(provider, "role_arn", None),
+            region=self.region,
+        )
+        availability_zones = availability_zones[:availability_zone_count]
+        self.availability_zones = availability_zones
+
+        private_cidrs = ipam.default().subnet_cidrs(
+            self.cidr_block, "private", availability_zones
+        )
+        public_cidrs = (
+            ipam.default().subnet_cidrs(self.cidr_block, "public", availability_zones)
+            if is_public
+            else []
+        )
 
-        for az in availability_zones:
+        for index, az in enumerate(availability_zones):
             self.private_subnets.append(
                 aws.ec2.Subnet(
                     f"{self.name}-{az}-private-subnet",
-                    assign_ipv6_address_on_creation=False,
+                    assign_ipv6_address_on_creation=self.dual_stack,
                     availability_zone=az,
-                    cidr_block=f"{cidr_prefix}.{self.private_subnet_suffixes.pop()}",
+                    cidr_block=private_cidrs[index],
+                    ipv6_cidr_block=self._ipv6_subnet(main_vpc, index),
+                    # IPv6 clients reach IPv4 only services through NAT64
+                    enable_dns64=self.dual_stack,
                     map_public_ip_on_launch=False,
                     vpc_id=main_vpc.id,
                     tags={
@@ -82,9 +133,12 @@ class Vpc(ComponentResource):
                 self.public_subnets.append(
                     aws.ec2.Subnet(
                         f"{self.name}-{az}-public-subnet",
-                        assign_ipv6_address_on_creation=False,
+                        assign_ipv6_address_on_creation=self.dual_stack,
                         availability_zone=az,
-                        cidr_block=f"{cidr_prefix}.{self.public_subnet_suffixes.pop()}",
+                        cidr_block=public_cidrs[index],
+                        ipv6_cidr_block=self._ipv6_subnet(
+                            main_vpc, PUBLIC_IPV6_SUBNET_OFFSET + index
+                        ),
                         map_public_ip_on_launch=False,
                         vpc_id=main_vpc.id,
                         tags={
@@ -95,44 +149,55 @@ class Vpc(ComponentResource):
                     )
                 )
 
+    def _ipv6_subnet(
+        self, main_vpc: aws.ec2.Vpc, index: int
+    ) -> Optional[pulumi.Output[str]]:
+        # The /56 is only known once the VPC exists, the /64s are carved out of it
+        if not self.dual_stack:
+            return None
+        return main_vpc.ipv6_cidr_block.apply(
+            lambda cidr: str(
+                ipaddress.ip_network(
+                    (
+                        int(ipaddress.ip_network(cidr).network_address) + (index << 64),
+                        64,
+                    )
+                )
+            )
+        )
+
     def _add_vpc_flow_logs(self, main_vpc: aws.ec2.Vpc, vpc_name: str, opts):
-        # TODO: Flow logs should actually be centralized in networking account
+        # The role and the bucket do not need the VPC, only the flow log does
+        independent_opts = pulumi.ResourceOptions(
+            parent=self,
+            providers=opts.providers,
+            aliases=[moved_from(self, ("aws:ec2/vpc:Vpc", main_vpc._name))],
+        )
         vpc_flowlog_role = aws.iam.Role(
             f"{vpc_name}-vpc-flowlog-role",
-            assume_role_policy=json.dumps(
-                {
-                    "Version": "2012-10-17",
-                    "Statement": [
-                        {
-                            "Sid": "",
-                            "Effect": "Allow",
-                            "Principal": {"Service": "vpc-flow-logs.amazonaws.com"},
-                            "Action": "sts:AssumeRole",
-                        }
-                    ],
-                }
+            assume_role_policy=policy.document(
+                policy.allow(
+                    ["sts:AssumeRole"],
+                    principals=[policy.service("vpc-flow-logs.amazonaws.com")],
+                ),
+                kind="trust",
             ),
-            opts=opts,
+            opts=independent_opts,
         )
 
         aws.iam.RolePolicy(
             f"{vpc_name}-vpc-flowlog-role-policy",
             role=vpc_flowlog_role.id,
-            policy=json.dumps(
-                {
-                    "Version": "2012-10-17",
-                    "Statement": [
-                        {
-                            "Action": [
-                                "logs:DescribeLogGroups",
-                                "logs:DescribeLogStreams",
-                                "logs:PutLogEvents",
-                            ],
-                            "Effect": "Allow",
-                            "Resource": "*",
-                        }
+            policy=policy.document(
+                policy.allow(
+                    [
+                        "logs:DescribeLogGroups",
+                        "logs:DescribeLogStreams",
+                        "logs:PutLogEvents",
                     ],
-                }
+                    resources=["*"],
+                ),
+                kind="inline",
             ),
             opts=pulumi.ResourceOptions(
                 parent=vpc_flowlog_role, providers=opts.providers
@@ -145,7 +210,7 @@ class Vpc(ComponentResource):
             tags={
                 "Name": f"{vpc_name}-vpc-flowlog",
             },
-            opts=opts,
+            opts=independent_opts,
         )
 
         return aws.ec2.FlowLog(
@@ -160,3 +225,30 @@ class Vpc(ComponentResource):
             ),
             opts=pulumi.ResourceOptions(parent=main_vpc, providers=opts.providers),
         )
+
+    def _add_central_vpc_flow_logs(
+        self,
+        main_vpc: aws.ec2.Vpc,
+        vpc_name: str,
+        destination: pulumi.Input[str],
+        opts,
+    ):
+        # Parquet with Hive compatible partitions under <archive bucket>/<vpc id>/,
+        # see leviathan.flow_logs.FlowLogArchive for the matching Athena table
+        return aws.ec2.FlowLog(
+            f"{vpc_name}-vpc-flowlog",
+            log_destination=pulumi.Output.concat(destination, "/", main_vpc.id),
+            log_destination_type="s3",
+            traffic_type="ALL",
+            vpc_id=main_vpc.id,
+            max_aggregation_interval=pulumi.Config().get_int(
+                "flow_log_aggregation_interval"
+            )
+            or 600,
+            destination_options=aws.ec2.FlowLogDestinationOptionsArgs(
+                file_format="parquet",
+                hive_compatible_partitions=True,
+                per_hour_partition=True,
+            ),
+            opts=pulumi.ResourceOptions(parent=main_vpc, providers=opts.providers),
+        )
@@ -0,0 +1,48 @@
+import math
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# IPsec throughput of a single Site-to-Site VPN tunnel
+TUNNEL_GBPS = 1.25
+TUNNELS_PER_CONNECTION = 2
+
+
+class Connection(NamedTuple):
+    name: str
+    customer_gateway: str
+
+
+def plan(config: Optional[Dict[str, Any]]) -> List[Connection]:
+    """VPN connections that carry `bandwidth_gbps` between on-premises and AWS.
+
+    `config` is the `vpn` stack config:
+
+        vpn:
+          bandwidth_gbps: 5
+          customer_gateways:
+            - {name: dc1, ip_address: 203.0.113.10, bgp_asn: 65010}
+            - {name: dc2, ip_address: 198.51.100.10, bgp_asn: 65010}
+          cidrs: [192.168.0.0/16]
+
+    The Transit Gateway spreads flows over every tunnel with the same BGP
+    routes (ECMP), so the bandwidth needs `bandwidth_gbps / TUNNEL_GBPS`
+    tunnels, two to a connection, and every customer gateway gets at least one
+    connection. Connections go round robin over the customer gateways.
+    """
+    if not config:
+        return []
+    customer_gateways = [c["name"] for c in config.get("customer_gateways") or []]
+    if not customer_gateways:
+        raise ValueError("vpn: at least one customer gateway is needed")
+
+    tunnels = math.ceil(float(config.get("bandwidth_gbps") or 0) / TUNNEL_GBPS)
+    count = max(len(customer_gateways), math.ceil(tunnels / TUNNELS_PER_CONNECTION))
+    connections = []
+    for index in range(count):
+        customer_gateway = customer_gateways[index % len(customer_gateways)]
+        connections.append(
+            Connection(
+                f"vpn-{customer_gateway}-{index // len(customer_gateways)}",
+                customer_gateway,
+            )
+        )
+    return connections
@@ -0,0 +1,72 @@
+"""CrossGuard pack with the network performance checks of leviathan.guard.
+
+    pulumi preview --policy-pack policy
+    pulumi preview --policy-pack policy --policy-pack-config policy-config.json
+
+Mandatory checks fail the update. A hub runs a single NAT Gateway unless
+`nat_gateway_count` (or `nat_connection_capacity`) says otherwise, stacks that
+keep it lower the NAT checks in their pack config, e.g.
+`{"nat-gateway-per-az": "advisory", "same-az-egress": "advisory"}`.
+"""
+
+import os
+import sys
+from typing import List
+from pulumi_policy import (
+    EnforcementLevel,
+    PolicyPack,
+    PolicyResource,
+    ReportViolation,
+    StackValidationArgs,
+    StackValidationPolicy,
+)
+
+# leviathan is not an installed package, the pack runs in a virtualenv of its own
+# (requirements.txt) with this directory as the working directory. guard only
+# needs the standard library, so the checkout itself is enough.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leviathan import guard  # noqa: E402
+
+LEVELS = {
+    guard.ADVISORY: EnforcementLevel.ADVISORY,
+    guard.MANDATORY: EnforcementLevel.MANDATORY,
+}
+
+
+def resources(policy_resources: List[PolicyResource]) -> List[guard.Resource]:
+    return [
+        guard.Resource(
+            r.urn,
+            r.resource_type,
+            dict(r.props),
+            {
+                prop: [dependency.urn for dependency in dependencies]
+                for prop, dependencies in (r.property_dependencies or {}).items()
+            },
+        )
+        for r in policy_resources
+    ]
+
+
+def validator(name: str):
+    def validate(args: StackValidationArgs, report_violation: ReportViolation):
+        for violation in guard.check(resources(args.resources), [name]):
+            report_violation(violation.message, violation.urn)
+
+    return validate
+
+
+PolicyPack(
+    name="leviathan-network-performance",
+    enforcement_level=EnforcementLevel.ADVISORY,
+    policies=[
+        StackValidationPolicy(
+            name=policy.name,
+            description=policy.description,
+            enforcement_level=LEVELS[policy.enforcement_level],
+            validate=validator(policy.name),
+        )
+        for policy in guard.POLICIES
+    ],
+)
@@ -0,0 +1,174 @@
+import pulumi
+import pytest
+from pulumi.runtime.mocks import MockMonitor
+from pulumi.runtime.proto import resource_pb2
+from leviathan import account_pool, stack_refs
+
+ACCOUNT = "aws:organizations/account:Account"
+
+STATE = {
+    "next_slot": 3,
+    "free": ["pool-2"],
+    "claims": {"dev": "pool-0", "qa": "pool-1"},
+    "dedicated": ["prod"],
+}
+
+
+class Mocks(pulumi.runtime.Mocks):
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.resources = []
+
+    def new_resource(self, args: pulumi.runtime.MockResourceArgs):
+        self.resources.append((args.typ, args.name, args.inputs))
+        if args.typ == "pulumi:pulumi:StackReference":
+            return [f"{args.name}-id", {"outputs": self.outputs}]
+        if args.typ == "random:index/randomString:RandomString":
+            return [f"{args.name}-id", {**args.inputs, "result": "abcdefg"}]
+        return [f"{args.name}-id", dict(args.inputs)]
+
+    def call(self, args: pulumi.runtime.MockCallArgs):
+        return {}
+
+    def accounts(self):
+        return {name: inputs for t, name, inputs in self.resources if t == ACCOUNT}
+
+
+class Monitor(MockMonitor):
+    # Resources passed as inputs are sent as plain ids, see benchmarks/construction.py
+    def GetDeploymentInfo(self, request):
+        info = super().GetDeploymentInfo(request)
+        return resource_pb2.DeploymentInfo(
+            supportedFeatures=[
+                f
+                for f in info.supportedFeatures
+                if f != resource_pb2.RESOURCE_MONITOR_FEATURE_RESOURCE_REFERENCES
+            ]
+        )
+
+    def SupportsFeature(self, request):
+        if request.id == "resourceReferences":
+            return type("SupportsFeatureResponse", (), {"hasSupport": False})
+        return super().SupportsFeature(request)
+
+
+@pytest.fixture
+def root(monkeypatch):
+    # Runs `build` in a preview of the root stack whose last update exported
+    # `outputs`, returns the mocks and the pool export
+    def run(build, outputs=None, **config):
+        monkeypatch.setattr(stack_refs, "_default_refs", None)
+        mocks = Mocks(outputs or {})
+        pulumi.runtime.set_mocks(
+            mocks,
+            monitor=Monitor(mocks),
+            project="leviathan",
+            stack="root",
+            preview=True,
+        )
+        pulumi.runtime.set_all_config(
+            {
+                "leviathan:org": "acme",
+                **{f"leviathan:{k}": v for k, v in config.items()},
+            }
+        )
+        exported = {}
+
+        @pulumi.runtime.test
+        def program():
+            pool = build()
+            if pool is not None:
+                exported.update(pool.to_export())
+
+        program()
+        return mocks, exported
+
+    return run
+
+
+def test_first_run_keeps_the_accounts_of_the_catalog(root):
+    def build():
+        pool = account_pool.AccountPool(2)
+        assert pool.claim("dev") is None
+        pool.refill()
+        return pool
+
+    mocks, exported = root(build)
+
+    assert sorted(mocks.accounts()) == ["pool-0", "pool-1"]
+    assert exported["state"] == {
+        "next_slot": 2,
+        "free": ["pool-0", "pool-1"],
+        "claims": {},
+        "dedicated": ["dev"],
+    }
+
+
+def test_claims_take_spares_and_refill_replaces_them(root):
+    def build():
+        pool = account_pool.AccountPool(1, state=STATE)
+        assert pool.claim("prod") is None
+        assert pool.claim("dev").name == "pool-0"
+        assert pool.claim("uat").name == "pool-2"
+        # The pool is empty, the account is created right away
+        assert pool.claim("load").name == "pool-3"
+        pool.refill()
+        return pool
+
+    mocks, exported = root(build)
+
+    # qa left the catalog and keeps its account
+    assert sorted(mocks.accounts()) == [
+        "pool-0",
+        "pool-1",
+        "pool-2",
+        "pool-3",
+        "pool-4",
+    ]
+    assert mocks.accounts()["pool-2"]["tags"] == {"leviathan:environment": "uat"}
+    assert mocks.accounts()["pool-4"]["tags"] == {"leviathan:environment": "unclaimed"}
+    assert exported["state"] == {
+        "next_slot": 5,
+        "free": ["pool-4"],
+        "claims": {"dev": "pool-0", "qa": "pool-1", "uat": "pool-2", "load": "pool-3"},
+        "dedicated": ["prod"],
+    }
+    assert STATE["next_slot"] == 3
+
+
+def test_state_comes_from_the_last_update(root):
+    previous = {
+        "account_pool": {
+            "schema_version": 1,
+            "size": 1,
+            "free": ["222222222222"],
+            "claims": {"dev": "000000000000", "qa": "111111111111"},
+            "state": STATE,
+        }
+    }
+
+    def build():
+        pool = account_pool.from_config()
+        assert pool.claim("dev").name == "pool-0"
+        assert pool.claim("prod") is None
+        pool.refill()
+        return pool
+
+    _, exported = root(build, previous, account_pool_size="1")
+
+    assert exported["state"] == STATE
+
+
+def test_pool_with_claims_outlives_its_size(root):
+    def build():
+        pool = account_pool.from_config()
+        if pool is not None:
+            pool.refill()
+        return pool
+
+    _, exported = root(build, {"account_pool": {"schema_version": 1, "state": STATE}})
+    assert exported["size"] == 0
+    assert exported["state"] == STATE
+
+    _, exported = root(build)
+    assert exported == {}
@@ -0,0 +1,48 @@
+import pytest
+from leviathan import catalog
+
+
+def test_parse_applies_defaults():
+    (spec,) = catalog.parse([{"name": "dev"}], known_regions=["eu-west-1"])
+
+    assert spec.name == "dev"
+    assert spec.availability_zones is None
+    assert spec.regions == []
+
+
+def test_parse_reports_every_problem():
+    entries = [
+        {"name": "dev", "colour": "blue"},
+        {"name": "dev", "endpoints": ["s3", "s3"]},
+        {"name": "Bad", "availability_zones": True},
+        {"name": "prod", "features": ["teleport"], "regions": ["mars-1"]},
+        "staging",
+    ]
+
+    with pytest.raises(catalog.CatalogError) as error:
+        catalog.parse(entries, known_regions=["eu-west-1"])
+
+    assert error.value.errors == [
+        "environments[0] (dev): unknown key 'colour'",
+        "environments[1] (dev): duplicate environment name",
+        "environments[1] (dev): duplicate endpoints",
+        f"environments[2] (Bad): name must match {catalog.ENVIRONMENT_NAME.pattern}",
+        "environments[2] (Bad): availability_zones must be a positive integer",
+        "environments[3] (prod): unknown feature 'teleport'",
+        "environments[3] (prod): region 'mars-1' has no networking hub",
+        "environments[4]: expected an object",
+    ]
+
+
+def test_parse_reports_names_that_are_not_strings():
+    entries = [{"name": ["dev"]}, {"name": {"dev": True}}, {}]
+
+    with pytest.raises(catalog.CatalogError) as error:
+        catalog.parse(entries, known_regions=["eu-west-1"])
+
+    pattern = catalog.ENVIRONMENT_NAME.pattern
+    assert error.value.errors == [
+        f"environments[0] (['dev']): name must match {pattern}",
+        f"environments[1] ({{'dev': True}}): name must match {pattern}",
+        f"environments[2]: name must match {pattern}",
+    ]
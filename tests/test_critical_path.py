@@ -0,0 +1,153 @@
+import json
+import sys
+import pytest
+from leviathan import critical_path
+
+
+def urn(typ, name):
+    return f"urn:pulumi:dev::leviathan::{typ}::{name}"
+
+
+ACCOUNT = urn("aws:organizations/account:Account", "account")
+PROVIDER = urn("pulumi:providers:aws", "provider")
+VPC = urn("aws:ec2/vpc:Vpc", "vpc")
+GATEWAY = urn("aws:ec2/internetGateway:InternetGateway", "igw")
+NAT = urn("aws:ec2/natGateway:NatGateway", "nat")
+ZONE = urn("aws:route53/zone:Zone", "zone")
+RECORD = urn("aws:ec2/natGateway:NatGateway$aws:route53/record:Record", "record")
+
+
+def resource(name, typ, custom=True, **fields):
+    return {"urn": name, "type": typ, "custom": custom, **fields}
+
+
+# account -> provider -> vpc -> igw -> nat, then a zone waiting for the NAT
+# Gateway for no reason and a record created under it
+CHECKPOINT = [
+    resource(
+        "urn:pulumi:dev::leviathan::pulumi:pulumi:Stack::leviathan-dev",
+        "pulumi:pulumi:Stack",
+        custom=False,
+    ),
+    resource(ACCOUNT, "aws:organizations/account:Account"),
+    resource(
+        PROVIDER,
+        "pulumi:providers:aws",
+        dependencies=[ACCOUNT],
+        propertyDependencies={"assumeRole": [ACCOUNT]},
+    ),
+    resource(VPC, "aws:ec2/vpc:Vpc", provider=f"{PROVIDER}::provider-id"),
+    resource(
+        GATEWAY,
+        "aws:ec2/internetGateway:InternetGateway",
+        dependencies=[VPC],
+        propertyDependencies={"vpcId": [VPC]},
+    ),
+    resource(
+        NAT,
+        "aws:ec2/natGateway:NatGateway",
+        dependencies=[VPC, GATEWAY],
+        propertyDependencies={"subnetId": [VPC]},
+    ),
+    resource(
+        ZONE,
+        "aws:route53/zone:Zone",
+        dependencies=[VPC, NAT],
+        propertyDependencies={"tags": [VPC], "tagsAll": [VPC]},
+    ),
+    resource(RECORD, "aws:route53/record:Record", parent=NAT),
+]
+
+
+def test_edge_kinds():
+    nodes, edges = critical_path.graph(CHECKPOINT)
+
+    assert len(nodes) == 7
+    assert sorted(edges) == sorted(
+        [
+            critical_path.Edge(ACCOUNT, PROVIDER, "data"),
+            critical_path.Edge(PROVIDER, VPC, "data"),
+            critical_path.Edge(VPC, GATEWAY, "data"),
+            critical_path.Edge(VPC, NAT, "data"),
+            critical_path.Edge(GATEWAY, NAT, "ordering"),
+            critical_path.Edge(VPC, ZONE, "tags"),
+            critical_path.Edge(NAT, ZONE, "depends_on"),
+            critical_path.Edge(NAT, RECORD, "parent"),
+        ]
+    )
+
+
+def test_schedule():
+    nodes, edges = critical_path.graph(CHECKPOINT)
+
+    _, finish, _ = critical_path._schedule(nodes, edges)
+    assert finish == {
+        ACCOUNT: 240.0,
+        PROVIDER: 240.0,
+        VPC: 245.0,
+        GATEWAY: 248.0,
+        NAT: 358.0,
+        ZONE: 403.0,
+        RECORD: 398.0,
+    }
+    assert critical_path.critical_path(nodes, edges) == (
+        403.0,
+        [ACCOUNT, PROVIDER, VPC, GATEWAY, NAT, ZONE],
+    )
+
+
+def test_avoidable_edges_and_minimum():
+    report = critical_path.analyze(CHECKPOINT)
+
+    assert report.duration == 403.0
+    # The tags edge never is on the longest chain, nothing to save
+    assert report.avoidable == [
+        (critical_path.Edge(NAT, RECORD, "parent"), 358.0),
+        (critical_path.Edge(NAT, ZONE, "depends_on"), 113.0),
+    ]
+    assert report.minimum == 358.0
+
+
+def test_latency_overrides():
+    report = critical_path.analyze(
+        CHECKPOINT, {"aws:organizations/account:Account": 0.0}
+    )
+
+    assert (report.duration, report.minimum) == (163.0, 118.0)
+
+
+def test_cycle_is_an_error():
+    resources = [
+        resource(VPC, "aws:ec2/vpc:Vpc", dependencies=[GATEWAY]),
+        resource(
+            GATEWAY, "aws:ec2/internetGateway:InternetGateway", dependencies=[VPC]
+        ),
+    ]
+
+    with pytest.raises(ValueError, match="cycle"):
+        critical_path.analyze(resources)
+
+
+def run(monkeypatch, tmp_path, resources):
+    path = tmp_path / "checkpoint.json"
+    path.write_text(json.dumps({"deployment": {"resources": resources}}))
+    monkeypatch.setattr(sys, "argv", ["critical_path", str(path)])
+    critical_path.main()
+
+
+def test_main_fails_on_avoidable_waits(monkeypatch, tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit:
+        run(monkeypatch, tmp_path, CHECKPOINT)
+
+    assert exit.value.code == 1
+    out = capsys.readouterr().out
+    assert out.startswith("critical path: 403s over 6 resources\n")
+    assert "2 avoidable edges, 358s without them:" in out
+    assert "depends_on nat (aws:ec2/natGateway:NatGateway) -> zone" in out
+
+
+def test_main_passes_without_avoidable_waits(monkeypatch, tmp_path, capsys):
+    # Without the zone and the record only data and ordering edges are left
+    run(monkeypatch, tmp_path, CHECKPOINT[:-2])
+
+    assert capsys.readouterr().out.endswith("no avoidable edges\n")
@@ -0,0 +1,157 @@
+import gzip
+import json
+import random
+from leviathan import flowlog_analyzer
+
+SUBNETS = [
+    ("10.0.0.0/24", "dev", "eu-central-1a", "private"),
+    ("10.0.1.0/24", "dev", "eu-central-1b", "private"),
+    ("10.0.100.0/24", "dev", "eu-central-1a", "public"),
+]
+
+
+def record(src, dst, nbytes, action="ACCEPT"):
+    return (
+        f"2 123456789012 eni-0a1b2c3d {src} {dst} 443 49152 6 10 {nbytes} "
+        f"1620000000 1620000060 {action} OK\n"
+    )
+
+
+def topology():
+    topology = flowlog_analyzer.Topology()
+    topology.subnets = list(SUBNETS)
+    topology.vpcs = [("10.0.0.0/16", "dev")]
+    topology.services = [("52.216.0.0/15", "s3")]
+    return topology
+
+
+def test_aggregates_a_generated_log(tmp_path):
+    rng = random.Random(7)
+    lines = ["version account-id interface-id srcaddr dstaddr ...\n"]
+    expected = {"bytes": 0, "rejected": 0, "cross_az": 0, "nat": 0, "s3": 0}
+    for _ in range(5000):
+        src = f"10.0.{rng.choice([0, 1])}.{rng.randint(1, 254)}"
+        kind = rng.choice(["same_az", "cross_az", "internet", "s3", "rejected"])
+        nbytes = rng.randint(1, 10_000)
+        expected["bytes"] += nbytes
+        if kind == "rejected":
+            lines.append(record(src, "8.8.8.8", nbytes, action="REJECT"))
+            expected["rejected"] += nbytes
+        elif kind == "internet":
+            lines.append(record(src, "8.8.8.8", nbytes))
+            expected["nat"] += nbytes
+        elif kind == "s3":
+            lines.append(record(src, "52.216.1.1", nbytes))
+            # S3 without a gateway endpoint also leaves through the NAT gateways
+            expected["nat"] += nbytes
+            expected["s3"] += nbytes
+        else:
+            same = src.split(".")[2]
+            other = "1" if same == "0" else "0"
+            third = same if kind == "same_az" else other
+            lines.append(record(src, f"10.0.{third}.10", nbytes))
+            if kind == "cross_az":
+                expected["cross_az"] += nbytes
+    lines.append("2 123456789012 eni-0a1b2c3d - - - - - - - 1 2 - NODATA\n")
+
+    path = tmp_path / "flows.log.gz"
+    with gzip.open(path, "wt") as f:
+        f.writelines(lines)
+
+    report = flowlog_analyzer.analyze([str(path)], topology(), chunk_size=700).report(
+        top=3
+    )
+
+    assert report["records"] == 5000
+    assert report["skipped_records"] == 2
+    assert report["bytes"] == expected["bytes"]
+    assert report["rejected_bytes"] == expected["rejected"]
+    assert report["cross_az_bytes"] == expected["cross_az"]
+    assert report["nat_bytes"] == expected["nat"]
+    assert report["destination_bytes"]["aws s3"] == expected["s3"]
+    assert len(report["top_talkers"]) == 3
+    assert not report["top_talkers_approximate"]
+
+
+def test_top_talkers_sum_repeated_pairs():
+    aggregator = flowlog_analyzer.Aggregator(topology())
+    lines = [record("10.0.0.5", "10.0.1.5", 100)] * 3
+    lines.append(record("10.0.0.6", "10.0.1.5", 250))
+    src, dst, nbytes, accepted, skipped = flowlog_analyzer.parse_chunk(lines)
+    aggregator.add(src, dst, nbytes, accepted)
+
+    assert skipped == 0
+    assert aggregator.report()["top_talkers"] == [
+        {"src": "10.0.0.5", "dst": "10.0.1.5", "bytes": 300},
+        {"src": "10.0.0.6", "dst": "10.0.1.5", "bytes": 250},
+    ]
+    assert aggregator.report()["destination_bytes"] == {
+        "subnet 10.0.1.0/24 (eu-central-1b)": 550
+    }
+
+
+def vpc_export(cidr, azs, private, public):
+    return {
+        "schema_version": 1,
+        "id": "vpc-1",
+        "cidr_block": cidr,
+        "availability_zones": azs,
+        "private_cidrs": private,
+        "public_cidrs": public,
+    }
+
+
+def test_topology_reads_root_and_networking_outputs(tmp_path):
+    root = tmp_path / "root.json"
+    root.write_text(
+        json.dumps(
+            {
+                "environments": {
+                    "dev": {
+                        "schema_version": 1,
+                        "name": "dev",
+                        "vpc": vpc_export(
+                            "10.0.0.0/18",
+                            ["eu-central-1a", "eu-central-1b"],
+                            ["10.0.0.0/24", "10.0.1.0/24"],
+                            [],
+                        ),
+                        "regions": {
+                            "us-east-1": {
+                                "schema_version": 1,
+                                "vpc": vpc_export(
+                                    "10.0.64.0/18", ["us-east-1a"], ["10.0.64.0/24"], []
+                                ),
+                            }
+                        },
+                    }
+                }
+            }
+        )
+    )
+    networking = tmp_path / "networking.json"
+    networking.write_text(
+        json.dumps(
+            {
+                "vpc_info": vpc_export(
+                    "10.100.0.0/18", ["eu-central-1a"], [], ["10.100.0.0/24"]
+                )
+            }
+        )
+    )
+
+    topology = flowlog_analyzer.Topology()
+    topology.add_stack_outputs(str(root))
+    topology.add_stack_outputs(str(networking))
+
+    assert topology.vpcs == [
+        ("10.0.0.0/18", "dev"),
+        ("10.0.64.0/18", "dev-us-east-1"),
+        ("10.100.0.0/18", "networking"),
+    ]
+    assert topology.subnets == [
+        ("10.0.0.0/24", "dev", "eu-central-1a", "private"),
+        ("10.0.1.0/24", "dev", "eu-central-1b", "private"),
+        ("10.0.64.0/24", "dev-us-east-1", "us-east-1a", "private"),
+        ("10.100.0.0/24", "networking", "eu-central-1a", "public"),
+    ]
@@ -0,0 +1,180 @@
+from leviathan import guard
+
+
+def urn(typ, name):
+    return f"urn:pulumi:dev::leviathan::{typ}::{name}"
+
+
+class Graph:
+    """Resources in the layout recorded by `benchmarks/construction.py --graph-dir`."""
+
+    def __init__(self):
+        self.resources = []
+
+    def add(self, typ, name, inputs=None, **dependencies):
+        self.resources.append(
+            {
+                "urn": urn(typ, name),
+                "type": typ,
+                "custom": True,
+                "inputs": inputs or {},
+                "propertyDependencies": {
+                    prop: urns if isinstance(urns, list) else [urns]
+                    for prop, urns in dependencies.items()
+                },
+            }
+        )
+        return urn(typ, name)
+
+    def vpc(self, name):
+        return self.add("aws:ec2/vpc:Vpc", name)
+
+    def subnet(self, name, vpc, az):
+        return self.add(
+            "aws:ec2/subnet:Subnet", name, {"availabilityZone": az}, vpcId=vpc
+        )
+
+    def route_table(self, name, vpc):
+        return self.add("aws:ec2/routeTable:RouteTable", name, vpcId=vpc)
+
+    def associate(self, name, route_table, subnet):
+        return self.add(
+            guard.ROUTE_TABLE_ASSOCIATION,
+            name,
+            routeTableId=route_table,
+            subnetId=subnet,
+        )
+
+    def violations(self):
+        return sorted(
+            (v.policy, v.urn) for v in guard.check(guard.from_graph(self.resources))
+        )
+
+
+def egress_vpc(graph, azs):
+    # A VPC with an internet gateway, a NAT Gateway in the first AZ only and a
+    # private subnet per AZ that egresses through it
+    vpc = graph.vpc("egress")
+    graph.add(guard.INTERNET_GATEWAY, "igw", vpcId=vpc)
+    public = graph.subnet("public-a", vpc, azs[0])
+    nat_gateway = graph.add(guard.NAT_GATEWAY, "nat", subnetId=public)
+    route_table = graph.route_table("private", vpc)
+    graph.add(
+        guard.ROUTE,
+        "private-default",
+        {"destinationCidrBlock": "0.0.0.0/0"},
+        routeTableId=route_table,
+        natGatewayId=nat_gateway,
+    )
+    associations = [
+        graph.associate(
+            f"private-{az}", route_table, graph.subnet(f"private-{az}", vpc, az)
+        )
+        for az in azs
+    ]
+    return vpc, route_table, associations
+
+
+def test_a_sound_graph_has_no_violations():
+    graph = Graph()
+    egress_vpc(graph, ["eu-central-1a"])
+
+    assert graph.violations() == []
+
+
+def test_nat_gateway_per_az_and_same_az_egress():
+    graph = Graph()
+    vpc, _, associations = egress_vpc(graph, ["eu-central-1a", "eu-central-1b"])
+
+    assert graph.violations() == [
+        ("nat-gateway-per-az", vpc),
+        ("same-az-egress", associations[1]),
+    ]
+
+
+def test_gateway_endpoints():
+    graph = Graph()
+    vpc = graph.vpc("spoke")
+    route_table = graph.route_table("spoke-private", vpc)
+    graph.add(
+        guard.ROUTE,
+        "spoke-egress",
+        {"destinationCidrBlock": "0.0.0.0/0", "transitGatewayId": "tgw-1"},
+        routeTableId=route_table,
+    )
+    graph.add(
+        guard.VPC_ENDPOINT,
+        "spoke-s3",
+        {"serviceName": "com.amazonaws.eu-central-1.s3"},
+        vpcId=vpc,
+        routeTableIds=[route_table],
+    )
+
+    assert graph.violations() == [("gateway-endpoints", route_table)]
+
+
+def test_duplicate_interface_endpoints():
+    graph = Graph()
+    vpc = graph.vpc("spoke")
+    endpoints = [
+        graph.add(
+            guard.VPC_ENDPOINT,
+            f"ssm-{i}",
+            {
+                "serviceName": "com.amazonaws.eu-central-1.ssm",
+                "vpcEndpointType": "Interface",
+            },
+            vpcId=vpc,
+        )
+        for i in range(2)
+    ]
+
+    assert graph.violations() == [("duplicate-interface-endpoints", endpoints[1])]
+
+
+def test_flow_log_format():
+    graph = Graph()
+    text = graph.add(guard.FLOW_LOG, "text", {"logDestinationType": "s3"})
+    graph.add(
+        guard.FLOW_LOG,
+        "parquet",
+        {
+            "logDestinationType": "s3",
+            "destinationOptions": {
+                "fileFormat": "parquet",
+                "hiveCompatiblePartitions": True,
+            },
+        },
+    )
+    graph.add(guard.FLOW_LOG, "cloudwatch", {"logDestinationType": "cloud-watch-logs"})
+
+    # Neither parquet nor Hive compatible partitions
+    assert graph.violations() == [("flow-log-format", text)] * 2
+
+
+def test_subnet_vpc_mismatch():
+    graph = Graph()
+    vpc = graph.vpc("spoke")
+    other = graph.vpc("other")
+    route_table = graph.route_table("spoke-private", vpc)
+    subnet = graph.subnet("spoke-a", vpc, "eu-central-1a")
+    foreign = graph.subnet("other-a", other, "eu-central-1a")
+    graph.associate("spoke-a", route_table, subnet)
+    association = graph.associate("other-a", route_table, foreign)
+    attachment = graph.add(
+        guard.VPC_ATTACHMENT, "spoke-tgw", vpcId=vpc, subnetIds=[subnet, foreign]
+    )
+
+    assert graph.violations() == [
+        ("subnet-vpc-mismatch", association),
+        ("subnet-vpc-mismatch", attachment),
+    ]
+
+
+def test_unknown_inputs_do_not_count():
+    graph = Graph()
+    vpc = graph.vpc("egress")
+    graph.subnet("private-a", vpc, guard.UNKNOWN)
+
+    resources = guard.from_graph(graph.resources)
+    assert guard.Stack(resources).availability_zone(resources[1].urn) is None
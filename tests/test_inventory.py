@@ -0,0 +1,189 @@
+import json
+import os
+import pytest
+from leviathan import inventory
+
+NETWORKING = {
+    "vpc_info": {
+        "id": "vpc-hub",
+        "cidr_block": "10.100.0.0/16",
+        "availability_zones": ["eu-central-1a", "eu-central-1b"],
+        "private_cidrs": ["10.100.0.0/24", "10.100.1.0/24"],
+        "private_subnets": ["subnet-hub-a", "subnet-hub-b"],
+        "public_cidrs": ["10.100.100.0/24"],
+        "public_subnets": ["subnet-hub-public-a"],
+    },
+    "routing": {
+        "transit_gateway_id": "tgw-1",
+        "transit_gateway_owner_id": "000000000000",
+        "nat_gateway_ids": ["nat-a"],
+        "internet_gateway_id": "igw-1",
+    },
+    "shared_endpoints": {"resolver_rules": {"s3": "rslvr-rr-1"}},
+}
+
+DEV = {
+    "account": {"id": "111111111111"},
+    "vpc": {
+        "id": "vpc-dev",
+        "cidr_block": "10.101.0.0/16",
+        "ipv6_cidr_block": "2600:1f18:1::/56",
+        "availability_zones": ["eu-central-1a", "eu-central-1b"],
+        "private_cidrs": ["10.101.0.0/20", "10.101.16.0/20"],
+        "private_subnets": ["subnet-dev-a"],
+    },
+    "routing": {
+        "private_route_table_id": "rtb-dev",
+        "transit_gateway_attachment_id": "tgw-attach-dev",
+    },
+}
+
+
+def checkpoint(stack, outputs):
+    # What a file backend keeps under ~/.pulumi/stacks/<project>/<stack>.json
+    return {
+        "checkpoint": {
+            "latest": {
+                "resources": [
+                    {
+                        "urn": f"urn:pulumi:{stack}::leviathan::pulumi:pulumi:Stack::leviathan-{stack}",
+                        "type": inventory.STACK,
+                        "outputs": outputs,
+                    },
+                    {"urn": "urn:pulumi:root::leviathan::aws:ec2/vpc:Vpc::x"},
+                ]
+            }
+        }
+    }
+
+
+def write(tmp_path):
+    networking = tmp_path / "networking.json"
+    networking.write_text(json.dumps(NETWORKING))
+    root = tmp_path / "checkpoint.json"
+    root.write_text(json.dumps(checkpoint("root", {"environments": {"dev": DEV}})))
+    return [str(root), str(networking)]
+
+
+def test_longest_prefix_wins(tmp_path):
+    index = inventory.build(write(tmp_path))
+
+    owners = index.lookup("10.101.20.37")
+    assert [o.cidr for o in owners] == ["10.101.0.0/16", "10.101.16.0/20"]
+    subnet = owners[-1]
+    assert (subnet.stack, subnet.vpc, subnet.kind, subnet.tier) == (
+        "root",
+        "dev",
+        "subnet",
+        "private",
+    )
+    assert (subnet.account, subnet.region, subnet.availability_zone) == (
+        "111111111111",
+        "eu-central-1",
+        "eu-central-1b",
+    )
+    # More CIDRs than subnet ids
+    assert subnet.subnet_id is None
+    assert subnet.egress == [
+        "route table rtb-dev",
+        "transit gateway attachment tgw-attach-dev",
+        "transit gateway tgw-1",
+        "NAT Gateway nat-a",
+        "internet gateway igw-1",
+    ]
+    assert subnet.endpoints == {"s3": "rslvr-rr-1"}
+
+
+def test_vpc_blocks_outside_every_subnet(tmp_path):
+    index = inventory.build(write(tmp_path))
+
+    (vpc,) = index.lookup("10.101.200.1")
+    assert (vpc.kind, vpc.vpc_id, vpc.egress) == ("vpc", "vpc-dev", ["VPC vpc-dev"])
+    (vpc,) = index.lookup("2600:1f18:1:ff::1")
+    assert vpc.cidr == "2600:1f18:1::/56"
+    assert index.lookup("192.168.0.1") == []
+
+
+def test_hub_subnets_egress_by_tier(tmp_path):
+    index = inventory.build(write(tmp_path))
+
+    private = index.lookup("10.100.1.9")[-1]
+    public = index.lookup("10.100.100.9")[-1]
+    assert (private.stack, private.account, private.subnet_id) == (
+        "networking",
+        "000000000000",
+        "subnet-hub-b",
+    )
+    assert private.egress == ["NAT Gateway nat-a", "internet gateway igw-1"]
+    assert public.egress == ["internet gateway igw-1"]
+
+
+def test_spoke_without_its_hub(tmp_path):
+    path = tmp_path / "root.json"
+    path.write_text(json.dumps({"environments": {"dev": DEV}}))
+
+    owner = inventory.build([str(path)]).lookup("10.101.0.1")[-1]
+    assert owner.egress[-1] == "hub of eu-central-1 (networking stack not loaded)"
+    assert owner.endpoints == {}
+
+
+def test_batch_lookup(tmp_path, capsys):
+    paths = write(tmp_path)
+    batch = tmp_path / "addresses.txt"
+    batch.write_text("10.101.20.37  # dev\n\n# comment\n10.100.100.9\n8.8.8.8\n")
+
+    with pytest.raises(SystemExit) as exit:
+        inventory.main(
+            [*paths, "10.101.0.1", "--batch", str(batch), "--json", "--no-cache"]
+        )
+    assert exit.value.code == 0
+
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [r["address"] for r in results] == [
+        "10.101.0.1",
+        "10.101.20.37",
+        "10.100.100.9",
+        "8.8.8.8",
+    ]
+    assert [r["owner"] and r["owner"]["cidr"] for r in results] == [
+        "10.101.0.0/20",
+        "10.101.16.0/20",
+        "10.100.100.0/24",
+        None,
+    ]
+    assert results[1]["within"] == ["10.101.0.0/16"]
+
+
+def test_invalid_address_fails(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit:
+        inventory.main([*write(tmp_path), "10.101.0.1", "not-an-ip", "--no-cache"])
+    assert exit.value.code == 1
+
+    captured = capsys.readouterr()
+    assert captured.out.startswith("10.101.0.1: dev subnet 10.101.0.0/20 (root)")
+    assert "not-an-ip: not an IP address" in captured.err
+
+
+def test_cached_index_is_reused_until_an_input_changes(tmp_path, monkeypatch):
+    paths = write(tmp_path)
+    cache = str(tmp_path / "cache" / "inventory.pickle")
+    builds = []
+    build = inventory.build
+    monkeypatch.setattr(inventory, "build", lambda p: builds.append(p) or build(p))
+
+    inventory.load(paths, cache)
+    assert inventory.load(paths, cache).lookup("10.101.0.1")[-1].vpc == "dev"
+    assert len(builds) == 1
+
+    networking = paths[1]
+    with open(networking, "a") as f:
+        f.write("\n")
+    os.utime(networking, ns=(0, 0))
+    inventory.load(paths, cache)
+    assert len(builds) == 2
+
+    # A file that isn't a pickle is rebuilt over
+    with open(cache, "w") as f:
+        f.write("not a pickle")
+    inventory.load(paths, cache)
+    assert len(builds) == 3
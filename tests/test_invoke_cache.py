@@ -0,0 +1,138 @@
+import json
+import pulumi
+import pytest
+from leviathan import invoke_cache
+
+AVAILABILITY_ZONES = "aws:index/getAvailabilityZones:getAvailabilityZones"
+DEV = "arn:aws:iam::111111111111:role/OrganizationAccountAccessRole"
+QA = "arn:aws:iam::222222222222:role/OrganizationAccountAccessRole"
+
+
+class Fetch:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return invoke_cache.InvokeCache(path=str(tmp_path / "invoke-cache.json"))
+
+
+def test_same_invoke_in_the_same_account_is_a_hit(cache):
+    fetch = Fetch(["eu-central-1a", "eu-central-1b"])
+
+    for _ in range(3):
+        assert cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV) == fetch.value
+
+    assert fetch.calls == 1
+    assert cache.stats() == {"hits": 2, "misses": 1, "entries": 1}
+
+
+def test_account_is_the_role_not_the_caller_name(cache):
+    # Two VPCs of one account share the answer, the same name in another
+    # account does not
+    fetch = Fetch(["eu-central-1a"])
+
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV, region="eu-central-1")
+    cache.invoke(
+        AVAILABILITY_ZONES,
+        {},
+        fetch,
+        account=pulumi.Output.from_input(DEV),
+        region="eu-central-1",
+    )
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=QA, region="eu-central-1")
+
+    assert fetch.calls == 2
+    assert cache.stats()["entries"] == 2
+
+
+def test_token_args_and_region_are_part_of_the_key(cache):
+    fetch = Fetch([])
+
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV, region="eu-central-1")
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV, region="us-east-1")
+    cache.invoke(AVAILABILITY_ZONES, {"state": "available"}, fetch, account=DEV)
+    cache.invoke("aws:index/getRegion:getRegion", {}, fetch, account=DEV)
+
+    assert fetch.calls == 4
+    assert cache.stats() == {"hits": 0, "misses": 4, "entries": 4}
+
+
+def test_unknown_or_ambient_accounts_are_not_cached(cache):
+    fetch = Fetch([])
+
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch)
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch)
+    # What the role ARN of an account created by this update is in a preview
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=pulumi.Output.from_input(None))
+
+    assert fetch.calls == 3
+    assert cache.stats() == {"hits": 0, "misses": 3, "entries": 0}
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    cache = invoke_cache.InvokeCache(path=str(tmp_path / "cache.json"), ttl=60)
+    fetch = Fetch([])
+    now = 1_000_000.0
+    monkeypatch.setattr(invoke_cache.time, "time", lambda: now)
+
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV)
+    now += 59
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV)
+    now += 2
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV)
+
+    assert fetch.calls == 2
+
+
+def test_saved_entries_are_reused_and_dropped_once_expired(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.json")
+    now = 1_000_000.0
+    monkeypatch.setattr(invoke_cache.time, "time", lambda: now)
+    cache = invoke_cache.InvokeCache(path=path, ttl=60)
+    cache.invoke(AVAILABILITY_ZONES, {}, Fetch(["eu-central-1a"]), account=DEV)
+    cache.save()
+
+    fetch = Fetch(["eu-central-1b"])
+    reloaded = invoke_cache.InvokeCache(path=path, ttl=60)
+    assert reloaded.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV) == [
+        "eu-central-1a"
+    ]
+    assert fetch.calls == 0
+
+    now += 61
+    expired = invoke_cache.InvokeCache(path=path, ttl=60)
+    assert expired.stats()["entries"] == 0
+    assert expired.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV) == [
+        "eu-central-1b"
+    ]
+
+
+def test_disabled_cache_always_fetches_and_saves_nothing(tmp_path):
+    path = tmp_path / "cache.json"
+    cache = invoke_cache.InvokeCache(path=str(path), enabled=False)
+    fetch = Fetch([])
+
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV)
+    cache.invoke(AVAILABILITY_ZONES, {}, fetch, account=DEV)
+    cache.save()
+
+    assert fetch.calls == 2
+    assert not path.exists()
+
+
+def test_unreadable_cache_file_starts_empty(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text("{not json")
+
+    cache = invoke_cache.InvokeCache(path=str(path))
+    cache.invoke(AVAILABILITY_ZONES, {}, Fetch([]), account=DEV)
+    cache.save()
+
+    assert len(json.loads(path.read_text())) == 1
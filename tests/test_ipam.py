@@ -0,0 +1,85 @@
+import ipaddress
+import json
+import pytest
+from leviathan import ipam
+
+VPCS = 1024  # every /18 of 10.0.0.0/8
+
+
+def test_allocates_thousands_of_environments_without_overlap():
+    tree = ipam.CidrTree("10.0.0.0/8")
+    blocks = [tree.allocate(18) for _ in range(VPCS)]
+
+    networks = sorted(ipaddress.ip_network(b) for b in blocks)
+    assert len(set(networks)) == VPCS
+    for a, b in zip(networks, networks[1:]):
+        assert not a.overlaps(b)
+    assert all(n.subnet_of(ipaddress.ip_network("10.0.0.0/8")) for n in networks)
+    assert len(tree) == VPCS
+
+    with pytest.raises(ipam.CidrAllocationError):
+        tree.allocate(18)
+
+
+def test_first_fit_keeps_reserved_blocks():
+    tree = ipam.CidrTree("10.0.0.0/8")
+    tree.reserve("10.0.0.0/16")
+    tree.reserve("10.101.0.0/16")
+
+    assert tree.allocate(16) == "10.1.0.0/16"
+    assert tree.allocate(18) == "10.2.0.0/18"
+    assert tree.overlap("10.101.20.0/24") == "10.101.0.0/16"
+    assert tree.overlap("10.0.0.0/8") is not None
+    assert tree.overlap("10.200.0.0/16") is None
+
+    with pytest.raises(ipam.CidrOverlapError):
+        tree.reserve("10.101.128.0/17")
+    with pytest.raises(ipam.CidrAllocationError):
+        tree.reserve("192.168.0.0/16")
+
+
+def test_release_hands_the_block_out_again():
+    tree = ipam.CidrTree("10.0.0.0/8")
+    blocks = [tree.allocate(18) for _ in range(VPCS)]
+
+    for block in blocks[10:20]:
+        tree.release(block)
+    assert len(tree) == VPCS - 10
+    assert [tree.allocate(18) for _ in range(10)] == blocks[10:20]
+
+    # A released /18 next to free space merges back into larger blocks
+    for block in blocks:
+        tree.release(block)
+    assert len(tree) == 0
+    assert tree.allocate(8) == "10.0.0.0/8"
+
+
+def test_release_of_an_unallocated_block_fails():
+    tree = ipam.CidrTree("10.0.0.0/8")
+    tree.allocate(16)
+
+    with pytest.raises(ipam.CidrAllocationError):
+        tree.release("10.1.0.0/16")
+    with pytest.raises(ipam.CidrAllocationError):
+        tree.release("10.0.0.0/17")
+
+
+def test_allocations_are_stable_across_runs(tmp_path):
+    path = str(tmp_path / "allocations.json")
+    first = ipam.Ipam(path)
+    cidrs = {f"env{i}": first.vpc_cidr(f"env{i}") for i in range(100)}
+    subnets = first.subnet_cidrs(cidrs["env7"], "private", ["a", "b", "c"])
+    first.save()
+
+    # Another order, and a new environment, leave the recorded blocks alone
+    second = ipam.Ipam(path)
+    assert second.vpc_cidr("new") not in cidrs.values()
+    for name in reversed(list(cidrs)):
+        assert second.vpc_cidr(name) == cidrs[name]
+    assert second.subnet_cidrs(cidrs["env7"], "private", ["a", "b", "c"]) == subnets
+
+    second.release("env3")
+    second.save()
+    with open(path) as f:
+        assert "env3" not in json.load(f)
+    assert ipam.Ipam(path).vpc_cidr("later") == cidrs["env3"]
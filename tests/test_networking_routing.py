@@ -0,0 +1,172 @@
+import importlib.util
+import pathlib
+import pulumi
+import pytest
+from pulumi.runtime.mocks import MockMonitor
+from pulumi.runtime.proto import resource_pb2
+from leviathan import invoke_cache, ipam, stack_refs
+
+PROGRAM = pathlib.Path(__file__).parent.parent / "environments" / "networking"
+AVAILABILITY_ZONES = ["eu-central-1a", "eu-central-1b", "eu-central-1c"]
+NAT_GATEWAY = "aws:ec2/natGateway:NatGateway"
+ROUTE = "aws:ec2/route:Route"
+
+
+def load_routing():
+    # The networking program isn't a package, load its routing module by path
+    spec = importlib.util.spec_from_file_location(
+        "networking_routing", PROGRAM / "routing.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Mocks(pulumi.runtime.Mocks):
+    def __init__(self):
+        self.resources = []
+
+    def new_resource(self, args: pulumi.runtime.MockResourceArgs):
+        self.resources.append((args.typ, args.name, args.inputs))
+        return [f"{args.name}-id", dict(args.inputs)]
+
+    def call(self, args: pulumi.runtime.MockCallArgs):
+        if args.token == "aws:index/getAvailabilityZones:getAvailabilityZones":
+            return {"names": AVAILABILITY_ZONES}
+        return {}
+
+    def of_type(self, typ):
+        return {name: inputs for t, name, inputs in self.resources if t == typ}
+
+
+class Monitor(MockMonitor):
+    # Keeps the alias URNs the SDK computed, the mocks only see the new URNs
+    def __init__(self, mocks):
+        super().__init__(mocks)
+        self.aliases = {}
+
+    def RegisterResource(self, request):
+        self.aliases[request.name] = list(request.aliasURNs)
+        return super().RegisterResource(request)
+
+    # Resources passed as inputs are sent as plain ids, see benchmarks/construction.py
+    def GetDeploymentInfo(self, request):
+        info = super().GetDeploymentInfo(request)
+        return resource_pb2.DeploymentInfo(
+            supportedFeatures=[
+                f
+                for f in info.supportedFeatures
+                if f != resource_pb2.RESOURCE_MONITOR_FEATURE_RESOURCE_REFERENCES
+            ]
+        )
+
+    def SupportsFeature(self, request):
+        if request.id == "resourceReferences":
+            return type("SupportsFeatureResponse", (), {"hasSupport": False})
+        return super().SupportsFeature(request)
+
+
+@pytest.fixture
+def hub(tmp_path, monkeypatch):
+    # The primary region hub of the networking stack in preview
+    def construct(**config):
+        for module, name in (
+            (stack_refs, "_default_refs"),
+            (ipam, "_default_ipam"),
+            (invoke_cache, "_default_cache"),
+        ):
+            monkeypatch.setattr(module, name, None)
+        mocks = Mocks()
+        monitor = Monitor(mocks)
+        pulumi.runtime.set_mocks(
+            mocks,
+            monitor=monitor,
+            project="leviathan",
+            stack="networking",
+            preview=True,
+        )
+        pulumi.runtime.set_all_config(
+            {
+                "aws:region": "eu-central-1",
+                "leviathan:org": "acme",
+                "leviathan:invoke_cache": "false",
+                "leviathan:ipam_allocations": str(tmp_path / "allocations.json"),
+                **{f"leviathan:{k}": v for k, v in config.items()},
+            }
+        )
+
+        @pulumi.runtime.test
+        def run():
+            from leviathan.vpc import Vpc
+
+            routing = load_routing()
+            opts = pulumi.ResourceOptions(
+                providers={"aws": pulumi.ProviderResource("aws", "networking")}
+            )
+            vpc = Vpc(
+                "main",
+                ipam.default().vpc_cidr("networking"),
+                opts,
+                is_public=True,
+                flow_logs=False,
+            )
+            routing.Routing(vpc=vpc, opts=opts)
+
+        run()
+        return mocks, monitor
+
+    return construct
+
+
+@pytest.mark.parametrize(
+    "count, shards",
+    [
+        (1, ["0.0.0.0/0"]),
+        (2, ["0.0.0.0/1", "128.0.0.0/1"]),
+        (3, ["0.0.0.0/2", "64.0.0.0/2", "128.0.0.0/2", "192.0.0.0/2"]),
+        (4, ["0.0.0.0/2", "64.0.0.0/2", "128.0.0.0/2", "192.0.0.0/2"]),
+    ],
+)
+def test_nat_shards_cover_everything(count, shards):
+    assert load_routing().nat_shards(count) == shards
+
+
+def test_single_nat_gateway_by_default(hub):
+    mocks, _ = hub()
+
+    assert list(mocks.of_type(NAT_GATEWAY)) == ["networking-nat-gw-eu-central-1a"]
+    routes = mocks.of_type(ROUTE)
+    for az in AVAILABILITY_ZONES:
+        assert routes[f"networking-private-route-{az}"]["natGatewayId"] == (
+            "networking-nat-gw-eu-central-1a-id"
+        )
+
+
+def test_nat_gateway_per_az(hub):
+    mocks, _ = hub(nat_gateway_count="3")
+
+    assert sorted(mocks.of_type(NAT_GATEWAY)) == [
+        f"networking-nat-gw-{az}" for az in AVAILABILITY_ZONES
+    ]
+
+
+def test_first_private_route_keeps_its_urn(hub):
+    _, monitor = hub()
+
+    # Under the NAT Gateway, under the public route table, under the internet
+    # gateway in the baseline
+    former = (
+        "pkg:leviathan:environments:networking:routing"
+        "$aws:ec2/internetGateway:InternetGateway"
+        "$aws:ec2/routeTable:RouteTable"
+        "$aws:ec2/natGateway:NatGateway"
+        "$aws:ec2/route:Route::networking-private-route"
+    )
+    assert any(
+        urn.endswith(former)
+        for urn in monitor.aliases["networking-private-route-eu-central-1a"]
+    )
+    assert not any(
+        urn.endswith(former)
+        for urn in monitor.aliases["networking-private-route-eu-central-1b"]
+    )
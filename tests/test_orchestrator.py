@@ -0,0 +1,245 @@
+import io
+import shutil
+import sys
+import threading
+import pytest
+from leviathan import orchestrator
+
+
+def write_stack(environments_dir, name, source, config="", org="acme"):
+    program_dir = environments_dir / name
+    program_dir.mkdir()
+    runtime = "runtime: python\n"
+    if sys.prefix != sys.base_prefix:
+        # The programs run with the interpreter of the tests
+        runtime = (
+            f"runtime:\n  name: python\n  options:\n    virtualenv: {sys.prefix}\n"
+        )
+    (program_dir / "Pulumi.yaml").write_text(f"name: leviathan\n{runtime}")
+    (program_dir / f"Pulumi.{name}.yaml").write_text(
+        f"config:\n  leviathan:org: {org}\n{config}"
+    )
+    (program_dir / "__main__.py").write_text(source)
+
+
+class StubRunner:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, stack, operation, parallel, on_output):
+        with self._lock:
+            self.calls.append((stack.name, operation, parallel))
+        on_output(f"{operation} {stack.name}")
+        if stack.name in self.failing:
+            raise RuntimeError("boom")
+
+
+@pytest.fixture
+def environments(tmp_path):
+    write_stack(tmp_path, "root", "import pulumi\n")
+    write_stack(tmp_path, "networking", "root = stack_refs.root()\n")
+    write_stack(
+        tmp_path,
+        "apps",
+        'net = pulumi.StackReference(f"{org}/leviathan/networking")\n',
+        "  leviathan:depends_on: [root]\n  leviathan:parallel: 8\n",
+    )
+    write_stack(tmp_path, "audit", "import pulumi\n")
+    return tmp_path
+
+
+def test_discover_scans_references_and_config(environments):
+    stacks = orchestrator.discover(str(environments))
+
+    assert stacks["root"].depends_on == frozenset()
+    assert stacks["networking"].depends_on == {"root"}
+    assert stacks["apps"].depends_on == {"networking", "root"}
+    assert stacks["apps"].parallel == 8
+    assert stacks["apps"].qualified_name == "acme/leviathan/apps"
+    assert orchestrator.order(stacks) == [["audit", "root"], ["networking"], ["apps"]]
+
+
+def test_root_networking_cycle_is_refused(tmp_path):
+    # root reading the Transit Gateway of networking, which reads the
+    # environments of root, cannot be deployed in any order
+    write_stack(tmp_path, "root", "tgw = stack_refs.networking()\n")
+    write_stack(tmp_path, "networking", "root = stack_refs.root()\n")
+    stacks = orchestrator.discover(str(tmp_path))
+
+    with pytest.raises(orchestrator.OrchestrationError, match="networking, root"):
+        orchestrator.order(stacks)
+    with pytest.raises(orchestrator.OrchestrationError, match="cycle"):
+        orchestrator.Orchestrator(stacks, runner=StubRunner())
+
+
+def test_unknown_dependency_is_refused(tmp_path):
+    write_stack(tmp_path, "apps", "net = stack_refs.networking()\n")
+
+    with pytest.raises(orchestrator.OrchestrationError, match="unknown stacks"):
+        orchestrator.order(orchestrator.discover(str(tmp_path)))
+
+
+def test_up_runs_dependencies_first_and_skips_dependents_of_failures(environments):
+    stacks = orchestrator.discover(str(environments))
+    runner = StubRunner(failing={"networking"})
+    output = io.StringIO()
+
+    results = orchestrator.Orchestrator(
+        stacks, runner=runner, workers=2, parallel={"root": 16}, output=output
+    ).run("up")
+
+    assert {name: r.status for name, r in results.items()} == {
+        "audit": "succeeded",
+        "root": "succeeded",
+        "networking": "failed",
+        "apps": "skipped",
+    }
+    assert results["networking"].error == "boom"
+    assert results["apps"].error == "networking did not succeed"
+    called = [name for name, _, _ in runner.calls]
+    assert called.index("root") < called.index("networking")
+    assert "apps" not in called
+    assert ("root", "up", 16) in runner.calls
+    assert "[networking] up networking\n" in output.getvalue()
+
+
+def test_destroy_runs_in_reverse_order(environments):
+    stacks = orchestrator.discover(str(environments))
+    runner = StubRunner()
+
+    results = orchestrator.Orchestrator(
+        stacks, runner=runner, workers=1, output=io.StringIO()
+    ).run("destroy", only=["root", "networking", "apps"])
+
+    assert all(r.status == "succeeded" for r in results.values())
+    assert [name for name, _, _ in runner.calls] == ["apps", "networking", "root"]
+    assert runner.calls[0] == ("apps", "destroy", 8)
+
+
+def test_bootstrap_pass_breaks_the_cycle(tmp_path):
+    write_stack(
+        tmp_path,
+        "root",
+        "tgw = stack_refs.networking()\n",
+        "  leviathan:bootstrap:\n    environments: []\n",
+    )
+    write_stack(tmp_path, "networking", "root = stack_refs.root()\n")
+    write_stack(tmp_path, "apps", "net = stack_refs.networking()\n")
+    stacks = orchestrator.discover(str(tmp_path))
+    runner = StubRunner()
+
+    assert orchestrator.bootstrap_edges(stacks) == {("networking", "root")}
+    assert orchestrator.order(stacks) == [["networking"], ["apps", "root"]]
+    results = orchestrator.Orchestrator(
+        stacks, runner=runner, workers=1, output=io.StringIO()
+    ).run("up")
+
+    assert all(r.status == "succeeded" for r in results.values())
+    assert runner.calls == [
+        ("root", "bootstrap", None),
+        ("networking", "up", None),
+        ("apps", "up", None),
+        ("root", "up", None),
+    ]
+
+
+def test_failed_bootstrap_skips_the_cycle(tmp_path):
+    write_stack(
+        tmp_path,
+        "root",
+        "tgw = stack_refs.networking()\n",
+        "  leviathan:bootstrap:\n    environments: []\n",
+    )
+    write_stack(tmp_path, "networking", "root = stack_refs.root()\n")
+    stacks = orchestrator.discover(str(tmp_path))
+
+    class FailingBootstrap(StubRunner):
+        def __call__(self, stack, operation, parallel, on_output):
+            super().__call__(stack, operation, parallel, on_output)
+            if operation == "bootstrap":
+                raise RuntimeError("boom")
+
+    results = orchestrator.Orchestrator(
+        stacks, runner=FailingBootstrap(), output=io.StringIO()
+    ).run("up")
+
+    assert {name: r.status for name, r in results.items()} == {
+        "root:bootstrap": "failed",
+        "networking": "skipped",
+        "root": "skipped",
+    }
+
+
+def test_repository_stacks_deploy_networking_before_root():
+    # root reads the Transit Gateway of networking through leviathan.routing,
+    # networking the organization and environments of root. root's bootstrap
+    # pass deploys it without environments first.
+    stacks = orchestrator.discover()
+
+    assert stacks["root"].depends_on == {"networking"}
+    assert stacks["networking"].depends_on == {"root"}
+    assert orchestrator.bootstrap_edges(stacks) == {("networking", "root")}
+    assert orchestrator.order(stacks) == [["networking"], ["root"]]
+
+
+ROOT_PROGRAM = """
+import pulumi
+
+pulumi.export("organization", {"id": "o-test"})
+if pulumi.Config().get_object("environments"):
+    networking = pulumi.StackReference("organization/leviathan/networking")
+    pulumi.export("transit_gateway_id", networking.get_output("transit_gateway_id"))
+"""
+
+NETWORKING_PROGRAM = """
+import pulumi
+
+root = pulumi.StackReference("organization/leviathan/root")
+pulumi.export("organization_id", root.get_output("organization")["id"])
+pulumi.export("transit_gateway_id", "tgw-test")
+"""
+
+
+@pytest.mark.skipif(shutil.which("pulumi") is None, reason="needs the pulumi CLI")
+def test_automation_runner_bootstraps_on_a_file_backend(tmp_path):
+    from pulumi import automation as auto
+
+    environments_dir = tmp_path / "environments"
+    environments_dir.mkdir()
+    state = tmp_path / "state"
+    state.mkdir()
+    root_config = (
+        "  leviathan:environments:\n    - name: dev\n"
+        "  leviathan:bootstrap:\n    environments: []\n"
+    )
+    write_stack(environments_dir, "root", ROOT_PROGRAM, root_config, org="organization")
+    write_stack(environments_dir, "networking", NETWORKING_PROGRAM, org="organization")
+    env = {"PULUMI_CONFIG_PASSPHRASE": "", "PULUMI_HOME": str(tmp_path / "home")}
+    runner = orchestrator.AutomationRunner(backend_url=f"file://{state}", env=env)
+    stacks = orchestrator.discover(str(environments_dir))
+
+    for _ in range(2):
+        # The second time root was deployed before and skips its bootstrap pass
+        results = orchestrator.Orchestrator(
+            stacks, runner=runner, output=io.StringIO()
+        ).run("up")
+        assert {name: r.status for name, r in results.items()} == {
+            "root:bootstrap": "succeeded",
+            "networking": "succeeded",
+            "root": "succeeded",
+        }
+
+    root = auto.select_stack(
+        stacks["root"].qualified_name,
+        work_dir=str(environments_dir / "root"),
+        opts=auto.LocalWorkspaceOptions(
+            env_vars={**env, "PULUMI_BACKEND_URL": f"file://{state}"}
+        ),
+    )
+    assert root.outputs()["transit_gateway_id"].value == "tgw-test"
+    # The bootstrap config is not left behind in the stack file
+    assert (environments_dir / "root" / "Pulumi.root.yaml").read_text() == (
+        f"config:\n  leviathan:org: organization\n{root_config}"
+    )
@@ -0,0 +1,201 @@
+import json
+import pulumi
+import pytest
+from pulumi.runtime.sync_await import _sync_await
+from leviathan import policy
+
+BUCKET = "arn:aws:s3:::flow-logs"
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    cache = policy.PolicyCache()
+    monkeypatch.setattr(policy, "_default_cache", cache)
+    return cache
+
+
+def value(document):
+    # Documents with Outputs are Outputs themselves
+    if isinstance(document, pulumi.Output):
+        return _sync_await(document.future())
+    return document
+
+
+def test_canonical_minified_document():
+    document = policy.document(
+        policy.allow(
+            ["s3:PutObject", "s3:GetBucketAcl", "s3:PutObject"],
+            [f"{BUCKET}/*", BUCKET],
+            principals=[policy.service("delivery.logs.amazonaws.com")],
+            conditions=[
+                policy.condition("StringEquals", "aws:SourceAccount", "111"),
+                policy.condition("ArnLike", "aws:SourceArn", "arn:b", "arn:a"),
+            ],
+            sid="Delivery",
+        ),
+        policy.deny(["s3:*"]),
+        kind="bucket",
+    )
+
+    assert document == (
+        '{"Version":"2012-10-17","Statement":['
+        '{"Sid":"Delivery","Effect":"Allow",'
+        '"Principal":{"Service":"delivery.logs.amazonaws.com"},'
+        '"Action":["s3:GetBucketAcl","s3:PutObject"],'
+        '"Resource":["arn:aws:s3:::flow-logs","arn:aws:s3:::flow-logs/*"],'
+        '"Condition":{"ArnLike":{"aws:SourceArn":["arn:a","arn:b"]},'
+        '"StringEquals":{"aws:SourceAccount":"111"}}},'
+        '{"Effect":"Deny","Action":"s3:*"}]}'
+    )
+
+
+def test_any_principal_and_not_actions():
+    document = json.loads(
+        policy.document(
+            policy.Statement(
+                not_actions=("iam:*",),
+                not_resources=("arn:aws:iam::*:role/admin",),
+                principals=(policy.Principal("*", ("*",)),),
+                effect="Deny",
+            )
+        )
+    )
+
+    assert document["Statement"] == [
+        {
+            "Effect": "Deny",
+            "Principal": "*",
+            "NotAction": "iam:*",
+            "NotResource": "arn:aws:iam::*:role/admin",
+        }
+    ]
+
+
+def test_identical_documents_render_once(cache):
+    statement = policy.allow(["sts:AssumeRole"], principals=[policy.service("ec2")])
+
+    first = policy.document(statement, kind="trust")
+    second = policy.document(statement, kind="trust")
+    policy.document(statement, kind="inline")
+
+    assert first is second
+    assert cache.stats() == {"documents": 2, "hits": 1, "misses": 2}
+
+
+@pytest.mark.parametrize("kind", sorted(policy.SIZE_LIMITS))
+def test_size_limit_per_kind(kind):
+    limit = policy.SIZE_LIMITS[kind]
+    # A single resource padded until the document is exactly at the limit
+    base = len(policy.document(policy.allow(["s3:GetObject"], [""]), kind=kind))
+    resource = "x" * (limit - base)
+
+    document = policy.document(policy.allow(["s3:GetObject"], [resource]), kind=kind)
+    assert len(document) == limit
+    with pytest.raises(
+        policy.PolicyError, match=f"{kind} policy is {limit + 1} characters"
+    ):
+        policy.document(policy.allow(["s3:GetObject"], [resource + "x"]), kind=kind)
+
+
+def test_unknown_kind():
+    with pytest.raises(policy.PolicyError, match="unknown policy kind resource"):
+        policy.document(policy.allow(["s3:GetObject"]), kind="resource")
+
+
+def test_empty_document():
+    with pytest.raises(policy.PolicyError, match="at least one statement"):
+        policy.document()
+
+
+def test_duplicate_sids():
+    with pytest.raises(policy.PolicyError, match="duplicate statement ids"):
+        policy.document(
+            policy.allow(["s3:GetObject"], sid="Read"),
+            policy.allow(["s3:PutObject"], sid="Read"),
+        )
+
+
+def test_duplicate_statements():
+    statement = policy.allow(["s3:GetObject"], [BUCKET])
+
+    with pytest.raises(policy.PolicyError, match="duplicate statements"):
+        policy.document(statement, statement)
+
+
+def test_duplicate_statements_once_normalized():
+    # Different tuples, the same statement once sorted and deduplicated
+    with pytest.raises(policy.PolicyError, match="duplicate statements"):
+        policy.document(
+            policy.allow(["s3:GetObject", "s3:PutObject"], [BUCKET]),
+            policy.allow(["s3:PutObject", "s3:GetObject", "s3:GetObject"], [BUCKET]),
+        )
+
+
+@pytest.mark.parametrize(
+    "statement, message",
+    [
+        (policy.allow(["s3:GetObject"])._replace(effect="Maybe"), "effect must be"),
+        (policy.Statement(), "either actions or not_actions"),
+        (
+            policy.Statement(actions=("s3:*",), not_actions=("iam:*",)),
+            "either actions or not_actions",
+        ),
+        (
+            policy.Statement(actions=("s3:*",), resources=("a",), not_resources=("b",)),
+            "either resources or not_resources",
+        ),
+        (policy.allow(["GetObject"]), "action GetObject is not <service>:<action>"),
+        (
+            policy.Statement(not_actions=("s3",)),
+            "action s3 is not <service>:<action>",
+        ),
+    ],
+)
+def test_invalid_statements(statement, message):
+    with pytest.raises(policy.PolicyError, match=message):
+        policy.document(statement)
+
+
+def test_wildcard_action_is_accepted():
+    assert json.loads(policy.document(policy.allow(["*"])))["Statement"] == [
+        {"Effect": "Allow", "Action": "*"}
+    ]
+
+
+def test_outputs_are_filled_in_once_known():
+    bucket = pulumi.Output.from_input(BUCKET)
+    organization = pulumi.Output.from_input("o-abc")
+
+    document = policy.document(
+        policy.allow(
+            ["s3:PutObject"],
+            [bucket, "arn:aws:s3:::other"],
+            principals=[policy.Principal("AWS", ("*",))],
+            conditions=[
+                policy.condition("StringEquals", "aws:PrincipalOrgID", organization)
+            ],
+        ),
+        kind="bucket",
+    )
+
+    assert isinstance(document, pulumi.Output)
+    assert json.loads(value(document))["Statement"] == [
+        {
+            "Effect": "Allow",
+            "Principal": {"AWS": "*"},
+            "Action": "s3:PutObject",
+            "Resource": [BUCKET, "arn:aws:s3:::other"],
+            "Condition": {"StringEquals": {"aws:PrincipalOrgID": "o-abc"}},
+        }
+    ]
+
+
+def test_outputs_are_checked_once_known():
+    # Two statements that only turn out to be the same once the ARN is known
+    document = policy.document(
+        policy.allow(["s3:GetObject"], [pulumi.Output.from_input(BUCKET)]),
+        policy.allow(["s3:GetObject"], [BUCKET]),
+    )
+
+    with pytest.raises(policy.PolicyError, match="duplicate statements"):
+        value(document)
@@ -0,0 +1,145 @@
+import pulumi
+import pytest
+from pulumi.runtime.mocks import MockMonitor
+from pulumi.runtime.proto import resource_pb2
+from leviathan import invoke_cache, ipam, stack_refs
+
+AVAILABILITY_ZONES = ["eu-central-1a", "eu-central-1b"]
+PROPAGATION = "aws:ec2transitgateway/routeTablePropagation:RouteTablePropagation"
+ROUTE = "aws:ec2/route:Route"
+
+
+NETWORKING = {
+    "vpc_info": {"schema_version": 1, "cidr_block": "10.100.0.0/16"},
+    "routing": {
+        "schema_version": 1,
+        "transit_gateway_id": "tgw-hub",
+        "transit_gateway_owner_id": "111111111111",
+        "transit_gateway_attachment_id": "tgw-attach-hub",
+        "environments_prefix_list_id": "pl-environments",
+    },
+}
+
+
+class Mocks(pulumi.runtime.Mocks):
+    def __init__(self):
+        self.resources = []
+
+    def new_resource(self, args: pulumi.runtime.MockResourceArgs):
+        self.resources.append((args.typ, args.name, args.inputs))
+        if args.typ == "pulumi:pulumi:StackReference":
+            return [f"{args.name}-id", {"outputs": NETWORKING}]
+        return [f"{args.name}-id", dict(args.inputs)]
+
+    def call(self, args: pulumi.runtime.MockCallArgs):
+        if args.token == "aws:index/getAvailabilityZones:getAvailabilityZones":
+            return {"names": AVAILABILITY_ZONES}
+        return {}
+
+    def of_type(self, typ):
+        return {name: inputs for t, name, inputs in self.resources if t == typ}
+
+
+class Monitor(MockMonitor):
+    # Resources passed as inputs are sent as plain ids, see benchmarks/construction.py
+    def GetDeploymentInfo(self, request):
+        info = super().GetDeploymentInfo(request)
+        return resource_pb2.DeploymentInfo(
+            supportedFeatures=[
+                f
+                for f in info.supportedFeatures
+                if f != resource_pb2.RESOURCE_MONITOR_FEATURE_RESOURCE_REFERENCES
+            ]
+        )
+
+    def SupportsFeature(self, request):
+        if request.id == "resourceReferences":
+            return type("SupportsFeatureResponse", (), {"hasSupport": False})
+        return super().SupportsFeature(request)
+
+
+@pytest.fixture
+def spoke(tmp_path, monkeypatch):
+    # A spoke of the root stack in preview with the given config
+    def construct(**config):
+        for module, name in (
+            (stack_refs, "_default_refs"),
+            (ipam, "_default_ipam"),
+            (invoke_cache, "_default_cache"),
+        ):
+            monkeypatch.setattr(module, name, None)
+        mocks = Mocks()
+        pulumi.runtime.set_mocks(
+            mocks,
+            monitor=Monitor(mocks),
+            project="leviathan",
+            stack="root",
+            preview=True,
+        )
+        pulumi.runtime.set_all_config(
+            {
+                "aws:region": "eu-central-1",
+                "leviathan:org": "acme",
+                "leviathan:invoke_cache": "false",
+                "leviathan:ipam_allocations": str(tmp_path / "allocations.json"),
+                **{f"leviathan:{k}": v for k, v in config.items()},
+            }
+        )
+
+        @pulumi.runtime.test
+        def run():
+            # Imported once the mocks are in place, like the programs
+            from leviathan.routing import Routing
+            from leviathan.vpc import Vpc
+
+            provider = pulumi.ResourceOptions(
+                providers={"aws": pulumi.ProviderResource("aws", "dev")}
+            )
+            vpc = Vpc("dev", ipam.default().vpc_cidr("dev"), provider, flow_logs=False)
+            Routing(
+                vpc,
+                provider,
+                hub_provider=pulumi.ProviderResource("aws", "dev-hub"),
+            )
+
+        run()
+        return mocks
+
+    return construct
+
+
+def test_route_domain_propagates_every_vpn_attachment(spoke):
+    mocks = spoke(
+        tgw_route_domains="true",
+        vpn_attachment_ids='["tgw-attach-vpn-0", "tgw-attach-vpn-1"]',
+        onprem_prefix_list_id="pl-onprem",
+    )
+
+    propagations = mocks.of_type(PROPAGATION)
+    assert sorted(propagations) == [
+        "dev-tgw-hub-propagation",
+        "dev-tgw-vpn-propagation-0",
+        "dev-tgw-vpn-propagation-1",
+    ]
+    assert propagations["dev-tgw-vpn-propagation-1"]["transitGatewayAttachmentId"] == (
+        "tgw-attach-vpn-1"
+    )
+    assert mocks.of_type(ROUTE)["dev-onprem-route"]["destinationPrefixListId"] == (
+        "pl-onprem"
+    )
+
+
+def test_onprem_route_without_route_domains(spoke):
+    mocks = spoke(
+        vpn_attachment_ids='["tgw-attach-vpn-0"]', onprem_prefix_list_id="pl-onprem"
+    )
+
+    assert mocks.of_type(PROPAGATION) == {}
+    assert "dev-onprem-route" in mocks.of_type(ROUTE)
+
+
+def test_nothing_towards_onprem_without_a_vpn(spoke):
+    mocks = spoke(tgw_route_domains="true")
+
+    assert sorted(mocks.of_type(PROPAGATION)) == ["dev-tgw-hub-propagation"]
+    assert "dev-onprem-route" not in mocks.of_type(ROUTE)